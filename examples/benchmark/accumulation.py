@@ -0,0 +1,110 @@
+"""
+Compare 'push' (atomic_add per synapse) and 'pull' (per post-neuron sum)
+accumulation of spikes in tick_synapses.
+
+Usage:
+    python accumulation.py --size 200 --radius 4 --noise 3000
+
+Push does work only for synapses of the spiked neurons, but the atomics
+serialise on post-neurons with high fan-in. Pull reads all synapses of every
+neuron each tick without atomics. So pull wins on large radius (fan-in is
+(2r - 1)^2 synapses per post-neuron) and high firing rates, push - on sparse
+activity.
+"""
+import argparse
+from time import time
+import numpy as np
+from openre import OpenRE
+from openre.data_types import types
+
+
+def create_config(args, accumulation, synapses_index):
+    return {
+        'synapse': {
+            'max_level': 30000,
+        },
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 30000,
+                'relaxation': 1000,
+                'width': args.size,
+                'height': args.size,
+                'connect': [{'name': 'V2', 'radius': args.radius}],
+            },
+            {
+                'name': 'V2',
+                'threshold': 30000,
+                'relaxation': 1000,
+                'width': args.size,
+                'height': args.size,
+            },
+        ],
+        'domains': [
+            {
+                'name': 'D1',
+                'device': {
+                    'type': 'OpenCL',
+                    'platform': args.platform,
+                    'device': args.device,
+                },
+                'accumulation': accumulation,
+                'synapses_index': synapses_index,
+                'layers': [{'name': 'V1'}, {'name': 'V2'}],
+            },
+        ],
+    }
+
+
+def run(args, accumulation, synapses_index):
+    ore = OpenRE(create_config(args, accumulation, synapses_index))
+    ore.deploy()
+    domain = ore.domains[0]
+    rnd = np.random.RandomState(1)
+    spent = 0
+    spikes = 0
+    for tick in xrange(args.warmup + args.ticks):
+        # random input, not included in time
+        domain.neurons.level.from_device(domain.device)
+        domain.neurons.level.data += rnd.randint(
+            0, args.noise, len(domain.neurons)).astype(types.neuron_level)
+        domain.neurons.level.to_device(domain.device)
+        start = time()
+        ore.tick()
+        domain.device.sync()
+        if tick < args.warmup:
+            continue
+        spent += time() - start
+        domain.neurons.spike_tick.from_device(domain.device)
+        spikes += np.count_nonzero(
+            domain.neurons.spike_tick.data == domain.ticks)
+    return {
+        'synapses': len(domain.synapses),
+        'rate': float(spikes) / len(domain.neurons) / args.ticks,
+        'ticks_per_sec': args.ticks / spent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', type=int, default=100,
+                        help='width and height of the layers')
+    parser.add_argument('--radius', type=int, default=4,
+                        help='connection radius (fan-in is (2r - 1)^2)')
+    parser.add_argument('--noise', type=int, default=3000,
+                        help='max random input per tick (firing rate)')
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5,
+                        help='ticks before measurement')
+    parser.add_argument('--platform', type=int, default=0)
+    parser.add_argument('--device', type=int, default=0)
+    args = parser.parse_args()
+    for synapses_index in ['list', 'csr']:
+        for accumulation in ['push', 'pull']:
+            res = run(args, accumulation, synapses_index)
+            print '%s/%s: %s synapses, firing rate %.2f%%, %.1f ticks/sec' % (
+                synapses_index, accumulation, res['synapses'],
+                res['rate'] * 100, res['ticks_per_sec'])
+
+if __name__ == '__main__':
+    main()
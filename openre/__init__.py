@@ -4,7 +4,7 @@ from time import time
 import logging
 from types import GeneratorType
 from openre.data_types import types
-from openre.domain import create_domain_factory
+from openre.domain import create_domain_factory, Domain
 import os.path
 from openre.helpers import set_default, rate_limited
 from openre.config import Config
@@ -135,12 +135,70 @@ class OpenRE(object):
 
     def tick(self):
         """
-        Один шаг моделирования.
+        Один шаг моделирования. Возвращает False, если шаг не выполнен (пауза,
+        остановка или один из локальных доменов ждет удаленные домены).
         """
         if self.is_pause or self.is_stop:
-            return
+            return False
+        if self.is_lagging():
+            return False
         for domain in self.domains:
             domain.tick()
+        return True
+
+    def is_lagging(self):
+        """
+        True, если какой либо из локальных доменов обгонит удаленные домены
+        больше чем на max_lag тиков (см. domain.is_lagging()). Локальные
+        домены тикают одновременно, поэтому в этом случае ждут все.
+        """
+        for domain in self.domains:
+            if isinstance(domain, Domain) and domain.is_lagging():
+                domain.stat_inc('lag_waits')
+                return True
+        return False
+
+    def run_ticks(self, ticks):
+        """
+        ticks шагов моделирования. Самодостаточные домены (см.
+        domain.is_self_contained()) выполняют все шаги на устройстве подряд,
+        остальные домены работают как в self.tick(). Если какой-либо
+        локальный домен ждет удаленные домены (max_lag), то вместе с ним ждут
+        и самодостаточные домены.
+        Возвращает количество выполненных шагов остальных доменов (все ticks,
+        если таких доменов нет). Оно меньше ticks, если был пропущен шаг
+        из-за паузы, остановки или ожидания удаленных доменов - спайки от них
+        приходят только между вызовами, поэтому пропущенные шаги не
+        повторяются.
+        """
+        if self.is_pause or self.is_stop:
+            return 0
+        if self.config.get('rate_limit'):
+            executed = 0
+            for _ in xrange(ticks):
+                if self.tick():
+                    executed += 1
+            return executed
+        has_lag = any(isinstance(domain, Domain) and domain.lag_sources()
+                      for domain in self.domains)
+        domains = []
+        for domain in self.domains:
+            if not has_lag and domain.is_self_contained():
+                domain.run_ticks(ticks)
+            else:
+                domains.append(domain)
+        if not domains:
+            return ticks
+        executed = 0
+        for _ in xrange(ticks):
+            if self.is_pause or self.is_stop:
+                break
+            if self.is_lagging():
+                continue
+            for domain in domains:
+                domain.tick()
+            executed += 1
+        return executed
 
     def run(self):
         """
@@ -246,7 +304,7 @@ def test_openre():
     from openre.neurons import IS_INHIBITORY, IS_TRANSMITTER, IS_RECEIVER
     from openre.data_types import null
     from openre.device import Dummy
-    from openre.domain import create_domain_factory
+    from openre.domain import create_domain_factory, Domain
     from pytest import raises
     synapse_max_level = 30000
     config = {
@@ -501,3 +559,252 @@ def test_openre():
             assert layer.neurons_metadata
         domain.tick()
         assert domain.ticks == 1
+
+def test_run_ticks():
+    import numpy as np
+    from openre import neurons
+    config = {
+        'synapse': {
+            'max_level': 30000,
+        },
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 20000,
+                'relaxation': 100,
+                'width': 20,
+                'height': 20,
+                'connect': [{'name': 'V2', 'radius': 2}],
+            },
+            {
+                'name': 'V2',
+                'threshold': 20000,
+                'relaxation': 100,
+                'width': 20,
+                'height': 20,
+                'connect': [{'name': 'V1', 'radius': 2}],
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'stat_size': 7,
+                'device': {'type': 'NumPy'},
+                'layers'    : [{'name': 'V1'}, {'name': 'V2'}],
+            },
+        ],
+    }
+    result = []
+    for use_run_ticks in [False, True]:
+        neurons.random.seed(1)
+        np.random.seed(1)
+        ore = OpenRE(config)
+        ore.deploy()
+        domain = ore.domains[0]
+        assert domain.is_self_contained()
+        domain.neurons.level.data[::3] = 25000
+        domain.neurons.level.to_device(domain.device)
+        if use_run_ticks:
+            ore.run_ticks(30)
+        else:
+            for _ in xrange(30):
+                ore.tick()
+        assert domain.ticks == 30
+        assert domain.stat('ticks') == 30
+        domain.neurons.from_device(domain.device)
+        domain.synapses.from_device(domain.device)
+        result.append(domain)
+    assert result[0].stat('total_spikes')
+    for vector_name in ['neurons', 'synapses']:
+        for field, _ in getattr(result[0], vector_name).fields:
+            assert np.array_equal(
+                getattr(getattr(result[0], vector_name), field).data,
+                getattr(getattr(result[1], vector_name), field).data)
+    assert np.array_equal(result[0].stat_vector.data,
+                          result[1].stat_vector.data)
+
+def test_pipeline():
+    import numpy as np
+    from openre import neurons
+    config = {
+        'synapse': {
+            'max_level': 30000,
+        },
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 20000,
+                'relaxation': 100,
+                'width': 20,
+                'height': 20,
+                'connect': [{'name': 'V1', 'radius': 2},
+                            {'name': 'V2', 'radius': 2}],
+            },
+            {
+                'name': 'V2',
+                'threshold': 20000,
+                'relaxation': 100,
+                'width': 20,
+                'height': 20,
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'layers'    : [{'name': 'V1'}],
+            },
+            {
+                'name'        : 'D2',
+                'layers'    : [{'name': 'V2'}],
+            },
+        ],
+    }
+    for device_type in ['NumPy', 'OpenCL']:
+        result = []
+        for pipeline in [False, True]:
+            neurons.random.seed(1)
+            np.random.seed(1)
+            for domain_config in config['domains']:
+                domain_config['device'] = {'type': device_type}
+            config['domains'][0]['pipeline'] = pipeline
+            ore = OpenRE(config)
+            ore.deploy()
+            d1, d2 = ore.domains
+            sent = []
+            d2.register_spikes = lambda spikes: sent.append(list(spikes))
+            d1.neurons.level.data[::3] = 25000
+            d1.neurons.level.to_device(d1.device)
+            for _ in xrange(20):
+                ore.tick()
+            d1.wait_spikes()
+            assert (d1.sender is not None) == pipeline
+            ore.clean()
+            assert d1.sender is None
+            result.append(sent)
+        assert len(result[0]) > 1
+        assert result[0] == result[1]
+
+def test_pipeline_sender_delay():
+    import numpy as np
+    import time
+    from openre import neurons
+    from openre.domain.sender import Sender
+    config = {
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 20000,
+                'relaxation': 100,
+                'width': 10,
+                'height': 10,
+                'connect': [{'name': 'V1', 'radius': 2},
+                            {'name': 'V2', 'radius': 2}],
+            },
+            {
+                'name': 'V2',
+                'threshold': 20000,
+                'relaxation': 100,
+                'width': 10,
+                'height': 10,
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'device'    : {'type': 'NumPy'},
+                'layers'    : [{'name': 'V1'}],
+            },
+            {
+                'name'        : 'D2',
+                'device'    : {'type': 'NumPy'},
+                'layers'    : [{'name': 'V2'}],
+            },
+        ],
+    }
+    result = []
+    for pipeline, delay in [(False, 0), (True, 0), (True, 0.02)]:
+        neurons.random.seed(1)
+        np.random.seed(1)
+        config['domains'][0]['pipeline'] = pipeline
+        ore = OpenRE(config)
+        ore.deploy()
+        d1, d2 = ore.domains
+        if pipeline:
+            # slow background thread
+            d1.sender = Sender()
+            send = d1.sender.send
+            def delayed_send(task, release=None):
+                def delayed_task():
+                    time.sleep(delay)
+                    task()
+                return send(delayed_task, release)
+            d1.sender.send = delayed_send
+        d1.neurons.level.data[::3] = 25000
+        d1.neurons.level.to_device(d1.device)
+        for _ in xrange(10):
+            ore.tick()
+        d1.wait_spikes()
+        d2.neurons.from_device(d2.device)
+        result.append(list(d2.neurons.level.data))
+        ore.clean()
+    assert any(result[0])
+    # local domains get spikes in the same tick regardless of the sender
+    assert result[0] == result[1] == result[2]
+
+def test_pipeline_error():
+    from pytest import raises
+    from openre.domain import RemoteDomainDummy
+    config = {
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 20000,
+                'width': 20,
+                'height': 20,
+                'connect': [{'name': 'V2', 'radius': 2}],
+            },
+            {
+                'name': 'V2',
+                'threshold': 20000,
+                'width': 20,
+                'height': 20,
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'device'    : {'type': 'OpenCL'},
+                'pipeline'    : True,
+                'layers'    : [{'name': 'V1'}],
+            },
+            {
+                'name'        : 'D2',
+                'device'    : {'type': 'OpenCL'},
+                'layers'    : [{'name': 'V2'}],
+            },
+        ],
+    }
+    ore = OpenRE(config)
+    ore.deploy()
+    d1 = ore.domains[0]
+    # D2 is in other process - spikes are downloaded in the background
+    ore.domains[1] = RemoteDomainDummy()
+    sent = []
+    def fan_out_spikes(spiked, ticks, is_local=None):
+        sent.append(ticks)
+        if len(sent) == 1:
+            raise ValueError('test')
+    d1.fan_out_spikes = fan_out_spikes
+    ore.tick()
+    # the error is set in the sender
+    d1.sender.queue.join()
+    with raises(ValueError):
+        ore.tick()
+    # transmitter buffers of the failed and not sent ticks are free, so
+    # next ticks don't wait for them forever
+    ore.tick()
+    ore.tick()
+    d1.wait_spikes()
+    assert len(sent) == 3
+    assert all(is_free.is_set() for is_free in d1.device._transmitter_free)
+    ore.clean()
@@ -32,7 +32,7 @@ class Agent(AgentBase):
         while True:
             socks = dict(self.poller.poll())
             if socks.get(self.frontend) == zmq.POLLIN:
-                message = self.frontend.recv_multipart()
+                message = self.frontend.recv_multipart(copy=False)
                 logging.debug('Frontend receive message: %s', message)
                 if len(message) < 3:
                     logging.warn('Invalid message from frontend: %s', message)
@@ -41,10 +41,10 @@ class Agent(AgentBase):
                 rep_identity = message[2]
                 message[0] = rep_identity
                 message[2] = req_identity
-                self.backend.send_multipart(message)
+                self.backend.send_multipart(message, copy=False)
                 logging.debug('And send to backend: %s', message)
             if socks.get(self.backend) == zmq.POLLIN:
-                message = self.backend.recv_multipart()
+                message = self.backend.recv_multipart(copy=False)
                 logging.debug('Backend receive message: %s', message)
                 if len(message) < 3:
                     logging.warn('Invalid message from backend: %s', message)
@@ -53,7 +53,7 @@ class Agent(AgentBase):
                 req_identity = message[2]
                 message[0] = req_identity
                 message[2] = rep_identity
-                self.frontend.send_multipart(message)
+                self.frontend.send_multipart(message, copy=False)
                 logging.debug('And send to frontend: %s', message)
 
     def clean(self):
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Оценка размера сети до deploy
+"""
+from openre.agent.decorators import action
+import logging
+from openre.config import Config
+from openre.domain.plan import plan_net
+
+
+@action(namespace='client')
+def plan(agent):
+    """
+    Количество нейронов, синапсов и примерный объем памяти для каждого домена
+    сети и для всей сети (см. openre.domain.plan.plan_net)
+    """
+    logging.debug('Plan net')
+    config = agent.net_config
+    if not config:
+        raise ValueError('No net config')
+    ret = plan_net(Config(config))
+    for name, domain_plan in sorted(ret['domains'].items()):
+        logging.info(
+            'Domain %s: %s neurons, %s receiver neurons, %s%s synapses, '
+            '%s bytes', name, domain_plan['neurons'],
+            domain_plan['receiver_neurons'],
+            '' if domain_plan['exact'] else '<= ',
+            domain_plan['synapses'], domain_plan['bytes'])
+    return ret
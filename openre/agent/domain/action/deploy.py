@@ -7,15 +7,19 @@ from openre.agent.decorators import action
 from openre.agent.domain.decorators import state
 from openre.domain import create_domain_factory
 from openre.domain.packets import TransmitterVector, TransmitterMetadata, \
-        ReceiverVector, ReceiverMetadata, SpikesVector, SpikesMetadata
+        ReceiverVector, ReceiverMetadata, encode_spikes
 from openre.domain.remote import RemoteDomainBase
 from openre.agent.helpers import RPCBrokerProxy
 import types
 import time
+import threading
+import numpy as np
 from openre.vector import StandaloneVector
+from openre.data_types import types as data_types
 
 
 def remote_domain_factory(agent):
+    pub_lock = threading.Lock()
     class RemoteDomain(RemoteDomainBase):
         """
         Прокси к удаленному домену.
@@ -52,10 +56,8 @@ def remote_domain_factory(agent):
             self.receiver_metadata = ReceiverMetadata(0)
             self.receiver_vector.add(self.receiver_metadata)
 
-            self.spikes_pos = -1
-            self.spikes_vector = SpikesVector()
-            self.spikes_metadata = SpikesMetadata(0)
-            self.spikes_vector.add(self.spikes_metadata)
+            # массивы receiver_neuron_index, накопленные за тик
+            self.spikes = []
 
         def send_synapse(self,
             pre_domain_index, pre_layer_index, pre_neuron_address,
@@ -133,27 +135,45 @@ def remote_domain_factory(agent):
             Накапливаем информацию о спайках что бы переслать в другой домен с
             помощью self.register_spike_pack
             """
-            self.spikes_pos += 1
-            pos = self.spikes_pos
-            self.spikes_metadata.receiver_neuron_index[pos] \
-                    = receiver_neuron_index
+            self.register_spikes([receiver_neuron_index])
 
-        def register_spike_pack(self, bytes=None):
+        def register_spikes(self, receiver_neuron_index):
             """
-            Посылаем данные о спайках в удаленный домен
+            Накапливаем массив спайков что бы переслать в другой домен с
+            помощью self.register_spike_pack
             """
-            if self.spikes_pos == -1:
-                return
-            self.spikes_vector.shrink()
-            pack_length = len(self.spikes_vector)
-            pack = self.spikes_vector.receiver_neuron_index.bytes()
-            self.spikes_metadata.resize(length=0)
-            self.spikes_pos = -1
-            if self.pub_data('S', pack):
-                local = agent.context['local_domain']
+            self.spikes.append(np.asarray(receiver_neuron_index,
+                                          dtype=data_types.address))
+
+        def register_spike_pack(self, bytes=None, tick=None):
+            """
+            Посылаем данные о спайках в удаленный домен. tick - тик
+            локального домена, в котором случились спайки.
+            """
+            local = agent.context['local_domain']
+            if tick is None:
+                tick = local.ticks
+            if not self.spikes:
+                # heartbeat: remote domain waits for our tick (max_lag)
+                if self.max_lag(local.name) is None \
+                   or self.index not in local.transmitter_index.fan_out():
+                    return
+                self.spikes.append(np.zeros(0, dtype=data_types.address))
+            spikes = np.hstack(self.spikes)
+            self.spikes = []
+            pack_length = len(spikes)
+            pack, encoding = encode_spikes(
+                spikes, self.config.get('spikes_zlib', 0))
+            if self.pub_data('S', pack, str(local.index), str(tick)):
                 local.stat_inc('spikes_sent', pack_length)
                 local.stat_inc('spikes_packets_sent')
                 local.stat_inc(['spikes_sent_to', self.name], pack_length)
+                local.stat_inc('spikes_bytes_sent', len(pack))
+                local.stat_inc(['spikes_encoding', encoding])
+                if local.stat('spikes_sent'):
+                    local.stat_set('spikes_bytes_per_spike',
+                                   float(local.stat('spikes_bytes_sent'))
+                                   / local.stat('spikes_sent'))
 
         def subscribe(self):
             """
@@ -162,31 +182,53 @@ def remote_domain_factory(agent):
             if self.is_subscribed:
                 return True
             if time.time() > self.subscribe_next_try:
+                local = agent.context['local_domain']
+                # None - remote domain will connect to our proxy
+                endpoint = agent.pub_endpoint(local.config)
                 self.broker.subscribe.inc_priority \
-                        .no_reply(agent.context['local_domain'].index)
+                        .no_reply(local.index, endpoint)
                 self.subscribe_next_try = time.time() + 1
             return False
 
+        def prepare_spike_pack(self):
+            """
+            Subscribe from the main thread: broker socket is used by the main
+            thread and zmq sockets are not thread safe
+            """
+            self.subscribe()
+
         def pub_data(self, *args):
             """
-            Pub data for remote domain, where self domain is local
+            Pub data for remote domain, where self domain is local. Can be
+            called from the background sender thread, so only checks
+            subscription (see prepare_spike_pack).
             """
-            # ask base domain to subscribe this domain
-            if not self.subscribe():
-                return False
-            # a few messages at the begining will be discarded because we
-            # asynchronously ask to subscribe
-            params = [self.config['id'].bytes]
-            params.extend(args)
-            agent.pub.send_multipart(params)
+            # spikes can be sent from the background sender thread
+            # (config['pipeline']) - zmq sockets are not thread safe
+            with pub_lock:
+                if not self.is_subscribed:
+                    return False
+                # a few messages at the begining will be discarded because we
+                # asynchronously ask to subscribe
+                params = [self.config['id'].bytes]
+                params.extend(args)
+                pub = agent.direct_pub
+                if pub is None:
+                    pub = agent.pub
+                pub.send_multipart(params, copy=False)
             return True
 
         def register_input_layer_data(self, layer_index, data):
             """
             Send data over network
             """
+            # ask base domain to subscribe this domain
+            if not self.subscribe():
+                return
             vector = StandaloneVector().set_data(data)
-            self.pub_data('NP', str(layer_index), vector.bytes())
+            local = agent.context['local_domain']
+            self.pub_data('NP', str(layer_index), vector.bytes(),
+                          str(local.index), str(local.ticks))
 
         def __getattr__(self, name):
             return getattr(self.transport, name)
@@ -3,13 +3,18 @@
 Get data from sub channel
 """
 from openre.agent.decorators import action
+from openre.vector import StandaloneVector
 
 
 @action(namespace='domain')
-def NP(agent, layer_index, packet):
+def NP(agent, layer_index, packet, source_index=None, tick=None):
     """
-    Process numpy data from network
+    Process numpy data from network (all arguments are zmq.Frame).
+    source_index and tick - source domain and its tick
     """
-    agent.context['local_domain'].stat_inc('receive_data')
-    agent.context['local_domain'].register_input_layer_data(
-        int(layer_index), packet)
+    local = agent.context['local_domain']
+    local.stat_inc('receive_data')
+    local.register_input_layer_data(
+        int(layer_index.bytes), StandaloneVector().from_bytes(packet).data)
+    if source_index is not None and tick is not None:
+        local.register_input_tick(source_index.bytes, tick.bytes)
@@ -6,10 +6,13 @@
 from openre.agent.decorators import action
 
 @action(namespace='domain')
-def subscribe(event, domain_index):
+def subscribe(event, domain_index, endpoint=None):
     """
     Просим этот домен подписаться на события из домена domain_index так
     как domain_index будет публиковать события для этого домена.
+    endpoint - адрес PUB сокета самого домена domain_index (если он
+    публикует данные напрямую, см. agent.pub_endpoint), иначе подключаемся
+    к proxy домена.
     Подписываемся только один раз на host:port, что бы не получать одно и то же
     сообщение дважды.
     """
@@ -25,16 +28,20 @@ def subscribe(event, domain_index):
     # find config by domain_index
     config = net.config['domains'][domain_index]
     if config:
-        host = config.get('proxy', {}) \
-                .get('host', config.get('server', {}).get('host', '127.0.0.1'))
-        port = config.get('proxy', {}).get('port', 8934)
-        origin = '%s:%s' % (host, port)
+        if endpoint:
+            origin = endpoint
+        else:
+            host = config.get('proxy', {}) \
+                    .get('host',
+                         config.get('server', {}).get('host', '127.0.0.1'))
+            port = config.get('proxy', {}).get('port', 8934)
+            origin = 'tcp://%s:%s' % (host, port)
         net.domains[domain_index].broker.subscribe_register.inc_priority \
                 .no_reply(agent.context['local_domain'].index)
         # prevent to connect to the same origin twice
         if agent.context['subscribed_to'].get(origin):
             return True
-        agent.sub.connect("tcp://%s:%s" % (host, port))
+        agent.sub.connect(origin)
         agent.context['subscribed_to'][domain_index] = 1
         agent.context['subscribed_to'][origin] = 1
         return True
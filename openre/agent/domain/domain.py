@@ -36,6 +36,10 @@ class Agent(AgentBase):
         self.sub = self.socket(zmq.SUB)
         self.sub.setsockopt(zmq.SUBSCRIBE, self.id.bytes)
 
+        # own PUB socket for direct data channels (see self.pub_endpoint)
+        self.direct_pub = None
+        self.direct_pub_endpoint = None
+
         self.poller = zmq.Poller()
         self.poller.register(self.backend, zmq.POLLIN)
         self.poller.register(self.sub, zmq.POLLIN)
@@ -104,7 +108,10 @@ class Agent(AgentBase):
                 socks = dict(self.poller.poll(poll_timeout))
                 if socks.get(self.backend) == zmq.POLLIN:
                     was_message = True
-                    message = self.backend.recv_multipart()
+                    # binary parts stay zmq.Frame (see Vector.from_bytes)
+                    message = self.backend.recv_multipart(copy=False)
+                    message = [frame.bytes for frame in message[:4]] \
+                            + message[4:]
                     if len(message) > 4:
                         logging.debug("in binary: %s", message[:4])
                     else:
@@ -158,19 +165,21 @@ class Agent(AgentBase):
 
                 if socks.get(self.sub) == zmq.POLLIN:
                     was_message = True
-                    message = self.sub.recv_multipart()
-                    agent_id = message[0]
-                    data_type = message[1]
+                    message = self.sub.recv_multipart(copy=False)
+                    agent_id = message[0].bytes
+                    data_type = message[1].bytes
                     data = message[2]
                     if self.id.bytes == agent_id and data_type == 'S':
+                        # source domain index and its tick
+                        source = [frame.bytes for frame in message[3:5]]
                         try:
-                            register_spike_pack_cache(bytes=data)
+                            register_spike_pack_cache(data, *source)
                         except TypeError:
                             if 'local_domain' in self.context:
                                 register_spike_pack_cache = \
                                     self.context['local_domain'] \
                                         .register_spike_pack
-                                register_spike_pack_cache(bytes=data)
+                                register_spike_pack_cache(data, *source)
                     elif self.id.bytes == agent_id:
                         do_action(data_type, 'domain', self, *message[2:])
                 # receive all messages, and only then process them
@@ -183,6 +192,40 @@ class Agent(AgentBase):
                 # if no events - then wait for new events without timeout
                 poll_timeout = event_pool.poll_timeout()
 
+    def pub_endpoint(self, config):
+        """
+        Если в конфиге локального домена есть config['pub'], то домен сам
+        публикует данные (спайки и NP) через свой PUB сокет, а подписчики
+        подключаются к нему напрямую, минуя proxy. Возвращает адрес, к
+        которому надо подключаться, или None.
+        config['pub']['host'] - где слушать (по умолчанию '*')
+        config['pub']['port'] - порт (по умолчанию случайный свободный)
+        config['pub']['public_host'] - хост для подключения подписчиков (по
+            умолчанию host или config['server']['host'])
+        """
+        pub_config = config.get('pub')
+        if pub_config is None:
+            return None
+        if self.direct_pub is None:
+            host = pub_config.get('host', '*')
+            socket = self.socket(zmq.PUB)
+            socket.set_hwm(1000)
+            port = pub_config.get('port')
+            if port:
+                socket.bind('tcp://%s:%s' % (host, port))
+            else:
+                port = socket.bind_to_random_port('tcp://%s' % host)
+            public_host = pub_config.get('public_host')
+            if not public_host:
+                public_host = host
+                if host == '*':
+                    public_host = config.get('server', {}) \
+                            .get('host', '127.0.0.1')
+            self.direct_pub = socket
+            self.direct_pub_endpoint = 'tcp://%s:%s' % (public_host, port)
+            logging.debug('Direct pub endpoint: %s', self.direct_pub_endpoint)
+        return self.direct_pub_endpoint
+
     def reply(self, address, data):
         reply = address + [self.to_json(data)]
         self.backend.send_multipart(reply)
@@ -196,6 +239,8 @@ class Agent(AgentBase):
         self.backend.close()
         self.pub.close()
         self.sub.close()
+        if self.direct_pub is not None:
+            self.direct_pub.close()
 
     def init_actions(self):
         """
@@ -414,7 +414,7 @@ class RPCBrokerProxyCall(object):
         packet = ['', message]
         if self._bytes:
             packet.extend(self._bytes)
-        self.proxy._socket.send_multipart(packet)
+        self.proxy._socket.send_multipart(packet, copy=False)
         ret = {'success': True, 'data': None}
         if not self._no_reply:
             ret = self.proxy._socket.recv_multipart()
@@ -611,7 +611,7 @@ class RPCBroker(object):
             packet = ['', self._address, message]
             if self._bytes:
                 packet.extend(self._bytes)
-            self._socket.send_multipart(packet)
+            self._socket.send_multipart(packet, copy=False)
             self._response_address = None
             self._bytes = None
             self._priority = 0
@@ -2,6 +2,7 @@
 """
 Интерфейс к различным устройствам, на которых будет моделироваться сеть.
 """
+import numpy as np
 
 class Device(object):
     """
@@ -29,12 +30,61 @@ class Device(object):
         """
         raise NotImplementedError
 
+    def transmitter_spikes(self, domain):
+        """
+        Номера спайкнувших в этом тике элементов domain.transmitter_index
+        (по возрастанию). Вызывается после tick_transmitter_index и sync().
+        """
+        index = domain.transmitter_index
+        index.is_spiked.from_device(self)
+        return np.flatnonzero(index.is_spiked.data)
+
     def tick_receiver_index(self, domain):
         """
         Передаем в устройство спайки для нейронов с флагом IS_RECEIVER
         """
         raise NotImplementedError
 
+    def transmitter_spikes_async(self, domain):
+        """
+        То же, что transmitter_spikes, но возвращает функцию без аргументов,
+        которую можно вызвать из другого потока (см. config['pipeline']
+        домена). Вызывается после tick_transmitter_index. Если у функции
+        есть атрибут release, то его нужно вызвать, если функция так и не
+        будет вызвана.
+        """
+        self.sync()
+        spiked = self.transmitter_spikes(domain)
+        return lambda: spiked
+
+    def tick_receiver_spikes(self, domain, spikes):
+        """
+        Передаем в устройство спайки для нейронов с флагом IS_RECEIVER.
+        spikes - уникальные номера элементов domain.receiver_index.
+        """
+        is_spiked = domain.receiver_index.is_spiked
+        is_spiked.data[spikes] = 1
+        is_spiked.to_device(self)
+        self.tick_receiver_index(domain)
+        is_spiked.data[spikes] = 0
+
+    def run_ticks(self, domain, ticks):
+        """
+        Выполняем ticks тиков домена подряд без обмена спайками с другими
+        доменами (см. domain.is_self_contained()).
+        """
+        for _ in xrange(ticks):
+            domain.ticks += 1
+            self.tick_neurons(domain)
+            self.tick_synapses(domain)
+
+    def sync(self):
+        """
+        Ждем завершения всех операций, поставленных в очередь устройства
+        (ядра и копирование данных с is_blocking=False)
+        """
+        pass
+
     def create(self, data):
         """
         Создает указатель на данные на устройстве для data
@@ -0,0 +1,734 @@
+# -*- coding: utf-8 -*-
+"""
+Векторизованное CPU устройство на numpy (без OpenCL)
+"""
+from openre.device.abstract import Device
+from openre.data_types import types
+from openre.vector import StandaloneVector
+from openre.neurons import IS_INHIBITORY, IS_SPIKED, IS_DEAD, IS_RECEIVER
+from openre.synapses import IS_STRENGTHENED
+from openre.index import SynapsesCSRIndex
+from openre.index.csr import csr_expand
+import numpy as np
+
+# inverted flags (the same as ~IS_SPIKED in the opencl kernels)
+NOT_SPIKED = types.neuron_flags(~IS_SPIKED & types.max(types.neuron_flags))
+NOT_STRENGTHENED = types.synapse_flags(
+    ~IS_STRENGTHENED & types.max(types.synapse_flags))
+
+
+class NumPy(Device):
+    """
+    Устройство, которое обсчитывает домен целыми массивами numpy. Семантика
+    повторяет ядра из templates/device/opencl.c, данные хранятся прямо в
+    vector.data, поэтому upload/download ничего не копируют.
+    """
+    def __init__(self, config):
+        super(NumPy, self).__init__(config)
+        self.config['threshold_inc'] = self.config.get('threshold_inc', 10)
+        self.config['threshold_dec'] = self.config.get('threshold_dec', 5)
+        self._source_cache = None
+
+    def tick_neurons(self, domain):
+        length = domain.neurons.length
+        if not length:
+            return
+        self.tick_layers_input_data(domain)
+        ticks = types.tick(domain.ticks)
+        layers = domain.layers_vector
+        neurons = domain.neurons
+        flags = neurons.flags.data
+        # remove spiked flag from all alive neurons
+        alive = (flags & IS_DEAD) == 0
+        flags[alive] &= NOT_SPIKED
+        # receivers and dead neurons are not processed
+        index = np.flatnonzero(alive & ((flags & IS_RECEIVER) == 0))
+        if len(index):
+            layer = neurons.layer.data[index]
+            level = neurons.level.data[index]
+            threshold = neurons.threshold.data[index]
+            vitality = neurons.vitality.data[index]
+            spike_tick = neurons.spike_tick.data[index]
+            n_flags = flags[index]
+            spike_cost = layers.spike_cost.data[layer]
+            max_vitality = layers.max_vitality.data[layer]
+            is_over = level >= threshold
+            is_spiked = is_over & (vitality > spike_cost)
+            # neurons vitality is exhausted so it dies
+            is_dead = is_over & ~is_spiked
+            is_relax = ~is_over & (level >= 0)
+
+            vitality[is_spiked] -= spike_cost[is_spiked]
+            n_flags[is_spiked] |= IS_SPIKED
+            level[is_spiked] -= threshold[is_spiked]
+            if self.config['threshold_inc']:
+                # higher threshold in case of high spikes rate
+                threshold_inc = self.config['threshold_inc']
+                tick_diff = ticks - spike_tick
+                is_inc = is_spiked & (tick_diff < threshold_inc) \
+                        & (threshold < types.max(types.threshold)
+                           - threshold_inc)
+                threshold[is_inc] += (
+                    threshold_inc - tick_diff[is_inc]).astype(types.threshold)
+            spike_tick[is_spiked] = ticks
+
+            n_flags[is_dead] |= IS_DEAD
+            vitality[is_dead] = max_vitality[is_dead]
+            level[is_dead] = 0
+
+            # just relax
+            level[is_relax] -= layers.relaxation.data[layer[is_relax]]
+            level[level < 0] = 0
+            if self.config['threshold_dec']:
+                threshold_dec = self.config['threshold_dec']
+                tick_diff = ticks - spike_tick
+                threshold[(tick_diff > 100) & (threshold > threshold_dec)] \
+                        -= threshold_dec
+            is_tired = vitality < max_vitality
+            vitality[is_tired] += 1
+
+            neurons.level.data[index] = level
+            neurons.threshold.data[index] = threshold
+            neurons.vitality.data[index] = vitality
+            neurons.spike_tick.data[index] = spike_tick
+            flags[index] = n_flags
+        self.tick_layers_output_data(domain)
+
+    def tick_synapses(self, domain):
+        length = domain.neurons.length
+        if not length:
+            return
+        if len(domain.synapses):
+            neurons = domain.neurons
+            flags = neurons.flags.data
+            spiked = (flags & (IS_SPIKED | IS_DEAD)) == IS_SPIKED
+            if spiked.any():
+                self._tick_post_synapses(domain, spiked)
+                self._tick_pre_synapses(domain, spiked)
+        # update stats once per domain.config['stat_size'] ticks
+        if domain.ticks % domain.config['stat_size'] == 0:
+            self.update_stat(domain)
+
+    def _spiked_synapses(self, index, neuron_address, spiked):
+        """
+        Адреса синапсов, у которых нейрон neuron_address (pre или post)
+        спайкнул. Для CSR индекса читаем только диапазоны спайкнувших
+        нейронов, иначе - проверяем все синапсы.
+        """
+        if isinstance(index, SynapsesCSRIndex):
+            return index.value.data[
+                csr_expand(index.offset.data, np.flatnonzero(spiked))]
+        return np.flatnonzero(spiked[neuron_address])
+
+    def _tick_post_synapses(self, domain, spiked):
+        """
+        Передаем сигнал от спайкнувших нейронов через их post-синапсы.
+        neuron ----------- synapse -o)---------- post-neuron
+        """
+        neurons = domain.neurons
+        synapses = domain.synapses
+        flags = neurons.flags.data
+        s_level = synapses.level.data
+        s_learn = synapses.learn.data
+        s_flags = synapses.flags.data
+        synapse_address = self._spiked_synapses(
+            domain.pre_synapse_index, synapses.pre.data, spiked)
+        # synapse is dead
+        synapse_address = synapse_address[s_level[synapse_address] != 0]
+        post = synapses.post.data[synapse_address]
+        # post-neuron is dead - kill synapse
+        is_dead = (flags[post] & IS_DEAD) != 0
+        s_level[synapse_address[is_dead]] = 0
+        synapse_address = synapse_address[~is_dead]
+        if not len(synapse_address):
+            return
+        post = post[~is_dead]
+        pre = synapses.pre.data[synapse_address]
+        # change post neuron level
+        learn_sum = (s_level[synapse_address].astype(np.int32)
+                     + s_learn[synapse_address]).astype(types.synapse_level) \
+                .astype(types.neuron_level)
+        learn_sum[learn_sum < 0] = 0
+        is_inhibitory = (flags[pre] & IS_INHIBITORY) != 0
+        learn_sum[is_inhibitory] = -learn_sum[is_inhibitory]
+        neurons.level.data += np.bincount(
+            post, weights=learn_sum, minlength=len(neurons.level.data)
+        ).astype(types.neuron_level)
+        # post-synapse learning (forget)
+        spike_tick = neurons.spike_tick.data
+        is_forget = spike_tick[pre] - spike_tick[post] \
+                < types.tick(domain.spike_forget_threshold)
+        synapse_address = synapse_address[is_forget]
+        if not len(synapse_address):
+            return
+        learn_threshold = domain.learn_threshold
+        learn = (s_learn[synapse_address].astype(np.int32)
+                 - domain.learn_rate).astype(types.synapse_level)
+        is_under = learn < -learn_threshold
+        is_strengthened = (s_flags[synapse_address] & IS_STRENGTHENED) != 0
+        # remove learned flag and once decrease synapse level
+        is_weaken = is_under & is_strengthened
+        weaken_address = synapse_address[is_weaken]
+        s_flags[weaken_address] &= NOT_STRENGTHENED
+        s_level[weaken_address] = (s_level[weaken_address].astype(np.int32)
+                                   - learn_threshold) \
+                .astype(types.synapse_level)
+        learn[is_weaken] = 0
+        learn[is_under & ~is_strengthened] = -learn_threshold
+        s_learn[synapse_address] = learn
+
+    def _tick_pre_synapses(self, domain, spiked):
+        """
+        Обучаем pre-синапсы спайкнувших нейронов.
+        pre-neuron ------ pre-synapse -o)---------- neuron
+        """
+        neurons = domain.neurons
+        synapses = domain.synapses
+        flags = neurons.flags.data
+        s_level = synapses.level.data
+        s_learn = synapses.learn.data
+        s_flags = synapses.flags.data
+        synapse_address = self._spiked_synapses(
+            domain.post_synapse_index, synapses.post.data, spiked)
+        # synapse is dead
+        synapse_address = synapse_address[s_level[synapse_address] != 0]
+        pre = synapses.pre.data[synapse_address]
+        # pre-neuron is dead - kill synapse
+        is_dead = (flags[pre] & IS_DEAD) != 0
+        s_level[synapse_address[is_dead]] = 0
+        synapse_address = synapse_address[~is_dead]
+        if not len(synapse_address):
+            return
+        pre = pre[~is_dead]
+        post = synapses.post.data[synapse_address]
+        # pre-synapse learning
+        spike_tick = neurons.spike_tick.data
+        is_learn = spike_tick[post] - spike_tick[pre] \
+                < types.tick(domain.spike_learn_threshold)
+        synapse_address = synapse_address[is_learn]
+        if not len(synapse_address):
+            return
+        learn_threshold = domain.learn_threshold
+        learn = (s_learn[synapse_address].astype(np.int32)
+                 + domain.learn_rate).astype(types.synapse_level)
+        is_over = learn > learn_threshold
+        is_strengthened = (s_flags[synapse_address] & IS_STRENGTHENED) != 0
+        # set learned flag and once increase synapse level
+        is_strengthen = is_over & ~is_strengthened
+        strengthen_address = synapse_address[is_strengthen]
+        s_flags[strengthen_address] |= IS_STRENGTHENED
+        s_level[strengthen_address] = (
+            s_level[strengthen_address].astype(np.int32) + learn_threshold) \
+                .astype(types.synapse_level)
+        learn[is_strengthen] = 0
+        learn[is_over & is_strengthened] = learn_threshold
+        s_learn[synapse_address] = learn
+
+    def update_stat(self, domain):
+        """
+        Считаем статистику по слоям и синапсам (поля как в
+        domain.stat_vector)
+        """
+        neurons = domain.neurons
+        stat_size = domain.config['stat_size']
+        ticks = types.tick(domain.ticks)
+        stat_fields = domain.stat_fields
+        layers_stat = domain.layers_stat.data
+        layers_stat.fill(0)
+        for layer_address, layer in enumerate(domain.layers):
+            start = layer.neurons_metadata.address
+            end = start + layer.length
+            flags = neurons.flags.data[start:end]
+            is_local = (flags & IS_RECEIVER) == 0
+            spike_tick = neurons.spike_tick.data[start:end][is_local]
+            tiredness = types.vitality(
+                domain.layers_vector.max_vitality.data[layer_address]) \
+                    - neurons.vitality.data[start:end][is_local]
+            layer_stat_start = stat_fields * layer_address
+            # field 0 - count spikes between [ticks - stat_size + 1, ticks]
+            layers_stat[layer_stat_start] = np.count_nonzero(
+                (spike_tick > ticks - types.tick(stat_size))
+                & (spike_tick <= ticks))
+            # field 1 - get number of the dead neurons
+            layers_stat[layer_stat_start + 1] = np.count_nonzero(
+                flags[is_local] & IS_DEAD)
+            # field 3 - get neurons tiredness
+            # = sum(layer.max_vitality - neuron.vitality)
+            layers_stat[layer_stat_start + 3] = tiredness.sum(
+                dtype=types.stat)
+        stat_vector = domain.stat_vector.data
+        stat_vector[:] = layers_stat.reshape((-1, stat_fields)).sum(
+            axis=0, dtype=types.stat)
+        if len(domain.synapses):
+            # field 2 - count of the synapses with IS_STRENGTHENED flag
+            stat_vector[2] += np.count_nonzero(
+                domain.synapses.flags.data & IS_STRENGTHENED)
+            # field 4 - synapse learn level
+            stat_vector[4] += domain.synapses.learn.data.sum(dtype=types.stat)
+        domain.stat_set('stat_size', stat_size)
+        # 0 - total spikes (one per neuron) per self.config['stat_size']
+        # ticks
+        domain.stat_set('total_spikes', stat_vector[0])
+        # 1 - number of the dead neurons
+        domain.stat_set('dead_neurons', stat_vector[1])
+        # 2 - number of synapses with flag IS_STRENGTHENED
+        domain.stat_set('strengthened_synapses', stat_vector[2])
+        # 3 - neurons tiredness = sum(layer.max_vitality - neuron.vitality)
+        domain.stat_set('neurons_tiredness', stat_vector[3])
+        # 4 - synapse learn level
+        domain.stat_set('synapse_learn_level', stat_vector[4])
+
+    def tick_transmitter_index(self, domain):
+        index = domain.transmitter_index
+        if not len(index.local_address):
+            return
+        flags = domain.neurons.flags.data[index.local_address.data]
+        index.is_spiked.data[:] = (flags & (IS_SPIKED | IS_DEAD)) == IS_SPIKED
+
+    def tick_receiver_index(self, domain):
+        index = domain.receiver_index
+        if not len(index.local_address):
+            return
+        is_spiked = index.is_spiked.data
+        domain.neurons.flags.data[index.local_address.data[is_spiked != 0]] \
+                |= IS_SPIKED
+        is_spiked.fill(0)
+
+    def tick_receiver_spikes(self, domain, spikes):
+        index = domain.receiver_index
+        domain.neurons.flags.data[index.local_address.data[spikes]] \
+                |= IS_SPIKED
+
+    def tick_layers_input_data(self, domain):
+        """
+        Add value from layer.input_data to neurons.level
+        """
+        ticks = domain.ticks
+        level = domain.neurons.level.data
+        for layer in domain.layers:
+            if layer.input_data is None and layer.input_data_cache is None:
+                continue
+            data = layer.input_data
+            layer.input_data = None
+            input_data_vector = layer.input_data_cache
+            if input_data_vector is None:
+                input_data_vector = StandaloneVector()
+                if isinstance(data, basestring):
+                    input_data_vector.from_bytes(data)
+                else:
+                    input_data_vector.set_data(data)
+                assert len(input_data_vector) == layer.length, \
+                    "Domain '%s': len(input_data_vector)=%s, layer.length=%s" \
+                    % (domain.name, len(input_data_vector), layer.length)
+                layer.input_data_cache = input_data_vector
+            length = len(input_data_vector)
+            if not length:
+                return
+            address = layer.neurons_metadata.address
+            level[address:address + length] \
+                    += input_data_vector.data.astype(types.neuron_level)
+            if layer.input_expire <= ticks:
+                layer.input_data = None
+                layer.input_data_cache = None
+
+    def tick_layers_output_data(self, domain):
+        """
+        Convert layer ticks to numpy array
+        (if layer.config.get('output') is True)
+        """
+        output_index = domain.output_index
+        if not len(output_index.address):
+            return
+        ticks = types.tick(domain.ticks)
+        oi_data = output_index.data.data
+        oi_tick = output_index.tick.data
+        flags = domain.neurons.flags.data[output_index.address.data]
+        is_spiked = (flags & (IS_SPIKED | IS_DEAD)) == IS_SPIKED
+        # FIXME: should be max of types.output
+        threshold = 255
+        diff = ticks - oi_tick[is_spiked] - types.tick(1)
+        oi_data[is_spiked] = np.where(
+            diff >= threshold, 1, threshold - np.minimum(diff, threshold))
+        oi_tick[is_spiked] = ticks
+        # relax
+        is_relax = ~is_spiked & (oi_data > 0)
+        oi_data[is_relax] -= 1
+        # find all source consumers and cache it
+        if self._source_cache is None:
+            self._source_cache = {}
+            cache = self._source_cache
+            for layer in domain.layers:
+                if 'output' not in layer.config:
+                    continue
+                source_id = layer.config['output']
+                cache[source_id] = []
+            net = domain.net
+            # consumers
+            for other_domain in net.domains:
+                for layer_index, layer in enumerate(other_domain.layers):
+                    if not layer.config.get('input'):
+                        continue
+                    source_id = layer.config['input']
+                    # not our source
+                    if source_id not in cache:
+                        continue
+                    cache[source_id].append([other_domain, layer_index])
+                for input_index, input_row in enumerate(
+                    other_domain.config['device'].get('input', [])
+                ):
+                    source_id = input_row['name']
+                    # not our source
+                    if source_id not in cache:
+                        continue
+                    cache[source_id].append([other_domain, input_index])
+
+        cache = self._source_cache
+        for source_id, data in output_index.data_to_send():
+            for consumer_domain, layer_index in cache[source_id]:
+                consumer_domain.register_input_layer_data(layer_index, data)
+
+    def create(self, data):
+        if not len(data):
+            return None
+        return data
+
+    def upload(self, device_data_pointer, data, is_blocking=True):
+        # Do not upload empty buffers
+        if not len(data) or device_data_pointer is None:
+            return
+        if device_data_pointer is not data:
+            device_data_pointer[:] = data
+
+    def download(self, data, device_data_pointer, is_blocking=True):
+        if device_data_pointer is None:
+            return
+        if device_data_pointer is not data:
+            data[:] = device_data_pointer
+
+
+def test_numpy_device():
+    from openre import OpenRE
+    from openre import neurons
+    from openre import synapses
+    synapse_max_level = 30000
+    config = {
+        'synapse': {
+            'max_level': synapse_max_level,
+            'spike_learn_threshold': 2,
+        },
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': synapse_max_level,
+                'relaxation': 1000,
+                'width': 20,
+                'height': 20,
+                'is_inhibitory': True,
+                'connect': [
+                    {
+                        'name': 'V2',
+                        'radius': 1,
+                        'shift': [0, 0],
+                    },
+                ],
+            },
+            {
+                'name': 'V2',
+                'threshold': synapse_max_level,
+                'relaxation': 1000,
+                'width': 20,
+                'height': 20,
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'device'    : {
+                    'type': 'NumPy',
+                    'threshold_inc': 0,
+                    'threshold_dec': 0
+                },
+                'stat_size': 1,
+                'layers'    : [
+                    {'name': 'V1'},
+                    {'name': 'V2'},
+                ],
+            },
+        ],
+    }
+    ore = OpenRE(config)
+    ore.deploy()
+    domain = ore.domains[0]
+    assert isinstance(domain.device, NumPy)
+    layer = domain.layers[0]
+    layer2 = domain.layers[1]
+    max_vitality = types.max(types.vitality)
+    assert len(domain.synapses) == 400
+    assert domain.neurons.length == 800
+
+    layer.neurons_metadata.level[0, 0] = synapse_max_level
+    layer.neurons_metadata.level[0, 1] = layer.relaxation + 1
+    layer.neurons_metadata.flags[0, 1] |= neurons.IS_SPIKED
+    layer.neurons_metadata.level[0, 2] = synapse_max_level
+    layer.neurons_metadata.flags[0, 2] |= neurons.IS_DEAD
+    layer.neurons_metadata.flags[0, 2] |= neurons.IS_SPIKED
+    layer.neurons_metadata.level[0, 3] = synapse_max_level
+    layer.neurons_metadata.flags[0, 3] |= neurons.IS_RECEIVER
+    layer.neurons_metadata.flags[0, 3] |= neurons.IS_SPIKED
+    layer.neurons_metadata.level[0, 4] = -1
+    layer.neurons_metadata.level[0, 6] = synapse_max_level
+    layer.neurons_metadata.vitality[0, 6] = layer.spike_cost
+    layer.neurons_metadata.level[0, 7] = synapse_max_level
+    layer2.neurons_metadata.level[0, 7] = synapse_max_level
+    before = layer2.neurons_metadata.level[0, 0]
+    synapse_level = domain.synapses.level[domain.pre_synapse_index.key[0]]
+    layer.neurons_metadata.level[1, 0] = synapse_max_level
+    layer2.neurons_metadata.flags[1, 0] |= neurons.IS_DEAD
+    layer2.neurons_metadata.level[1, 1] = synapse_max_level
+    layer.neurons_metadata.flags[1, 2] |= neurons.IS_DEAD
+    layer2.neurons_metadata.level[1, 2] = synapse_max_level
+    post_7 = domain.post_synapse_index.key[
+        layer2.neurons_metadata.level.to_address(0, 7)]
+    domain.synapses.learn[post_7] = domain.learn_threshold
+
+    domain.neurons.to_device(domain.device)
+    domain.synapses.to_device(domain.device)
+    domain.tick()
+    domain.neurons.from_device(domain.device)
+    domain.synapses.from_device(domain.device)
+
+    assert layer.neurons_metadata.level[0, 0] == 0
+    assert layer.neurons_metadata.flags[0, 0] & neurons.IS_SPIKED
+    assert layer.neurons_metadata.spike_tick[0, 0] == 1
+    assert layer.neurons_metadata.vitality[0, 0] \
+            == max_vitality - layer.spike_cost + 1
+    assert layer.neurons_metadata.level[0, 1] == 1
+    assert not layer.neurons_metadata.flags[0, 1] & neurons.IS_SPIKED
+    assert layer.neurons_metadata.level[0, 2] == synapse_max_level
+    assert layer.neurons_metadata.flags[0, 2] & neurons.IS_SPIKED
+    assert layer.neurons_metadata.level[0, 3] == synapse_max_level
+    assert not layer.neurons_metadata.flags[0, 3] & neurons.IS_SPIKED
+    assert layer.neurons_metadata.level[0, 4] == 0
+    # spike and dies (low neuron.vitality)
+    assert not layer.neurons_metadata.flags[0, 6] & neurons.IS_SPIKED
+    assert layer.neurons_metadata.flags[0, 6] & neurons.IS_DEAD
+    assert layer.neurons_metadata.vitality[0, 6] == max_vitality
+    # layer 1 is inhibitory
+    before = max(before - 1000, 0)
+    assert layer2.neurons_metadata.level[0, 0] == before - synapse_level
+    # learning
+    assert domain.synapses.flags[post_7] & synapses.IS_STRENGTHENED
+    # dead post-neuron so synapse level should be 0
+    assert domain.synapses.level[domain.pre_synapse_index.key[
+        layer.neurons_metadata.level.to_address(1, 0)
+    ]] == 0
+    assert layer2.neurons_metadata.flags[1, 1] & neurons.IS_SPIKED
+    # dead pre-neuron so synapse level should be 0
+    assert domain.synapses.level[domain.post_synapse_index.key[
+        layer2.neurons_metadata.level.to_address(1, 2)
+    ]] == 0
+    # stats
+    assert domain.layers_stat[1] == 3
+    assert domain.layers_stat[1 + len(domain.stat_vector)] == 1
+    assert domain.stat_vector[1] == domain.stat('dead_neurons')
+    assert domain.stat_vector[2] == 1
+    assert domain.stat_vector[2] == domain.stat('strengthened_synapses')
+    assert domain.layers_stat[3] \
+            == (layer.spike_cost - 1) * domain.layers_stat[0]
+    assert domain.stat_vector[0] == domain.stat('total_spikes')
+
+    # remote domains
+    config['domains'] = [
+        {
+            'name'        : 'D1',
+            'device'    : {'type': 'NumPy'},
+            'layers'    : [{'name': 'V1'}],
+        },
+        {
+            'name'        : 'D2',
+            'device'    : {'type': 'NumPy'},
+            'layers'    : [{'name': 'V2'}],
+        },
+    ]
+    ore = OpenRE(config)
+    ore.deploy()
+    d1 = ore.domains[0]
+    d2 = ore.domains[1]
+    d1.layers[0].neurons_metadata.level[0, 0] = synapse_max_level
+    d1.tick()
+    assert d1.transmitter_index.is_spiked[0]
+    assert d2.receiver_index.is_spiked[0]
+    local_address = d2.receiver_index.local_address[0]
+    d2.tick()
+    assert not d2.receiver_index.is_spiked[0]
+    assert d2.neurons.flags[local_address] & neurons.IS_SPIKED
+    assert d2.neurons.flags[local_address] & neurons.IS_RECEIVER
+
+
+def test_opencl_compare():
+    """
+    NumPy устройство должно давать тот же результат что и OpenCL
+    """
+    from openre import OpenRE
+    from openre import device
+    from openre import neurons
+    if not hasattr(device, 'OpenCL'):
+        return
+    try:
+        device.OpenCL({})
+    except Exception:
+        # no OpenCL platforms
+        return
+    config = {
+        'synapse': {
+            'max_level': 30000,
+        },
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 30000,
+                'relaxation': 1000,
+                'width': 30,
+                'height': 30,
+                'is_inhibitory': True,
+                'connect': [{'name': 'V2', 'radius': 2}],
+            },
+            {
+                'name': 'V2',
+                'threshold': 20000,
+                'relaxation': 500,
+                'spike_cost': 5000,
+                'width': 30,
+                'height': 30,
+                'connect': [{'name': 'V1', 'radius': 2}],
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'stat_size': 5,
+                'layers'    : [{'name': 'V1'}, {'name': 'V2'}],
+                'device'    : {'type': 'NumPy'},
+            },
+        ],
+    }
+    result = {}
+    for device_type, synapses_index, spikes_list, accumulation in [
+        ('NumPy', 'list', False, 'push'), ('NumPy', 'csr', False, 'push'),
+        ('OpenCL', 'list', False, 'push'), ('OpenCL', 'csr', False, 'push'),
+        ('OpenCL', 'list', True, 'push'), ('OpenCL', 'csr', True, 'push'),
+        ('OpenCL', 'list', False, 'pull'), ('OpenCL', 'csr', True, 'pull'),
+    ]:
+        config['domains'][0]['device']['type'] = device_type
+        config['domains'][0]['device']['spikes_list'] = spikes_list
+        config['domains'][0]['synapses_index'] = synapses_index
+        config['domains'][0]['accumulation'] = accumulation
+        # create_neuron uses random from stdlib
+        neurons.random.seed(1)
+        np.random.seed(1)
+        ore = OpenRE(config)
+        ore.deploy()
+        domain = ore.domains[0]
+        rnd = np.random.RandomState(2)
+        for _ in xrange(20):
+            domain.neurons.from_device(domain.device)
+            domain.neurons.level.data += rnd.randint(
+                0, 10000, len(domain.neurons)).astype(types.neuron_level)
+            domain.neurons.level.to_device(domain.device)
+            ore.tick()
+        if spikes_list:
+            # the number of spiked neurons is not downloaded each tick
+            assert domain.device._spikes_count.data[0] == 0
+        domain.neurons.from_device(domain.device)
+        domain.synapses.from_device(domain.device)
+        result[(device_type, synapses_index, spikes_list, accumulation)] \
+                = domain
+    # csr layout stores synapses sorted by pre-neuron
+    expected = result[('NumPy', 'list', False, 'push')]
+    order = np.argsort(expected.synapses.pre.data, kind='mergesort')
+    for key in result:
+        domain = result[key]
+        for vector_name in ['neurons', 'synapses']:
+            for field, _ in getattr(expected, vector_name).fields:
+                data = getattr(getattr(expected, vector_name), field).data
+                if vector_name == 'synapses' and key[1] == 'csr':
+                    data = data[order]
+                assert list(data) \
+                    == list(getattr(getattr(domain, vector_name), field).data)
+        assert list(expected.stat_vector.data) \
+                == list(domain.stat_vector.data)
+        assert list(expected.layers_stat.data) \
+                == list(domain.layers_stat.data)
+
+
+def test_opencl_compare_stat_receivers():
+    """
+    Статистика слоев на OpenCL совпадает с NumPy, если в домене есть
+    receiver нейроны (их neuron.layer - индекс слоя в другом домене)
+    """
+    from openre import OpenRE
+    from openre import device
+    from openre import neurons
+    if not hasattr(device, 'OpenCL'):
+        return
+    try:
+        device.OpenCL({})
+    except Exception:
+        # no OpenCL platforms
+        return
+    def layer(name, width, height, connect=None):
+        ret = {'name': name, 'threshold': 20000, 'relaxation': 500,
+               'spike_cost': 5000, 'width': width, 'height': height}
+        if connect:
+            ret['connect'] = connect
+        return ret
+    config = {
+        'layers': [
+            layer('V1', 4, 4, [{'name': 'V3', 'radius': 1}]),
+            layer('V2', 5, 4),
+            layer('V3', 2, 2),
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'stat_size': 5,
+                'layers'    : [{'name': 'V1'}],
+            },
+            {
+                'name'        : 'D2',
+                'stat_size': 5,
+                'layers'    : [{'name': 'V2'}, {'name': 'V3'}],
+            },
+        ],
+    }
+    result = {}
+    for device_type in ['NumPy', 'OpenCL']:
+        for domain_config in config['domains']:
+            # in D2 work-group 16..31 starts in V2 (layer 0), has all V3
+            # neurons (layer 1) and ends with receivers from V1 (layer 0 in
+            # D1)
+            domain_config['device'] = {'type': device_type,
+                                       'stat_group_size': 16}
+        neurons.random.seed(1)
+        np.random.seed(1)
+        ore = OpenRE(config)
+        ore.deploy()
+        d2 = ore.domains[1]
+        assert len(d2.neurons) == 20 + 4 + 16
+        assert d2.neurons.flags[31] & neurons.IS_RECEIVER
+        assert d2.neurons.layer[31] == d2.neurons.layer[16] == 0
+        rnd = np.random.RandomState(2)
+        for _ in xrange(20):
+            for domain in ore.domains:
+                domain.neurons.from_device(domain.device)
+                domain.neurons.level.data += rnd.randint(
+                    0, 10000, len(domain.neurons)).astype(types.neuron_level)
+                domain.neurons.level.to_device(domain.device)
+            ore.tick()
+        result[device_type] = [
+            (list(domain.stat_vector.data), list(domain.layers_stat.data))
+            for domain in ore.domains
+        ]
+    # V3 spikes
+    assert result['NumPy'][1][1][len(d2.stat_vector)]
+    assert result['NumPy'] == result['OpenCL']
@@ -7,16 +7,51 @@ try:
     import pyopencl as cl
 except ImportError:
     pass
+import hashlib
+import logging
+import os
+import tempfile
+import threading
 from openre.device.abstract import Device
 from openre.data_types import types, null
 from openre import synapses
+from openre import neurons
+from openre.index import SynapsesCSRIndex
 from openre.templates import create_env
 from openre.vector import StandaloneVector
+import numpy as np
 
 
+# OpenCL контексты (и скомпилированные в них программы), общие для всех
+# устройств процесса с одинаковыми platform, device_type и device
+_contexts = {}
+
 class OpenCL(Device):
     """
     Устройства, поддерживающие OpenCL
+    self.config['shared_context'] - если True (по умолчанию), то устройства
+                                    с одинаковыми platform, device_type и
+                                    device используют общие OpenCL контекст
+                                    и программы
+    self.config['shared_queue'] - если True, то и общую очередь команд
+    self.config['stat_group_size'] - размер work-group для сбора статистики
+                                     (степень двойки, по умолчанию до 128)
+    self.config['cache_dir'] - директория кэша скомпилированных программ
+                               (False - не использовать кэш)
+    self.config['download_flags'] - если True, то флаги всех нейронов
+                                    загружаются с устройства каждый тик, в
+                                    котором есть output слои (по умолчанию
+                                    загружаются только output данные, у
+                                    которых есть потребители)
+    self.config['spikes_list'] - если True, то tick_neurons складывает адреса
+                                 спайкнувших нейронов в список на устройстве.
+                                 tick_synapses по-прежнему запускается для
+                                 всех нейронов (количество спайков не
+                                 загружается с устройства), но работают
+                                 только первые work-item'ы по списку, а
+                                 остальные сразу завершаются - спайкнувшие
+                                 нейроны собраны в начале сетки, а не
+                                 разбросаны по всем work-group.
     """
     def __init__(self, config):
         super(OpenCL, self).__init__(config)
@@ -24,19 +59,44 @@ class OpenCL(Device):
             raise ImportError('Install PyOpenCL to support OpenCL devices')
         platform_id = self.config.get('platform', 0)
         device_type = self.config.get('device_type')
-        if device_type:
-            self.device = cl.get_platforms()[platform_id].get_devices(
-                getattr(cl.device_type, 'CPU'))[self.config.get('device', 0)]
+        self._context_key = (platform_id, bool(device_type),
+                             self.config.get('device', 0))
+        context = None
+        if self.config.get('shared_context', True):
+            context = _contexts.get(self._context_key)
+        if context is None:
+            if device_type:
+                device = cl.get_platforms()[platform_id].get_devices(
+                    getattr(cl.device_type, 'CPU')
+                )[self.config.get('device', 0)]
+            else:
+                device = cl.get_platforms()[platform_id] \
+                        .get_devices()[self.config.get('device', 0)]
+            # create an OpenCL context
+            context = {
+                'device': device,
+                'ctx': cl.Context([device], dev_type=None),
+                'queue': None,
+                'programs': {},
+            }
+            if self.config.get('shared_context', True):
+                _contexts[self._context_key] = context
+        self._context = context
+        self.device = context['device']
+        self.ctx = context['ctx']
+        if self.config.get('shared_queue'):
+            if context['queue'] is None:
+                context['queue'] = cl.CommandQueue(self.ctx)
+            self.queue = context['queue']
         else:
-            self.device = cl.get_platforms()[platform_id] \
-                    .get_devices()[self.config.get('device', 0)]
-        # create an OpenCL context
-        self.ctx = cl.Context([self.device], dev_type=None)
-        self.queue = cl.CommandQueue(self.ctx)
+            self.queue = cl.CommandQueue(self.ctx)
         env = create_env()
         source_file_name = config.get('source_file_name', "device/opencl.c")
         self.config['threshold_inc'] = self.config.get('threshold_inc', 10)
         self.config['threshold_dec'] = self.config.get('threshold_dec', 5)
+        # work-group size for stats reduction, should be a power of two
+        self.config['stat_group_size'] = self.config.get(
+            'stat_group_size', min(128, self.device.max_work_group_size))
         code = env.get_template(source_file_name).render(
             types=types,
             null=null,
@@ -74,19 +134,122 @@ class OpenCL(Device):
         #code = ''.join(code)
 
         # compile the kernel
-        self.program = cl.Program(self.ctx, code).build(
+        self.program = self.build_program(
+            code,
             options="-cl-denorms-are-zero " \
                     "-cl-no-signed-zeros " \
                     "-cl-finite-math-only"
         )
         self._source_cache = None
+        # список спайкнувших нейронов (config['spikes_list'])
+        self._spikes = None
+        self._spikes_count = None
+        self._spikes_tick = None
+        # два списка спайкнувших transmitter нейронов (см.
+        # transmitter_spikes и transmitter_spikes_async): пока один
+        # загружается в фоне, в другой пишет следующий тик
+        self._transmitter_spikes = None
+        self._transmitter_buffer = 0
+        self._transmitter_free = None
+        self._transmitter_event = None
+        self._transfer_queue = None
+        # пришедшие спайки receiver нейронов (см. tick_receiver_spikes)
+        self._receiver_spikes = None
+        self._receiver_spikes_host = None
+        # статистика домена и слоев (см. self._stat_vector)
+        self._stat = None
+        # input данные слоев (см. self._input_layout)
+        self._input_start = {}
+        self._input_address = None
+        self._input_slot = None
+        self._input_pools = {}
+
+    def build_program(self, code, options):
+        """
+        Программа для code, общая для всех устройств с тем же контекстом.
+        """
+        programs = self._context['programs']
+        key = (code, options)
+        if key not in programs:
+            programs[key] = self.load_program(code, options)
+        return programs[key]
 
+    def load_program(self, code, options):
+        """
+        Компилирует code или загружает скомпилированную ранее программу из
+        кэша self.config['cache_dir'] (по умолчанию - openre-cache во
+        временной директории, False - не использовать кэш).
+        Ключ кэша - хэш исходного кода, опций компиляции, платформы и
+        устройства.
+        """
+        cache_dir = self.config.get(
+            'cache_dir', os.path.join(tempfile.gettempdir(), 'openre-cache'))
+        if not cache_dir:
+            return cl.Program(self.ctx, code).build(options=options)
+        if isinstance(code, unicode):
+            code = code.encode('utf-8')
+        platform = self.device.platform
+        key = hashlib.sha1('\0'.join([
+            code, options,
+            platform.name, platform.version,
+            self.device.name, self.device.version,
+            self.device.driver_version,
+        ])).hexdigest()
+        file_name = os.path.join(cache_dir, '%s.bin' % key)
+        if os.path.isfile(file_name):
+            try:
+                with open(file_name, 'rb') as inp:
+                    binary = inp.read()
+                return cl.Program(self.ctx, [self.device], [binary]) \
+                        .build(options=options)
+            except Exception as error:
+                logging.warn('Can\'t load OpenCL program from %s: %s',
+                             file_name, error)
+        program = cl.Program(self.ctx, code).build(options=options)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            binary = program.get_info(cl.program_info.BINARIES)[0]
+            # write to temporary file and rename - other processes never
+            # see partially written binary
+            fd, tmp_file_name = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'wb') as out:
+                out.write(binary)
+            os.rename(tmp_file_name, file_name)
+        except (IOError, OSError) as error:
+            logging.warn('Can\'t save OpenCL program to %s: %s',
+                         file_name, error)
+        return program
+
+    def _spikes_list_args(self, domain, reset=False):
+        """
+        Аргументы для ядер, добавляющих нейроны в список спайкнувших.
+        Если config['spikes_list'] не задан - пустой список.
+        reset=True обнуляет счетчик в начале тика.
+        """
+        if not self.config.get('spikes_list'):
+            return []
+        length = domain.neurons.length
+        if self._spikes is None or len(self._spikes) != length:
+            self._spikes = StandaloneVector().set_data(
+                np.zeros(length, dtype=types.address))
+            self._spikes_count = StandaloneVector().set_data(
+                np.zeros(1, dtype=types.address))
+            self._spikes.create_device_data_pointer(self)
+            self._spikes_count.create_device_data_pointer(self)
+        if reset:
+            self._spikes_count.data.fill(0)
+            self._spikes_count.to_device(self, is_blocking=False)
+            self._spikes_tick = domain.ticks
+        return [self._spikes.device_data_pointer,
+                self._spikes_count.device_data_pointer]
 
     def tick_neurons(self, domain):
         length = domain.neurons.length
         if not length:
             return
         self.tick_layers_input_data(domain)
+        spikes_list_args = self._spikes_list_args(domain, reset=True)
         self.program.tick_neurons(
             self.queue, (length,), None,
             # domain
@@ -102,21 +265,53 @@ class OpenCL(Device):
             domain.neurons.spike_tick.device_data_pointer,
             domain.neurons.layer.device_data_pointer,
             domain.neurons.vitality.device_data_pointer,
-            domain.neurons.threshold.device_data_pointer
-        ).wait()
+            domain.neurons.threshold.device_data_pointer,
+            *spikes_list_args
+        )
         self.tick_layers_output_data(domain)
 
     def tick_synapses(self, domain):
         length = domain.neurons.length
         if not length:
             return
-        self.program.tick_synapses(
+        pre_index = domain.pre_synapse_index
+        post_index = domain.post_synapse_index
+        if isinstance(pre_index, SynapsesCSRIndex):
+            kernel = self.program.tick_synapses_csr
+            accumulate_kernel = self.program.accumulate_synapses_csr
+            pre_key, post_key = pre_index.offset, post_index.offset
+        else:
+            kernel = self.program.tick_synapses
+            accumulate_kernel = self.program.accumulate_synapses
+            pre_key, post_key = pre_index.key, post_index.key
+        # launched for all neurons: the number of spiked neurons is not
+        # downloaded from the device, with spikes_list only the first
+        # work-items (one per spiked neuron) do the work
+        spikes_list_args = self._spikes_list(domain)
+        is_push = domain.config.get('accumulation', 'push') != 'pull'
+        if not is_push:
+            # for each post-neuron sum levels from pre-neurons
+            accumulate_kernel(
+                self.queue, (domain.neurons.length,), None,
+                # neurons
+                domain.neurons.level.device_data_pointer,
+                domain.neurons.flags.device_data_pointer,
+                # synapses
+                domain.synapses.level.device_data_pointer,
+                domain.synapses.pre.device_data_pointer,
+                domain.synapses.learn.device_data_pointer,
+                # post-neuron - synapse index
+                post_key.device_data_pointer,
+                post_index.value.device_data_pointer
+            )
+        kernel(
             self.queue, (length,), None,
             # domain
             types.synapse_level(domain.learn_rate),
             types.synapse_level(domain.learn_threshold),
             types.tick(domain.spike_learn_threshold),
             types.tick(domain.spike_forget_threshold),
+            np.uint8(is_push),
             # neurons
             domain.neurons.level.device_data_pointer,
             domain.neurons.flags.device_data_pointer,
@@ -128,80 +323,213 @@ class OpenCL(Device):
             domain.synapses.learn.device_data_pointer,
             domain.synapses.flags.device_data_pointer,
             # pre-neuron - synapse index
-            domain.pre_synapse_index.key.device_data_pointer,
-            domain.pre_synapse_index.value.device_data_pointer,
+            pre_key.device_data_pointer,
+            pre_index.value.device_data_pointer,
             # post-neuron - synapse index
-            domain.post_synapse_index.key.device_data_pointer,
-            domain.post_synapse_index.value.device_data_pointer
-        ).wait()
-        # download layers stats from device once
+            post_key.device_data_pointer,
+            post_index.value.device_data_pointer,
+            *spikes_list_args
+        )
+        # download stats from device once
         # per domain.config['stat_size'] ticks
         if  domain.ticks % domain.config['stat_size'] == 0:
-            domain.stat_vector.data.fill(0)
-            self.program.update_layers_stat(
-                self.queue, (domain.neurons.length,), None,
-                # domain
-                types.tick(domain.ticks),
-                types.address(domain.config['stat_size']),
-                types.address(domain.stat_fields),
-                # layers
-                domain.layers_stat.device_data_pointer,
-                domain.layers_vector.max_vitality.device_data_pointer,
-                # neurons
-                domain.neurons.flags.device_data_pointer,
-                domain.neurons.spike_tick.device_data_pointer,
-                domain.neurons.layer.device_data_pointer,
-                domain.neurons.vitality.device_data_pointer
-            ).wait()
-            domain.layers_stat.from_device(self)
-            stat_length = len(domain.stat_vector)
-            for layer_address in range(len(domain.layers)):
-                layer_stat_start = \
-                        domain.stat_fields \
-                        * layer_address
-                domain.stat_vector.data += domain.layers_stat.data[
-                    layer_stat_start : layer_stat_start + stat_length
-                ]
-            self.program.init_layers_stat(
-                self.queue, (len(domain.layers_stat),), None,
-                domain.layers_stat.device_data_pointer
-            ).wait()
-            if len(domain.synapses):
-                # count synapses stats
-                domain.stat_vector.to_device(self)
-                self.program.update_synapses_stat(
-                    self.queue, (len(domain.synapses),), None,
-                    domain.stat_vector.device_data_pointer,
-                    # synapses
-                    domain.synapses.learn.device_data_pointer,
-                    domain.synapses.flags.device_data_pointer
-                ).wait()
-                domain.stat_vector.from_device(self)
-            domain.stat_set('stat_size', domain.config['stat_size'])
-            # 0 - total spikes (one per neuron) per self.config['stat_size']
-            # ticks
-            domain.stat_set('total_spikes', domain.stat_vector.data[0])
-            # 1 - number of the dead neurons
-            domain.stat_set('dead_neurons', domain.stat_vector.data[1])
-            # 2 - number of synapses with flag IS_STRENGTHENED
-            domain.stat_set('strengthened_synapses', domain.stat_vector.data[2])
-            # 3 - neurons tiredness = sum(layer.max_vitality - neuron.vitality)
-            domain.stat_set('neurons_tiredness', domain.stat_vector.data[3])
-            # 4 - synapse learn level
-            domain.stat_set('synapse_learn_level', domain.stat_vector.data[4])
+            self.update_stat(domain)
+
+    def _stat_vector(self, domain):
+        """
+        Буфер статистики на устройстве: domain.stat_fields полей домена,
+        затем domain.stat_fields полей для каждого слоя.
+        """
+        if self._stat is None:
+            self._stat = StandaloneVector().set_data(np.zeros(
+                domain.stat_fields + len(domain.layers_stat),
+                dtype=types.stat))
+            self._stat.to_device(self)
+        return self._stat
+
+    def _group_size(self, length):
+        """
+        Размер глобальной сетки, кратный config['stat_group_size']
+        """
+        group_size = self.config['stat_group_size']
+        return ((length + group_size - 1) // group_size) * group_size
+
+    def _update_synapses_stat(self, domain):
+        """
+        Поля 2 и 4 домена считаются по всем синапсам, поэтому учитывают и
+        флаги синапсов, загруженные на устройство с хоста.
+        """
+        length = len(domain.synapses)
+        if not length:
+            return
+        self.program.update_synapses_stat(
+            self.queue, (self._group_size(length),),
+            (self.config['stat_group_size'],),
+            self._stat.device_data_pointer,
+            # synapses
+            types.address(length),
+            domain.synapses.learn.device_data_pointer,
+            domain.synapses.flags.device_data_pointer
+        )
+
+    def update_stat(self, domain):
+        """
+        Собираем статистику на устройстве (редукция в локальной памяти,
+        один atomic на work-group) и загружаем ее одним копированием.
+        """
+        stat = self._stat_vector(domain)
+        self.program.update_layers_stat(
+            self.queue, (self._group_size(domain.neurons.length),),
+            (self.config['stat_group_size'],),
+            # domain
+            types.tick(domain.ticks),
+            types.address(domain.config['stat_size']),
+            types.address(domain.stat_fields),
+            stat.device_data_pointer,
+            # layers
+            domain.layers_vector.max_vitality.device_data_pointer,
+            # neurons
+            types.address(domain.neurons.length),
+            domain.neurons.flags.device_data_pointer,
+            domain.neurons.spike_tick.device_data_pointer,
+            domain.neurons.layer.device_data_pointer,
+            domain.neurons.vitality.device_data_pointer
+        )
+        self._update_synapses_stat(domain)
+        stat.from_device(self)
+        self.program.init_stat(
+            self.queue, (len(stat),), None,
+            stat.device_data_pointer
+        )
+        domain.stat_vector.data[:] = stat.data[:domain.stat_fields]
+        domain.layers_stat.data[:] = stat.data[domain.stat_fields:]
+        domain.stat_set('stat_size', domain.config['stat_size'])
+        # 0 - total spikes (one per neuron) per self.config['stat_size']
+        # ticks
+        domain.stat_set('total_spikes', domain.stat_vector.data[0])
+        # 1 - number of the dead neurons
+        domain.stat_set('dead_neurons', domain.stat_vector.data[1])
+        # 2 - number of synapses with flag IS_STRENGTHENED
+        domain.stat_set('strengthened_synapses', domain.stat_vector.data[2])
+        # 3 - neurons tiredness = sum(layer.max_vitality - neuron.vitality)
+        domain.stat_set('neurons_tiredness', domain.stat_vector.data[3])
+        # 4 - synapse learn level
+        domain.stat_set('synapse_learn_level', domain.stat_vector.data[4])
+
+    def _spikes_list(self, domain):
+        """
+        Аргументы (список спайкнувших нейронов и счетчик) для tick_synapses.
+        Если tick_neurons в этом тике не вызывался - строим список по флагам
+        нейронов.
+        """
+        if not self.config.get('spikes_list'):
+            return []
+        if self._spikes_tick != domain.ticks:
+            self._spikes_list_args(domain, reset=True)
+            domain.neurons.flags.from_device(self)
+            flags = domain.neurons.flags.data
+            spikes = np.flatnonzero(
+                (flags & (neurons.IS_SPIKED | neurons.IS_DEAD))
+                == neurons.IS_SPIKED)
+            self._spikes.data[:len(spikes)] = spikes
+            self._spikes.to_device(self)
+            self._spikes_count.data[0] = len(spikes)
+            self._spikes_count.to_device(self)
+        return [self._spikes.device_data_pointer,
+                self._spikes_count.device_data_pointer]
+
+    def _transmitter_spikes_buffers(self, length):
+        """
+        Пары (список, счетчик) спайкнувших transmitter нейронов
+        """
+        if self._transmitter_spikes is None \
+           or len(self._transmitter_spikes[0][0]) != length:
+            self._transmitter_spikes = []
+            self._transmitter_free = []
+            for _ in xrange(2):
+                spikes = StandaloneVector().set_data(
+                    np.zeros(length, dtype=types.address))
+                count = StandaloneVector().set_data(
+                    np.zeros(1, dtype=types.address))
+                spikes.create_device_data_pointer(self)
+                count.create_device_data_pointer(self)
+                self._transmitter_spikes.append((spikes, count))
+                is_free = threading.Event()
+                is_free.set()
+                self._transmitter_free.append(is_free)
+        return self._transmitter_spikes
 
     def tick_transmitter_index(self, domain):
         length = len(domain.transmitter_index.local_address)
         if not length:
             return
-        self.program.tick_transmitter_index(
+        buffer = self._transmitter_buffer
+        spikes, count = self._transmitter_spikes_buffers(length)[buffer]
+        # wait until the previous tick with this buffer is downloaded
+        self._transmitter_free[buffer].wait()
+        count.data.fill(0)
+        count.to_device(self, is_blocking=False)
+        self._transmitter_event = self.program.tick_transmitter_index(
             self.queue, (length,), None,
             # transmitter_index
             domain.transmitter_index.local_address.device_data_pointer,
             domain.transmitter_index.is_spiked.device_data_pointer,
             # neurons
             domain.neurons.flags.device_data_pointer,
-        ).wait()
+            # spiked transmitters
+            spikes.device_data_pointer,
+            count.device_data_pointer
+        )
+
+    def transmitter_spikes(self, domain):
+        """
+        Загружаем с устройства только count номеров спайкнувших transmitter
+        нейронов из списка, собранного в tick_transmitter_index.
+        """
+        if not len(domain.transmitter_index.local_address) \
+           or self._transmitter_spikes is None:
+            return np.zeros(0, dtype=types.address)
+        return self._download_transmitter_spikes(
+            self.queue, self._transmitter_buffer)
+
+    def transmitter_spikes_async(self, domain):
+        """
+        Загрузка идет через отдельную очередь сразу после
+        tick_transmitter_index, не дожидаясь остальных ядер тика. Следующий
+        тик пишет в другой буфер.
+        """
+        if not len(domain.transmitter_index.local_address) \
+           or self._transmitter_spikes is None:
+            return super(OpenCL, self).transmitter_spikes_async(domain)
+        if self._transfer_queue is None:
+            self._transfer_queue = cl.CommandQueue(self.ctx)
+        buffer = self._transmitter_buffer
+        event = self._transmitter_event
+        # the copy in the other queue waits for the event of this queue, so
+        # commands must be submitted to the device
+        self.queue.flush()
+        self._transmitter_free[buffer].clear()
+        self._transmitter_buffer = 1 - buffer
+        def download():
+            try:
+                return self._download_transmitter_spikes(
+                    self._transfer_queue, buffer, [event])
+            finally:
+                self._transmitter_free[buffer].set()
+        # buffer is free even if download is never called (see Sender)
+        download.release = self._transmitter_free[buffer].set
+        return download
+
+    def _download_transmitter_spikes(self, queue, buffer, wait_for=None):
+        spikes, count = self._transmitter_spikes[buffer]
+        cl.enqueue_copy(queue, count.data, count.device_data_pointer,
+                        wait_for=wait_for)
+        length = int(count.data[0])
+        if length:
+            cl.enqueue_copy(queue, spikes.data[:length],
+                            spikes.device_data_pointer)
+        # порядок добавления в список зависит от устройства
+        return np.sort(spikes.data[:length])
 
     def tick_receiver_index(self, domain):
         length = len(domain.receiver_index.local_address)
@@ -214,20 +542,50 @@ class OpenCL(Device):
             domain.receiver_index.is_spiked.device_data_pointer,
             # neurons
             domain.neurons.flags.device_data_pointer,
-        ).wait()
+            *self._spikes_list_args(domain)
+        )
+
+    def tick_receiver_spikes(self, domain, spikes):
+        """
+        Загружаем на устройство только пришедшие спайки и выставляем
+        IS_SPIKED их нейронам. receiver_index.is_spiked на устройстве не
+        используется, поэтому и обнулять его не нужно.
+        """
+        length = len(spikes)
+        if not length:
+            return
+        index = domain.receiver_index
+        if self._receiver_spikes is None \
+           or len(self._receiver_spikes) != len(index.local_address):
+            self._receiver_spikes = StandaloneVector().set_data(
+                np.zeros(len(index.local_address), dtype=types.address))
+            self._receiver_spikes.create_device_data_pointer(self)
+        # host array must live until the copy is complete (device.sync())
+        self._receiver_spikes_host = spikes
+        cl.enqueue_copy(self.queue, self._receiver_spikes.device_data_pointer,
+                        spikes, is_blocking=False)
+        self.program.tick_receiver_spikes(
+            self.queue, (length,), None,
+            self._receiver_spikes.device_data_pointer,
+            # receiver_index
+            index.local_address.device_data_pointer,
+            # neurons
+            domain.neurons.flags.device_data_pointer,
+            *self._spikes_list_args(domain)
+        )
 
     def tick_layers_input_data(self, domain):
         """
         Add value from layer.input_data to neurons.level
         """
         ticks = domain.ticks
-        for layer in domain.layers:
+        expired = []
+        for layer_index, layer in enumerate(domain.layers):
             if layer.input_data is None and layer.input_data_cache is None:
                 continue
-            data = layer.input_data
-            layer.input_data = None
-            input_data_vector = layer.input_data_cache
-            if input_data_vector is None:
+            if layer.input_data is not None:
+                data = layer.input_data
+                layer.input_data = None
                 input_data_vector = StandaloneVector()
                 if isinstance(data, basestring):
                     input_data_vector.from_bytes(data)
@@ -236,25 +594,113 @@ class OpenCL(Device):
                 assert len(input_data_vector) == layer.length, \
                     "Domain '%s': len(input_data_vector)=%s, layer.length=%s" \
                     % (domain.name, len(input_data_vector), layer.length)
+                assert types.is_allowed_input_data_type(
+                    input_data_vector.type), \
+                    "Domain '%s': input data type %s is not allowed" \
+                    % (domain.name, input_data_vector.type)
                 layer.input_data_cache = input_data_vector
-            length = len(input_data_vector)
-            if not length:
-                return
-            input_data_vector.to_device(self)
-            # only one layer with the same dims as input data
-            assert length == len(layer.neurons_metadata.level)
-            self.program.tick_numpy_input_data_uint8(
-                self.queue, (length,), None,
-                # data
-                input_data_vector.device_data_pointer,
-                # layer
-                types.address(layer.neurons_metadata.address),
+                self._upload_input_data(domain, layer_index)
+            if layer.input_expire <= ticks:
+                expired.append(layer_index)
+        # all active input layers with the same data type in one launch
+        for type_name, pool in self._input_pools.iteritems():
+            if not pool['active'].any():
+                continue
+            getattr(self.program, 'tick_input_data_%s' % type_name)(
+                self.queue, (len(self._input_address),), None,
+                # input data
+                pool['data'].device_data_pointer,
+                self._input_address.device_data_pointer,
+                self._input_slot.device_data_pointer,
+                pool['active_vector'].device_data_pointer,
                 # neurons
                 domain.neurons.level.device_data_pointer
-            ).wait()
-            if layer.input_expire <= ticks:
-                layer.input_data = None
-                layer.input_data_cache = None
+            )
+        for layer_index in expired:
+            layer = domain.layers[layer_index]
+            layer.input_data = None
+            layer.input_data_cache = None
+            self._activate_input_data(layer_index, None)
+
+    def _input_layout(self, domain, layer_index):
+        """
+        Все input слои домена хранят данные в одном буфере на каждый тип
+        данных. Слой занимает постоянный диапазон (slot) в этих буферах.
+        Если слоя еще нет - перестраиваем буферы и загружаем в них текущие
+        данные слоев.
+        """
+        if layer_index in self._input_start:
+            return self._input_start[layer_index]
+        layers = sorted(
+            set(self._input_start.keys())
+            | set([layer_index])
+            | set([index for index, layer in enumerate(domain.layers)
+                   if layer.config.get('input')])
+        )
+        length = sum(len(domain.layers[index]) for index in layers)
+        self._input_start = {}
+        address = np.zeros(length, dtype=types.address)
+        slot = np.zeros(length, dtype=types.medium_address)
+        start = 0
+        for layer_slot, index in enumerate(layers):
+            layer = domain.layers[index]
+            self._input_start[index] = (layer_slot, start)
+            address[start:start + len(layer)] \
+                    = layer.neurons_metadata.address \
+                    + np.arange(len(layer), dtype=types.address)
+            slot[start:start + len(layer)] = layer_slot
+            start += len(layer)
+        self._input_address = StandaloneVector().set_data(address)
+        self._input_slot = StandaloneVector().set_data(slot)
+        self._input_address.to_device(self)
+        self._input_slot.to_device(self)
+        self._input_pools = {}
+        for index in layers:
+            if index != layer_index \
+               and domain.layers[index].input_data_cache is not None:
+                self._upload_input_data(domain, index)
+        return self._input_start[layer_index]
+
+    def _upload_input_data(self, domain, layer_index):
+        """
+        Загружаем layer.input_data_cache в буфер input данных его типа.
+        """
+        layer_slot, start = self._input_layout(domain, layer_index)
+        data = domain.layers[layer_index].input_data_cache.data
+        type_name = data.dtype.name
+        if type_name not in self._input_pools:
+            pool_data = StandaloneVector().set_data(
+                np.zeros(len(self._input_address), dtype=data.dtype))
+            active = np.zeros(len(self._input_start), dtype=np.uint8)
+            self._input_pools[type_name] = {
+                'data': pool_data,
+                'active': active,
+                'active_vector': StandaloneVector().set_data(active),
+            }
+            pool_data.to_device(self)
+            self._input_pools[type_name]['active_vector'].to_device(self)
+        pool = self._input_pools[type_name]
+        cl.enqueue_copy(
+            self.queue, pool['data'].device_data_pointer, data,
+            device_offset=start * data.itemsize, is_blocking=False)
+        self._activate_input_data(layer_index, type_name)
+
+    def _activate_input_data(self, layer_index, type_name):
+        """
+        Данные слоя layer_index используются только из буфера type_name
+        (None - слой не активен)
+        """
+        layer_slot, _ = self._input_start[layer_index]
+        for pool_type_name, pool in self._input_pools.iteritems():
+            is_active = pool_type_name == type_name
+            if pool['active'][layer_slot] == is_active:
+                continue
+            pool['active'][layer_slot] = is_active
+            # upload a copy - host array can be changed before the copying
+            # is done
+            cl.enqueue_copy(
+                self.queue, pool['active_vector'].device_data_pointer,
+                np.copy(pool['active']), is_blocking=False)
 
     def tick_layers_output_data(self, domain):
         """
@@ -275,7 +721,7 @@ class OpenCL(Device):
             output_index.tick.device_data_pointer,
             # neurons
             domain.neurons.flags.device_data_pointer
-        ).wait()
+        )
         # find all source consumers and cache it
         if self._source_cache is None:
             self._source_cache = {}
@@ -305,9 +751,23 @@ class OpenCL(Device):
                         continue
                     cache[source_id].append([other_domain, input_index])
 
-        domain.neurons.flags.from_device(self)
-        output_index.data.from_device(self)
+        if self.config.get('download_flags'):
+            domain.neurons.flags.from_device(self)
         cache = self._source_cache
+        # download only output layers with consumers
+        data = output_index.data.data
+        is_downloaded = False
+        for pos, layer_length, source_id in output_index.cache:
+            if not cache[source_id]:
+                continue
+            cl.enqueue_copy(
+                self.queue, data[pos:pos + layer_length],
+                output_index.data.device_data_pointer,
+                device_offset=pos * data.itemsize, is_blocking=False)
+            is_downloaded = True
+        if not is_downloaded:
+            return
+        self.sync()
         for source_id, data in output_index.data_to_send():
             for consumer_domain, layer_index in cache[source_id]:
                 consumer_domain.register_input_layer_data(layer_index, data)
@@ -322,6 +782,13 @@ class OpenCL(Device):
             hostbuf=data
         )
 
+    def sync(self):
+        """
+        Ядра и копирование данных ставятся в очередь без ожидания (очередь
+        выполняет команды по порядку), ждем завершения всех команд.
+        """
+        self.queue.finish()
+
     def upload(self, device_data_pointer, data, is_blocking=True):
         # Do not upload empty buffers
         if not len(data) or device_data_pointer is None:
@@ -356,6 +823,52 @@ class IOBaseTesterSimpleCheck(OpenCL):
         assert layer.input_data is None
         return ret
 
+def test_program_cache():
+    if cl is None:
+        # skip test
+        return
+    import shutil
+    cache_dir = tempfile.mkdtemp()
+    try:
+        device = OpenCL({'cache_dir': cache_dir, 'shared_context': False})
+        assert len(os.listdir(cache_dir)) == 1
+        # load from cache
+        device = OpenCL({'cache_dir': cache_dir, 'shared_context': False})
+        assert device.program.tick_neurons
+        assert len(os.listdir(cache_dir)) == 1
+        # other source - other binary
+        OpenCL({'cache_dir': cache_dir, 'shared_context': False,
+                'spikes_list': True})
+        assert len(os.listdir(cache_dir)) == 2
+        # broken cache file - fresh build
+        for file_name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, file_name), 'wb') as out:
+                out.write('broken')
+        device = OpenCL({'cache_dir': cache_dir, 'shared_context': False})
+        assert device.program.tick_neurons
+    finally:
+        shutil.rmtree(cache_dir)
+
+def test_shared_context():
+    if cl is None:
+        # skip test
+        return
+    device1 = OpenCL({})
+    device2 = OpenCL({})
+    assert device1.ctx is device2.ctx
+    assert device1.program is device2.program
+    assert device1.queue is not device2.queue
+    device3 = OpenCL({'spikes_list': True})
+    assert device3.ctx is device1.ctx
+    assert device3.program is not device1.program
+    device4 = OpenCL({'shared_queue': True})
+    device5 = OpenCL({'shared_queue': True})
+    assert device4.queue is device5.queue
+    assert device4.queue is not device1.queue
+    device6 = OpenCL({'shared_context': False})
+    assert device6.ctx is not device1.ctx
+    assert device6.program is not device1.program
+
 def test_device():
     if cl is None:
         # skip test
@@ -698,6 +1211,8 @@ def test_device():
     assert v1.neurons_metadata.flags[0, 0] & neurons.IS_SPIKED
     assert v1.neurons_metadata.flags[0, 0] & neurons.IS_INHIBITORY
     assert d1.transmitter_index.is_spiked[0]
+    assert list(d1.device.transmitter_spikes(d1)) \
+            == list(np.flatnonzero(d1.transmitter_index.is_spiked.data))
     #assert d1.transmitter_index.flags[0] & neurons.IS_INHIBITORY
 
     assert d2.receiver_index.is_spiked[0]
@@ -714,6 +1229,55 @@ def test_device():
     assert d2.neurons.flags[local_address] & neurons.IS_RECEIVER
 
 
+def test_strengthened_stat():
+    """
+    Статистика IS_STRENGTHENED синапсов учитывает флаги, загруженные с хоста
+    """
+    if cl is None:
+        # skip test
+        return
+    from openre import OpenRE
+    from openre import synapses
+    config = {
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 30000,
+                'width': 10,
+                'height': 10,
+                'connect': [{'name': 'V1', 'radius': 2}],
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'device'    : {'type': 'OpenCL'},
+                'stat_size': 2,
+                'layers'    : [{'name': 'V1'}],
+            },
+        ],
+    }
+    ore = OpenRE(config)
+    ore.deploy()
+    domain = ore.domains[0]
+    ore.tick()
+    ore.tick()
+    assert domain.stat('strengthened_synapses') == 0
+    domain.synapses.flags.from_device(domain.device)
+    domain.synapses.flags.data[:20] |= synapses.IS_STRENGTHENED
+    domain.synapses.flags.to_device(domain.device)
+    ore.tick()
+    ore.tick()
+    assert domain.stat('strengthened_synapses') == 20
+    domain.synapses.flags.data[:15] &= ~types.synapse_flags(synapses.IS_STRENGTHENED)
+    domain.synapses.flags.to_device(domain.device)
+    ore.tick()
+    ore.tick()
+    assert domain.stat('strengthened_synapses') == 5
+    domain.synapses.flags.from_device(domain.device)
+    assert domain.stat('strengthened_synapses') == np.count_nonzero(
+        domain.synapses.flags.data & synapses.IS_STRENGTHENED)
+
 def test_input():
     for expire in range(3):
         check_input(expire)
@@ -866,6 +1430,70 @@ def check_input(expire):
         logging.warn('Expire #%s, pass #%s', expire, pass_num)
         raise
 
+def test_input_types():
+    if cl is None:
+        # skip test
+        return
+    from openre import OpenRE
+    config = {
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 30000,
+                'relaxation': 0,
+                'width': 4,
+                'height': 4,
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'device'    : {
+                    'type': 'OpenCL',
+                    'threshold_inc': 0,
+                    'threshold_dec': 0
+                },
+                'layers'    : [
+                    {'name': 'V1', 'expire': 1},
+                    {'name': 'V1', 'expire': 1},
+                    {'name': 'V1', 'expire': 2},
+                ],
+            },
+        ],
+    }
+    ore = OpenRE(config)
+    ore.deploy()
+    domain = ore.domains[0]
+    device = domain.device
+    domain.neurons.level.data[:] = 1000
+    domain.neurons.level.to_device(device)
+    data0 = np.arange(16, dtype=np.int16) * -10
+    data2 = np.arange(16, dtype=np.uint32) * 100
+    domain.register_input_layer_data(0, data0)
+    domain.register_input_layer_data(2, data2)
+    ore.tick()
+    domain.neurons.level.from_device(device)
+    level = domain.neurons.level.data
+    assert list(level[0:16]) == list(1000 + data0)
+    assert list(level[16:32]) == [1000] * 16
+    assert list(level[32:48]) == list(1000 + data2)
+    # new data with other type for layer 0, layer 2 data is used once more
+    data0 = np.arange(16, dtype=np.uint8)
+    domain.register_input_layer_data(0, data0)
+    ore.tick()
+    domain.neurons.level.from_device(device)
+    assert list(level[0:16]) \
+            == list(1000 + np.arange(16) * -10 + np.arange(16))
+    assert list(level[32:48]) == list(1000 + data2 * 2)
+    # expired
+    ore.tick()
+    domain.neurons.level.from_device(device)
+    assert list(level[0:16]) \
+            == list(1000 + np.arange(16) * -10 + np.arange(16))
+    assert list(level[32:48]) == list(1000 + data2 * 2)
+    assert domain.layers[0].input_data_cache is None
+    assert domain.layers[2].input_data_cache is None
+
 def test_output():
     from openre import OpenRE
     config = {
@@ -894,6 +1522,8 @@ def test_output():
                     {'name': 'V2', 'output': 'o2', 'shape': [8, 0, 8, 5]},
                     {'name': 'V2', 'output': 'o3', 'shape': [0, 5, 8, 5]},
                     {'name': 'V2', 'output': 'o4', 'shape': [8, 5, 8, 5]},
+                    # no consumers
+                    {'name': 'V1', 'output': 'o5'},
                 ],
             },
             {
@@ -917,6 +1547,7 @@ def test_output():
     D1 = ore.domains[0]
     D2 = ore.domains[1]
     D1.neurons.level.data[0] = 35000
+    D1.neurons.level.data[160] = 35000
     D2.neurons.level.data[:] = 0
     D1.neurons.level.to_device(device1)
     D2.neurons.level.to_device(device2)
@@ -924,6 +1555,11 @@ def test_output():
     D1.neurons.from_device(device1)
     D2.neurons.from_device(device2)
     assert D2.neurons.level.data[0] == 255
+    # only output data with consumers is downloaded
+    assert D1.output_index.data.data[0] == 255
+    assert D1.output_index.data.data[160] == 0
+    D1.output_index.data.from_device(device1)
+    assert D1.output_index.data.data[160] == 255
     D1.neurons.level.data[1] = 35000
     D1.neurons.level.to_device(device1)
     ore.tick()
@@ -41,7 +41,10 @@ __kernel void tick_neurons(
     __global {{ types.tick | to_c_type }}           * n_spike_tick,
     __global {{ types.medium_address | to_c_type }} * n_layer,
     __global {{ types.vitality | to_c_type }}       * n_vitality,
-    __global {{ types.threshold | to_c_type }}       * n_threshold
+    __global {{ types.threshold | to_c_type }}       * n_threshold{% if config.spikes_list %},
+    /* spikes list */
+    __global {{ types.address | to_c_type }}        * spikes,
+    __global {{ types.address | to_c_type }}        * spikes_count{% endif %}
 ) {
     {{ types.address | to_c_type }} neuron_address = get_global_id(0);
     // get layer
@@ -78,6 +81,10 @@ __kernel void tick_neurons(
             {% endif %}
             // store neurons last tick for better training
             n_spike_tick[neuron_address] = d_ticks;
+            {% if config.spikes_list %}
+            // add neuron to the list of spiked neurons for tick_synapses
+            spikes[atomic_inc(spikes_count)] = neuron_address;
+            {% endif %}
         }
         else{
             // neurons vitality is exhausted so it dies
@@ -105,12 +112,19 @@ __kernel void tick_neurons(
         n_vitality[neuron_address] += 1;
     }
 }
-__kernel void tick_synapses(
+{% for index_type in ['list', 'csr'] %}
+// for each neuron. index_type == 'list': pre_key/post_key are the first
+// elements of the key -> value chains, 'csr': pre_key/post_key are offsets
+// and synapses of the neuron are value[key[i]] .. value[key[i + 1] - 1]
+__kernel void tick_synapses{% if index_type == 'csr' %}_csr{% endif %}(
     /* domain */
     __const {{ types.synapse_level | to_c_type }}   d_learn_rate,
     __const {{ types.synapse_level | to_c_type }}   d_learn_threshold,
     __const {{ types.tick | to_c_type }}            d_spike_learn_threshold,
     __const {{ types.tick | to_c_type }}            d_spike_forget_threshold,
+    /* push spikes to post-neurons with atomic_add, if zero - levels are
+     * already summed by accumulate_synapses (pull accumulation) */
+    __const unsigned char                           d_push,
     /* neurons */
     __global {{ types.neuron_level | to_c_type }}   * n_level,
     __global {{ types.neuron_flags | to_c_type }}   * n_flags,
@@ -126,9 +140,20 @@ __kernel void tick_synapses(
     __global {{ types.address | to_c_type }}        * pre_value,
     /* post-neuron - synapse index */
     __global {{ types.address | to_c_type }}        * post_key,
-    __global {{ types.address | to_c_type }}        * post_value
+    __global {{ types.address | to_c_type }}        * post_value{% if config.spikes_list %},
+    /* spikes list - launched for all neurons, but only the first
+     * spikes_count work-items (spiked neurons) do the work */
+    __global {{ types.address | to_c_type }}        * spikes,
+    __global {{ types.address | to_c_type }}        * spikes_count{% endif %}
 ) {
+    {% if config.spikes_list %}
+    if(get_global_id(0) >= *spikes_count){
+        return;
+    }
+    {{ types.address | to_c_type }} neuron_address = spikes[get_global_id(0)];
+    {% else %}
     {{ types.address | to_c_type }} neuron_address = get_global_id(0);
+    {% endif %}
     /*
      *  pre-neuron -> pre-synapse -> neuron -> post-synapse -> post-neuron
      *  pre_key - synapses index, for neuron in synapse.pre
@@ -136,11 +161,16 @@ __kernel void tick_synapses(
      *  post-synapse address = pre_key[neuron address]
      *  pre-synapse address = post_key[neuron address]
      * */
-    {{ types.address | to_c_type }} post_synapse_address = pre_key[neuron_address];
+    {{ types.address | to_c_type }} post_synapse_address = NULL_ADDRESS;
     {{ types.address | to_c_type }} post_neuron_address = NULL_ADDRESS;
-    {{ types.address | to_c_type }} pre_synapse_address = post_key[neuron_address];
+    {{ types.address | to_c_type }} pre_synapse_address = NULL_ADDRESS;
     {{ types.address | to_c_type }} pre_neuron_address = NULL_ADDRESS;
+    {% if index_type == 'csr' %}
+    {{ types.address | to_c_type }} pos = 0;
+    {% else %}
+    {{ types.address | to_c_type }} next_synapse_address = NULL_ADDRESS;
     int not_infinite = 0;
+    {% endif %}
     {{ types.synapse_level | to_c_type }} learn_sum = 0;
     // stop if neuron is dead or not spiked
     if(
@@ -151,36 +181,47 @@ __kernel void tick_synapses(
     }
     // for each post-synapses
     // neuron ----------- synapse -o)---------- post-neuron
+    {% if index_type == 'csr' %}
+    for(pos = pre_key[neuron_address]; pos < pre_key[neuron_address + 1];
+        pos++){
+        post_synapse_address = pre_value[pos];
+    {% else %}
+    next_synapse_address = pre_key[neuron_address];
     not_infinite = 1000000;
-    while(post_synapse_address != NULL_ADDRESS && not_infinite){
+    while(next_synapse_address != NULL_ADDRESS && not_infinite){
         not_infinite--; /* TODO: send error to host if infinite loop */
         if(!not_infinite){
             // TODO: ignore next line only on NVIDIA devices
             // printf("Warning: infinite loop in post synapse while\n");
         }
+        post_synapse_address = next_synapse_address;
+        // next synapse
+        next_synapse_address = pre_value[post_synapse_address];
+    {% endif %}
         post_neuron_address = s_post[post_synapse_address];
         // synapse is dead
         if(s_level[post_synapse_address] == 0){
-            post_synapse_address = pre_value[post_synapse_address];
             continue;
         }
         // post-neuron is dead - kill synapse
         if(n_flags[post_neuron_address] & IS_DEAD){
             s_level[post_synapse_address] = 0;
-            post_synapse_address = pre_value[post_synapse_address];
             continue;
         }
         // is spiked - change post neuron level
-        learn_sum = s_level[post_synapse_address] + s_learn[post_synapse_address];
-        if (learn_sum < 0){
-            learn_sum = 0;
+        if(d_push){
+            learn_sum = s_level[post_synapse_address]
+                + s_learn[post_synapse_address];
+            if (learn_sum < 0){
+                learn_sum = 0;
+            }
+            atomic_add(
+                &n_level[post_neuron_address],
+                n_flags[neuron_address] & IS_INHIBITORY
+                ? -learn_sum
+                : learn_sum
+            );
         }
-        atomic_add(
-            &n_level[post_neuron_address],
-            n_flags[neuron_address] & IS_INHIBITORY
-            ? -learn_sum
-            : learn_sum
-        );
         // post-synapse learning (forget)
         if(n_spike_tick[neuron_address] - n_spike_tick[post_neuron_address]
                 < d_spike_forget_threshold){
@@ -201,28 +242,34 @@ __kernel void tick_synapses(
         /*if (s_learn[post_synapse_address] < 0){
             s_learn[post_synapse_address] += 1;
         }*/
-        // next synapse
-        post_synapse_address = pre_value[post_synapse_address];
     }
     // for each pre-synapses
     // pre-neuron ------ pre-synapse -o)---------- neuron
+    {% if index_type == 'csr' %}
+    for(pos = post_key[neuron_address]; pos < post_key[neuron_address + 1];
+        pos++){
+        pre_synapse_address = post_value[pos];
+    {% else %}
+    next_synapse_address = post_key[neuron_address];
     not_infinite = 1000000;
-    while(pre_synapse_address != NULL_ADDRESS && not_infinite){
+    while(next_synapse_address != NULL_ADDRESS && not_infinite){
         not_infinite--; /* TODO: send error to host if infinite loop */
         if(!not_infinite){
             // TODO: ignore next line only on NVIDIA devices
             // printf("Warning: infinite loop in pre synapse while\n");
         }
+        pre_synapse_address = next_synapse_address;
+        // next pre-synapse
+        next_synapse_address = post_value[pre_synapse_address];
+    {% endif %}
         pre_neuron_address = s_pre[pre_synapse_address];
         // synapse is dead
         if(s_level[pre_synapse_address] == 0){
-            pre_synapse_address = post_value[pre_synapse_address];
             continue;
         }
         // pre-neuron is dead - kill synapse
         if(n_flags[pre_neuron_address] & IS_DEAD){
             s_level[pre_synapse_address] = 0;
-            pre_synapse_address = post_value[pre_synapse_address];
             continue;
         }
         // pre-synapse learning
@@ -245,124 +292,244 @@ __kernel void tick_synapses(
         /*if (s_learn[pre_synapse_address] > 0){
             s_learn[pre_synapse_address] -= 1;
         }*/
+    }
+}
+
+// for each neuron (pull accumulation): sum levels from all spiked
+// pre-neurons without atomics. Runs before tick_synapses with d_push == 0
+__kernel void accumulate_synapses{% if index_type == 'csr' %}_csr{% endif %}(
+    /* neurons */
+    __global {{ types.neuron_level | to_c_type }}   * n_level,
+    __global {{ types.neuron_flags | to_c_type }}   * n_flags,
+    /* synapses */
+    __global {{ types.synapse_level | to_c_type }}  * s_level,
+    __global {{ types.address | to_c_type }}        * s_pre,
+    __global {{ types.synapse_level | to_c_type }}  * s_learn,
+    /* post-neuron - synapse index */
+    __global {{ types.address | to_c_type }}        * post_key,
+    __global {{ types.address | to_c_type }}        * post_value
+) {
+    {{ types.address | to_c_type }} neuron_address = get_global_id(0);
+    {{ types.address | to_c_type }} pre_synapse_address = NULL_ADDRESS;
+    {{ types.address | to_c_type }} pre_neuron_address = NULL_ADDRESS;
+    {% if index_type == 'csr' %}
+    {{ types.address | to_c_type }} pos = 0;
+    {% else %}
+    {{ types.address | to_c_type }} next_synapse_address = NULL_ADDRESS;
+    int not_infinite = 0;
+    {% endif %}
+    {{ types.synapse_level | to_c_type }} learn_sum = 0;
+    {{ types.neuron_level | to_c_type }} level = 0;
+    // dead post-neuron - synapses will be killed in tick_synapses
+    if(n_flags[neuron_address] & IS_DEAD){
+        return;
+    }
+    // for each pre-synapses
+    // pre-neuron ------ pre-synapse -o)---------- neuron
+    {% if index_type == 'csr' %}
+    for(pos = post_key[neuron_address]; pos < post_key[neuron_address + 1];
+        pos++){
+        pre_synapse_address = post_value[pos];
+    {% else %}
+    next_synapse_address = post_key[neuron_address];
+    not_infinite = 1000000;
+    while(next_synapse_address != NULL_ADDRESS && not_infinite){
+        not_infinite--; /* TODO: send error to host if infinite loop */
+        pre_synapse_address = next_synapse_address;
         // next pre-synapse
-        pre_synapse_address = post_value[pre_synapse_address];
+        next_synapse_address = post_value[pre_synapse_address];
+    {% endif %}
+        pre_neuron_address = s_pre[pre_synapse_address];
+        // synapse is dead or pre-neuron is not spiked
+        if(
+            s_level[pre_synapse_address] == 0
+            || (n_flags[pre_neuron_address] & (IS_SPIKED | IS_DEAD))
+                != IS_SPIKED
+        ){
+            continue;
+        }
+        learn_sum = s_level[pre_synapse_address]
+            + s_learn[pre_synapse_address];
+        if (learn_sum < 0){
+            learn_sum = 0;
+        }
+        level += n_flags[pre_neuron_address] & IS_INHIBITORY
+            ? -learn_sum
+            : learn_sum;
     }
+    if(level){
+        n_level[neuron_address] += level;
+    }
+}
+{% endfor %}
+
+// fill stat buffer with zeros
+__kernel void init_stat(
+    __global {{ types.stat | to_c_type }}           * stat
+) {
+    stat[get_global_id(0)] = 0;
 }
 
-// fill layers stat buffer with zeros
-__kernel void init_layers_stat(
-    __global {{ types.stat | to_c_type }}           * l_stat
+// Sum value over the work-group in local memory. Result is in values[0] of
+// the first work-item. All work-items of the group should call it.
+void reduce_stat(
+    __local {{ types.stat | to_c_type }}            * values
 ) {
-    {{ types.address | to_c_type }} address = get_global_id(0);
-    l_stat[address] = 0;
+    {{ types.address | to_c_type }} local_id = get_local_id(0);
+    {{ types.address | to_c_type }} step = get_local_size(0) / 2;
+    barrier(CLK_LOCAL_MEM_FENCE);
+    for(; step > 0; step >>= 1){
+        if(local_id < step){
+            values[local_id] += values[local_id + step];
+        }
+        barrier(CLK_LOCAL_MEM_FENCE);
+    }
 }
 
-// fill layers_stat with data
+// fill stat with data. stat[0 .. d_stat_fields - 1] - domain stat, then
+// d_stat_fields values for each layer
 __kernel void update_layers_stat(
     __const {{ types.tick | to_c_type }}            d_ticks,
     __const {{ types.address | to_c_type }}         d_stat_size,
     __const {{ types.address | to_c_type }}         d_stat_fields,
+    __global {{ types.stat | to_c_type }}           * stat,
     /* layers */
-    __global {{ types.stat | to_c_type }}           * l_stat,
     __global {{ types.vitality | to_c_type }}       * l_max_vitality,
     /* neurons */
+    __const {{ types.address | to_c_type }}         n_length,
     __global {{ types.neuron_flags | to_c_type }}   * n_flags,
     __global {{ types.tick | to_c_type }}           * n_spike_tick,
     __global {{ types.medium_address | to_c_type }} * n_layer,
     __global {{ types.vitality | to_c_type }}       * n_vitality
 ) {
+    __local {{ types.stat | to_c_type }} spikes[{{ config.stat_group_size }}];
+    __local {{ types.stat | to_c_type }} dead[{{ config.stat_group_size }}];
+    __local {{ types.stat | to_c_type }} tiredness[{{ config.stat_group_size }}];
     {{ types.address | to_c_type }} neuron_address = get_global_id(0);
+    {{ types.address | to_c_type }} local_id = get_local_id(0);
+    {{ types.address | to_c_type }} group_start
+        = get_group_id(0) * get_local_size(0);
+    {{ types.address | to_c_type }} group_end
+        = min(group_start + ({{ types.address | to_c_type }})get_local_size(0),
+              n_length) - 1;
+    {{ types.address | to_c_type }} layer_address = 0;
+    {{ types.address | to_c_type }} layer_stat_start = 0;
+    {{ types.stat | to_c_type }} neuron_spikes = 0;
+    {{ types.stat | to_c_type }} neuron_dead = 0;
+    {{ types.stat | to_c_type }} neuron_tiredness = 0;
     if(
-        n_flags[neuron_address] & IS_RECEIVER
+        neuron_address < n_length
+        && !(n_flags[neuron_address] & IS_RECEIVER)
     ){
-        return;
+        // get layer
+        layer_address = n_layer[neuron_address];
+        // field 0 - count spikes between [d_ticks - d_stat_size + 1, d_ticks]
+        if(
+            (n_spike_tick[neuron_address] > d_ticks - d_stat_size
+            && n_spike_tick[neuron_address] <= d_ticks)
+        ){
+            neuron_spikes = 1;
+        }
+        // field 1 - get number of the dead neurons
+        if(n_flags[neuron_address] & IS_DEAD){
+            neuron_dead = 1;
+        }
+        // field 3 - get neurons tiredness
+        // = sum(layer.max_vitality - neuron.vitality)
+        if(
+            l_max_vitality[layer_address] - n_vitality[neuron_address] > 0
+        ){
+            neuron_tiredness
+                = l_max_vitality[layer_address] - n_vitality[neuron_address];
+        }
     }
-    // get layer
-    {{ types.address | to_c_type }} layer_address = n_layer[neuron_address];
-    // start of the stat block for the layer with layer_address
-    {{ types.address | to_c_type }} layer_stat_start
-        = d_stat_fields * layer_address;
-    // field 0 - count spikes between [d_ticks - d_stat_size + 1, d_ticks]
+    spikes[local_id] = neuron_spikes;
+    dead[local_id] = neuron_dead;
+    tiredness[local_id] = neuron_tiredness;
+    reduce_stat(spikes);
+    reduce_stat(dead);
+    reduce_stat(tiredness);
+    // neurons of the layer are stored continuously, so if the first and the
+    // last neurons of the group are in the same layer - all group is in this
+    // layer and only one atomic per field is needed. Receiver neurons are
+    // stored after all layers and n_layer of them is the layer index in the
+    // remote domain, so the shortcut is not used if the group ends with them
     if(
-        (n_spike_tick[neuron_address] > d_ticks - d_stat_size
-        && n_spike_tick[neuron_address] <= d_ticks)
+        !(n_flags[group_end] & IS_RECEIVER)
+        && n_layer[group_start] == n_layer[group_end]
     ){
-        atom_add(
-            &l_stat[
-                /* start of the stat of the layer with layer_address */
-                layer_stat_start
-                /* start of the field */
-                /* + 0 * d_stat_size */
-            ],
-            1
-        );
+        if(local_id){
+            return;
+        }
+        layer_address = n_layer[group_start];
+        neuron_spikes = spikes[0];
+        neuron_dead = dead[0];
+        neuron_tiredness = tiredness[0];
     }
-    // field 1 - get number of the dead neurons
-    if(
-        n_flags[neuron_address] & IS_DEAD
-        && !(n_flags[neuron_address] & IS_RECEIVER)
-    ){
-        atom_add(
-            &l_stat[
-                /* start of the stat of the layer with layer_address */
-                layer_stat_start
-                /* start of the field */
-                + 1/* * d_stat_size*/
-            ],
-            1
-        );
+    layer_stat_start = d_stat_fields * (1 + layer_address);
+    if(neuron_spikes){
+        atom_add(&stat[layer_stat_start], neuron_spikes);
+        atom_add(&stat[0], neuron_spikes);
     }
-    // field 3 - get neurons tiredness
-    // = sum(layer.max_vitality - neuron.vitality)
-    if(
-        l_max_vitality[layer_address] - n_vitality[neuron_address] > 0
-    ){
-        atom_add(
-            &l_stat[
-                /* start of the stat of the layer with layer_address */
-                layer_stat_start
-                /* start of the field */
-                + 3/* * d_stat_size*/
-            ],
-            l_max_vitality[layer_address] - n_vitality[neuron_address]
-        );
+    if(neuron_dead){
+        atom_add(&stat[layer_stat_start + 1], neuron_dead);
+        atom_add(&stat[1], neuron_dead);
+    }
+    if(neuron_tiredness){
+        atom_add(&stat[layer_stat_start + 3], neuron_tiredness);
+        atom_add(&stat[3], neuron_tiredness);
     }
 }
 
 // calc synapses stats
 __kernel void update_synapses_stat(
-    __global {{ types.stat | to_c_type }}           * d_stat,
+    __global {{ types.stat | to_c_type }}           * stat,
+    __const {{ types.address | to_c_type }}         s_length,
     __global {{ types.synapse_level | to_c_type }}  * s_learn,
     __global {{ types.synapse_flags | to_c_type }}  * s_flags
 ) {
+    __local {{ types.stat | to_c_type }} strengthened[{{ config.stat_group_size }}];
+    __local {{ types.stat | to_c_type }} learn[{{ config.stat_group_size }}];
     {{ types.address | to_c_type }} synapse_address = get_global_id(0);
-    // field 2 - count of the synapses with IS_STRENGTHENED flag
-
-    if(
-        s_flags[synapse_address] & IS_STRENGTHENED
-    ){
-        atom_add(&d_stat[2], 1);
+    {{ types.address | to_c_type }} local_id = get_local_id(0);
+    strengthened[local_id] = 0;
+    learn[local_id] = 0;
+    if(synapse_address < s_length){
+        // field 2 - count of the synapses with IS_STRENGTHENED flag
+        if(s_flags[synapse_address] & IS_STRENGTHENED){
+            strengthened[local_id] = 1;
+        }
+        // field 4 - synapse learn level
+        learn[local_id] = s_learn[synapse_address];
     }
-    // field 4 - synapse learn level
-    if(
-        s_learn[synapse_address]
-    ){
-        atom_add(&d_stat[4], s_learn[synapse_address]);
+    reduce_stat(strengthened);
+    reduce_stat(learn);
+    if(local_id){
+        return;
+    }
+    if(strengthened[0]){
+        atom_add(&stat[2], strengthened[0]);
+    }
+    if(learn[0]){
+        atom_add(&stat[4], learn[0]);
     }
 }
 
-// get spiked IS_TRANSMITTER neurons
+// get spiked IS_TRANSMITTER neurons, i_spiked gets compacted list of spiked
+// transmitter_index slots (unordered), i_spiked_count - its length
 __kernel void tick_transmitter_index(
     __global {{ types.address | to_c_type }}        * i_local_address,
     __global {{ types.neuron_flags | to_c_type }}   * i_is_spiked,
-    __global {{ types.neuron_flags | to_c_type }}   * n_flags
+    __global {{ types.neuron_flags | to_c_type }}   * n_flags,
+    __global {{ types.address | to_c_type }}        * i_spiked,
+    __global {{ types.address | to_c_type }}        * i_spiked_count
 ) {
     {{ types.address | to_c_type }} index = get_global_id(0);
     {{ types.address | to_c_type }} neuron_address = i_local_address[index];
     if ((n_flags[neuron_address] & IS_SPIKED)
         && !(n_flags[neuron_address] & IS_DEAD)){
         i_is_spiked[index] = 1;
+        i_spiked[atomic_inc(i_spiked_count)] = index;
     }
     else{
         i_is_spiked[index] = 0;
@@ -373,26 +540,59 @@ __kernel void tick_transmitter_index(
 __kernel void tick_receiver_index(
     __global {{ types.address | to_c_type }}        * i_local_address,
     __global {{ types.neuron_flags | to_c_type }}   * i_is_spiked,
-    __global {{ types.neuron_flags | to_c_type }}   * n_flags
+    __global {{ types.neuron_flags | to_c_type }}   * n_flags{% if config.spikes_list %},
+    /* spikes list */
+    __global {{ types.address | to_c_type }}        * spikes,
+    __global {{ types.address | to_c_type }}        * spikes_count{% endif %}
 ) {
     {{ types.address | to_c_type }} index = get_global_id(0);
     {{ types.address | to_c_type }} neuron_address = i_local_address[index];
     // set IS_SPIKED flag only
     if(i_is_spiked[index]){
+        {% if config.spikes_list %}
+        if(!(n_flags[neuron_address] & IS_SPIKED)){
+            spikes[atomic_inc(spikes_count)] = neuron_address;
+        }
+        {% endif %}
         n_flags[neuron_address] |= IS_SPIKED;
     }
     i_is_spiked[index] = 0;
 }
 
+// set IS_SPIKED flag for received spikes only, r_spikes - unique
+// receiver_index addresses
+__kernel void tick_receiver_spikes(
+    __global {{ types.address | to_c_type }}        * r_spikes,
+    __global {{ types.address | to_c_type }}        * i_local_address,
+    __global {{ types.neuron_flags | to_c_type }}   * n_flags{% if config.spikes_list %},
+    /* spikes list */
+    __global {{ types.address | to_c_type }}        * spikes,
+    __global {{ types.address | to_c_type }}        * spikes_count{% endif %}
+) {
+    {{ types.address | to_c_type }} neuron_address
+        = i_local_address[r_spikes[get_global_id(0)]];
+    {% if config.spikes_list %}
+    if(!(n_flags[neuron_address] & IS_SPIKED)){
+        spikes[atomic_inc(spikes_count)] = neuron_address;
+    }
+    {% endif %}
+    n_flags[neuron_address] |= IS_SPIKED;
+}
+
 {% for type_name in types.allowed_input_data_type_names %}
-// Add level from np_data with type numpy.{{ type_name }} to neuron.level
-__kernel void tick_numpy_input_data_{{ type_name }}(
-    __global {{ type_name | to_c_type  }}         * np_data,
-    __const {{ types.address | to_c_type }}         n_address,
-    __global {{ types.neuron_level | to_c_type }} * n_level
+// Add level from i_data with type numpy.{{ type_name }} to neuron.level. i_data
+// contains data of all input layers, only layers with s_active[slot] are used
+__kernel void tick_input_data_{{ type_name }}(
+    __global {{ type_name | to_c_type  }}         * i_data,
+    __global {{ types.address | to_c_type }}        * i_address,
+    __global {{ types.medium_address | to_c_type }} * i_slot,
+    __global unsigned char                          * s_active,
+    __global {{ types.neuron_level | to_c_type }}   * n_level
 ) {
     {{ types.address | to_c_type }} index = get_global_id(0);
-    n_level[index + n_address] += np_data[index];
+    if(s_active[i_slot[index]]){
+        n_level[i_address[index]] += i_data[index];
+    }
 }
 {% endfor %}
 
@@ -142,12 +142,44 @@ class DomainBase(StatsMixin):
         """
         raise NotImplementedError
 
+    def register_spikes(self, receiver_neuron_index):
+        """
+        Записывает в домен массив пришедших спайков
+        """
+        for index in receiver_neuron_index:
+            self.register_spike(index)
+
     def tick(self):
         """
         Один tick домена.
         """
         raise NotImplementedError
 
+    def run_ticks(self, ticks):
+        """
+        Несколько tick домена подряд.
+        """
+        for _ in xrange(ticks):
+            self.tick()
+
+    def max_lag(self, source_domain_name):
+        """
+        Насколько тиков (config['max_lag']: число или словарь по именам
+        доменов) домен может обгонять домен source_domain_name, спайки
+        которого он получает. None - не ограничено.
+        """
+        max_lag = self.config.get('max_lag')
+        if isinstance(max_lag, dict):
+            return max_lag.get(source_domain_name)
+        return max_lag
+
+    def is_self_contained(self):
+        """
+        True, если домен не обменивается данными (спайки, input/output) с
+        другими доменами и его тики можно выполнять на устройстве подряд.
+        """
+        return False
+
     def register_input_layer_data(self, layer_index, data):
         """
         Регистрирует данные (в виде сериализованного numpy массива),
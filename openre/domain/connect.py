@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Создание синапсов между слоями блоками pre-нейронов с помощью numpy (см.
+Domain.connect_layers) и параллельное создание синапсов в нескольких процессах
+(config['connect_workers'] домена).
+"""
+import numpy as np
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+# примерное количество синапсов, которые создаются за один раз
+CONNECT_BLOCK_SYNAPSES = 1024*1024
+
+# данные для процессов пула, передаются через fork (см. connect_pool)
+_worker_data = None
+
+
+def block_size(width, radius):
+    """
+    Количество pre-нейронов в блоке: целое число строк слоя шириной width,
+    около CONNECT_BLOCK_SYNAPSES синапсов в блоке.
+    """
+    return width * max(
+        1, CONNECT_BLOCK_SYNAPSES // max(1, width * (2 * radius - 1) ** 2))
+
+
+def connect_radius(layer_config, post_layer_config, connect):
+    """
+    Радиус связи connect pre-слоя layer_config с post-слоем post_layer_config.
+    По умолчанию зависит от соотношения размеров слоев.
+    """
+    return connect.get('radius', max(
+        int(1.0 * layer_config['width'] / post_layer_config['width'] / 2),
+        int(1.0 * layer_config['height'] / post_layer_config['height'] / 2)
+    ) + 1)
+
+
+def post_ranges(pre_x, pre_y, shift_x, shift_y, pre_width, pre_height,
+                post_width, post_height, radius):
+    """
+    Для pre-нейронов с координатами pre_x, pre_y (массивы) находит
+    прямоугольники post-нейронов в радиусе radius от центральной точки в
+    post-слое. shift_x, shift_y - сдвиг центральной точки (число или массив).
+    Возвращает from_x, count_x, from_y, count_y.
+    """
+    # Determine central post coordinates of neurons in post layer
+    central_post_x = np.floor(
+        1.0 * pre_x / (pre_width) * (post_width)
+        + (post_width / pre_width / 2.0)
+    ).astype(np.int) + shift_x
+    central_post_y = np.floor(
+        1.0 * pre_y / (pre_height) * (post_height)
+        + (post_height / pre_height / 2.0)
+    ).astype(np.int) + shift_y
+    # for all neurons (in post layer) inside of the radius with given central
+    # point
+    from_x = np.maximum(central_post_x - (radius - 1), 0)
+    to_x = np.minimum(central_post_x + radius, post_width)
+    from_y = np.maximum(central_post_y - (radius - 1), 0)
+    to_y = np.minimum(central_post_y + radius, post_height)
+    return from_x, np.maximum(to_x - from_x, 0), \
+            from_y, np.maximum(to_y - from_y, 0)
+
+
+def connect_pairs(pre_neuron_address, from_x, count_x, from_y, count_y,
+                  post_ownership, is_self_domain, layers_table):
+    """
+    Все пары (pre-нейрон, post-нейрон) для прямоугольников из post_ranges в
+    том же порядке, в котором синапсы создавались по одному: для каждого
+    pre-нейрона post-нейроны по строкам, затем по x.
+    post_ownership - OwnershipIndex post-слоя,
+    is_self_domain - для каждого индекса домена True, если это текущий домен,
+    layers_table - для каждого слоя домена level.address, level.shape[0],
+    layer.x, layer.y.
+    Возвращает адреса pre и post нейронов синапсов в текущем домене, пары с
+    нейронами в других доменах (pre_neuron_address, post_domain_index,
+    post_layer_index, post_x, post_y) и количество синапсов для каждого
+    домена.
+    """
+    count = count_x * count_y
+    total = int(count.sum())
+    pair_pre = np.repeat(np.arange(len(count)), count)
+    pair_pos = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+    pair_count_x = count_x[pair_pre]
+    post_x = from_x[pair_pre] + pair_pos % pair_count_x
+    post_y = from_y[pair_pre] + pair_pos // pair_count_x
+    inf = post_ownership.find(post_x, post_y)
+    # inf[:, 0] - domain index (NOT_OWNED if no domain),
+    # inf[:, 1] - post layer index in domain
+    post_domain_index = inf[:, 0]
+    is_valid = post_domain_index < len(is_self_domain)
+    post_domain_index = np.where(is_valid, post_domain_index, 0)
+    is_local = is_valid & is_self_domain[post_domain_index]
+    domain_synapses = np.bincount(post_domain_index[is_valid],
+                                  minlength=len(is_self_domain))
+    local = np.flatnonzero(is_local)
+    post_layer = layers_table[inf[local, 1]]
+    post_neuron_address = post_layer[:, 0] \
+            + (post_x[local] - post_layer[:, 2]) \
+            + (post_y[local] - post_layer[:, 3]) * post_layer[:, 1]
+    remote = np.flatnonzero(is_valid & ~is_local)
+    return pre_neuron_address[pair_pre[local]], post_neuron_address, (
+        pre_neuron_address[pair_pre[remote]],
+        post_domain_index[remote],
+        inf[remote, 1],
+        post_x[remote],
+        post_y[remote],
+    ), domain_synapses
+
+
+def shared_array(dtype, length):
+    """
+    Массив numpy в разделяемой памяти (доступен процессам пула на запись)
+    """
+    dtype = np.dtype(dtype)
+    return np.frombuffer(RawArray('b', max(1, length) * dtype.itemsize),
+                         dtype=dtype)[:length]
+
+
+def connect_pool(workers, data):
+    """
+    Создает пул из workers процессов для connect_worker. data (массивы и
+    разделяемые массивы для результата) передаются в процессы через fork без
+    копирования.
+    """
+    global _worker_data
+    _worker_data = data
+    try:
+        return multiprocessing.Pool(workers)
+    finally:
+        _worker_data = None
+
+
+def connect_worker(task):
+    """
+    Создает синапсы для блока pre-нейронов block_from:block_to из
+    data['connects'][connect_index]. Синапсы в текущем домене записываются в
+    data['pre'] и data['post'] начиная с offset, возвращает их количество,
+    пары с нейронами в других доменах и количество синапсов для каждого
+    домена.
+    """
+    connect_index, block_from, block_to, offset = task
+    data = _worker_data
+    pre_neuron_address, ranges, post_ownership \
+            = data['connects'][connect_index]
+    pre, post, remote, domain_synapses = connect_pairs(
+        pre_neuron_address[block_from:block_to],
+        *[value[block_from:block_to] for value in ranges] + [
+            post_ownership, data['is_self_domain'], data['layers_table']])
+    data['pre'][offset:offset + len(pre)] = pre
+    data['post'][offset:offset + len(post)] = post
+    return len(pre), remote, domain_synapses
+
+
+def test_connect_workers():
+    from openre import OpenRE
+    from openre.helpers import randshift
+    from functools import partial
+    from copy import deepcopy
+    import random
+    global CONNECT_BLOCK_SYNAPSES
+
+    def layer(name, width, height, connect=None):
+        ret = {'name': name, 'threshold': 20000, 'relaxation': 1000,
+               'width': width, 'height': height}
+        if connect:
+            ret['connect'] = connect
+        return ret
+
+    config = {
+        'layers': [
+            layer('V1', 40, 30, [{'name': 'V2', 'radius': 2, 'shift': [0, 0]},
+                                 {'name': 'V1', 'radius': 3,
+                                  'shift': [-1, 2]}]),
+            layer('V2', 20, 20, [{'name': 'V1'}]),
+        ],
+        'domains': [
+            {'name': 'D1', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V1', 'shape': [0, 0, 40, 20]}, {'name': 'V2'}]},
+            {'name': 'D2', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V1', 'shape': [0, 20, 40, 10]}]},
+        ],
+    }
+    random_config = {
+        'layers': [
+            layer('V1', 30, 25, [{'name': 'V1', 'radius': 2, 'shift': [
+                partial(randshift, 1, 4), partial(randshift, 0, 2)]}]),
+        ],
+        'domains': [
+            {'name': 'D1', 'device': {'type': 'Dummy'},
+             'layers': [{'name': 'V1'}]},
+        ],
+    }
+
+    def synapses(config, workers):
+        config = deepcopy(config)
+        for domain in config['domains']:
+            domain['connect_workers'] = workers
+        random.seed(1)
+        ore = OpenRE(config)
+        ore.deploy()
+        return [(
+            list(domain.synapses.pre.data[:len(domain.synapses)]),
+            list(domain.synapses.post.data[:len(domain.synapses)]),
+            domain.synapse_count_by_domain,
+            list(domain.neurons.flags.data),
+            list(domain.receiver_index.remote_address.data),
+        ) for domain in ore.domains]
+
+    block_synapses = CONNECT_BLOCK_SYNAPSES
+    # several blocks in each connect
+    CONNECT_BLOCK_SYNAPSES = 500
+    try:
+        for test_config in [config, random_config]:
+            expected = synapses(test_config, 0)
+            assert len(expected[0][0])
+            assert synapses(test_config, 1) == expected
+            assert synapses(test_config, 3) == expected
+    finally:
+        CONNECT_BLOCK_SYNAPSES = block_synapses
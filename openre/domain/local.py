@@ -15,14 +15,18 @@ import logging
 import uuid
 import random
 from copy import deepcopy
-import math
-from openre.index import SynapsesIndex, TransmitterIndex, ReceiverIndex, \
-        OutputIndex
+from openre.index import SynapsesIndex, SynapsesCSRIndex, TransmitterIndex, \
+        ReceiverIndex, OutputIndex, create_ownership_indexes
 from openre import device
 import numpy as np
 from openre.domain.packets import TransmitterVector, ReceiverVector, \
-        SpikesVector
+        decode_spikes
 from openre.domain.remote import RemoteDomainBase
+from openre.domain.sender import Sender
+from openre.domain.plan import plan_net
+from openre.domain.connect import block_size, connect_radius, post_ranges, \
+        connect_pairs, shared_array, connect_pool, connect_worker
+import multiprocessing
 import time
 import datetime
 
@@ -60,6 +64,44 @@ class Domain(DomainBase):
                           одноразово усиливаться (долговременная память).
     Жеательно что бы выполнялось условие:
         0 <= spike_learn_threshold <= spike_forget_threshold <= types.tick.max
+    self.config['synapses_index'] - формат индексов синапсов: 'list' (по
+                                    умолчанию, цепочки key/value) или 'csr'
+                                    (синапсы отсортированы по pre-нейрону,
+                                    обход непрерывными диапазонами offset).
+    self.config['accumulation'] - как спайки меняют уровень post-нейронов:
+                                  'push' (по умолчанию, atomic_add для
+                                  каждого синапса спайкнувшего нейрона) или
+                                  'pull' (каждый post-нейрон суммирует вклады
+                                  своих синапсов без atomic, выгоднее при
+                                  большой конвергенции и частых спайках).
+    self.config['spikes_zlib'] - уровень сжатия zlib (1-9) пакетов спайков,
+                                 которые другие домены отправляют в этот
+                                 домен по сети. 0 (по умолчанию) - не
+                                 сжимать.
+    self.config['max_lag'] - на сколько тиков домен может обгонять удаленные
+                             домены, от которых получает спайки (число или
+                             словарь {имя домена: число}). Если обогнал -
+                             tick() ждет, пока не придут спайки (или пустой
+                             пакет) нужного тика. По умолчанию не ограничено.
+                             Для взаимно связанных доменов должно быть >= 1.
+    self.config['pipeline'] - если True, то спайки тика загружаются с
+                              устройства и отправляются в удаленные домены в
+                              фоновом потоке, пока устройство считает
+                              tick_synapses этого тика и tick_neurons
+                              следующего. Если спайки нужны локальным
+                              доменам, то они загружаются сразу и локальные
+                              домены получают их в том же тике, что и без
+                              pipeline. По умолчанию False.
+    self.config['pub'] - если задан, то агент домена публикует спайки и NP
+                         данные через свой PUB сокет, и подписчики
+                         подключаются к нему напрямую, а не через proxy
+                         (ключи host, port, public_host - см.
+                         openre.agent.domain.domain.Agent.pub_endpoint).
+    self.config['connect_workers'] - количество процессов для создания
+                                     синапсов (см. connect_layers_parallel).
+                                     Сеть не зависит от количества процессов.
+                                     По умолчанию синапсы создаются в текущем
+                                     процессе.
     """
     def __init__(self, config, net, domain_index):
         super(Domain, self).__init__(config, net, domain_index)
@@ -116,6 +158,11 @@ class Domain(DomainBase):
 
         self.transmitter_index = TransmitterIndex()
         self.receiver_index = ReceiverIndex()
+        # последний тик, пришедший от удаленных доменов (source index -> tick)
+        self.input_ticks = {}
+        self._lag_sources = None
+        # фоновая отправка спайков (config['pipeline'])
+        self.sender = None
 
         self.output_index = OutputIndex()
 
@@ -170,6 +217,16 @@ class Domain(DomainBase):
         # allocate synapses buffer in memory
         self.synapses_metadata = SynapsesMetadata(0)
         self.synapses.add(self.synapses_metadata)
+        if self.config.get('connect_workers'):
+            # connect_layers_parallel allocates shared memory for synapses
+            return
+        # allocate pre and post once for all synapses of the domain (exact
+        # or upper bound, excess is removed in post_deploy_synapses)
+        length = plan_net(self.net.config, self.name)['domains'][self.name][
+            'synapses']
+        if length:
+            self.synapses_metadata.pre.resize(portion=length)
+            self.synapses_metadata.post.resize(portion=length)
 
     def deploy_synapses_async(self):
         """
@@ -218,13 +275,23 @@ class Domain(DomainBase):
         """
         Create indexes
         """
+        synapses_index_class = SynapsesIndex
+        if self.config.get('synapses_index') == 'csr':
+            synapses_index_class = SynapsesCSRIndex
+            # physically sort synapses by pre-neuron, so post-synapses of
+            # the neuron are stored in one contiguous block
+            logging.debug('Sort synapses by pre-neuron')
+            order = np.argsort(self.synapses.pre.data, kind='mergesort')
+            for field, _ in self.synapses.fields:
+                vector = getattr(self.synapses, field)
+                vector.data[:] = vector.data[order]
         # create pre-neuron - synapse index
         logging.debug('Create pre-neuron - synapse index')
-        self.pre_synapse_index = SynapsesIndex(
+        self.pre_synapse_index = synapses_index_class(
             len(self.neurons), self.synapses.pre)
         # create post-neuron - synapse index
         logging.debug('Create post-neuron - synapse index')
-        self.post_synapse_index = SynapsesIndex(
+        self.post_synapse_index = synapses_index_class(
             len(self.neurons), self.synapses.post)
         self.transmitter_index.shrink()
         self.receiver_index.shrink()
@@ -269,8 +336,6 @@ class Domain(DomainBase):
         self.random.seed(self.seed)
         layer_config_by_name = {}
         total_synapses = self.synapse_count_by_domain
-        # cache
-        self_connect_neurons = self.connect_neurons
         for layer_config in self.net.config['layers']:
             layer_config_by_name[layer_config['name']] = layer_config
         domain_index_to_name = []
@@ -279,49 +344,33 @@ class Domain(DomainBase):
             total_synapses[domain['name']] = 0
             if domain['name'] == self.name:
                 pre_domain_index = domain_index
-        # cache neuron -> domain and neuron -> layer in domain
-        if 'layer' not in self.cache:
-            self.cache['layer'] = {}
-            for layer_config in self.net.config['layers']:
-                # heihgt x width x z,
-                # where z == 0 is domain index in net and
-                #       z == 1 is layer index in domain
-                self.cache['layer'][layer_config['name']] = \
-                    np.zeros(
-                        (layer_config['height'], layer_config['width'], 2),
-                        dtype=np.int
-                    )
-                self.cache['layer'][layer_config['name']] \
-                        .fill(np.iinfo(np.int).max)
-            for domain_index, domain in enumerate(self.net.config['domains']):
-                layer_index = -1
-                for layer in domain['layers']:
-                    layer_index += 1
-                    layer = deepcopy(layer)
-                    layer_config = layer_config_by_name[layer['name']]
-                    shape = layer.get(
-                        'shape',
-                        [0, 0, layer_config['width'], layer_config['height']]
-                    )
-                    if shape[0] < 0:
-                        shape[0] = 0
-                    if shape[1] < 0:
-                        shape[1] = 0
-                    if shape[0] + shape[2] > layer_config['width']:
-                        shape[2] = layer_config['width'] - shape[0]
-                    if shape[1] + shape[3] > layer_config['height']:
-                        shape[3] = layer_config['height'] - shape[1]
-                    layer_cache = \
-                            self.cache['layer'][layer_config['name']]
-                    for y in xrange(shape[1], shape[1] + shape[3]):
-                        layer_cache_y = layer_cache[y]
-                        for x in xrange(shape[0], shape[0] + shape[2]):
-                            layer_cache_y[x][0] = domain_index
-                            layer_cache_y[x][1] = layer_index
+        # neuron -> domain and neuron -> layer in domain
+        if 'ownership' not in self.cache:
+            self.cache['ownership'] = create_ownership_indexes(self.net.config)
 
         # start connecting
+        # domain index -> True if domain is self
+        is_self_domain = np.array(
+            [name == self.name for name in domain_index_to_name],
+            dtype=bool)
+        # post layer index in domain -> level.address, level.shape[0],
+        # layer.x, layer.y
+        layers_table = np.array([
+            [
+                layer.neurons_metadata.level.address,
+                layer.neurons_metadata.level.shape[0],
+                layer.x,
+                layer.y,
+            ] for layer in self.layers
+        ], dtype=np.int).reshape((-1, 4))
+        # other domains in this process (not RemoteDomainBase) use the same
+        # random generator as random shift when create receiver neurons
+        is_shared_random = any(
+            domain is not self and isinstance(domain, Domain)
+            for domain in self.net.domains
+        )
+        connects = []
         pre_layer_index = -1
-        async_time = time.time()
         for layer_config in self.layers_config:
             pre_layer_index += 1
             # no connections with other layers
@@ -329,134 +378,254 @@ class Domain(DomainBase):
                 continue
             # pre layer. Connect only neurons in this domain
             layer = layer_config['layer']
-            # precache method
-            layer_to_address = layer.neurons_metadata.level.to_address
+            pre_level = layer.neurons_metadata.level
+            # pre neurons in the same order as the synapses was created one
+            # by one: by rows, then by x
+            pre_y, pre_x = np.mgrid[
+                layer.y:layer.y + layer.height,
+                layer.x:layer.x + layer.width
+            ]
+            pre_y = pre_y.ravel()
+            pre_x = pre_x.ravel()
+            pre_neuron_address = pre_level.address \
+                    + (pre_x - layer.x) \
+                    + (pre_y - layer.y) * pre_level.shape[0]
             for connect in layer_config.get('connect', []):
-                shift = connect.get('shift', [0, 0])
-                if callable(shift[0]):
-                    def shift_x():
-                        return shift[0]()
-                else:
-                    def shift_x():
-                        return shift[0]
-                if callable(shift[1]):
-                    def shift_y():
-                        return shift[1]()
-                else:
-                    def shift_y():
-                        return shift[1]
-
                 post_layer_config = layer_config_by_name[connect['name']]
-                post_info_cache = self.cache['layer'][post_layer_config['name']]
-                radius = connect.get('radius', max(
-                    int(1.0 * layer_config['width'] \
-                        / post_layer_config['width'] / 2),
-                    int(1.0 * layer_config['height'] \
-                        / post_layer_config['height'] / 2)
-                ) + 1)
-                def pre_layer_coords():
-                    for pre_y in xrange(layer.y, layer.y + layer.height):
-                        for pre_x in xrange(layer.x, layer.x + layer.width):
-                            yield pre_y, pre_x
-                for pre_y, pre_x in pre_layer_coords():
-                    # Determine post x coordinate of neuron in post layer.
-                    # Should be recalculated for every y because of possible
-                    # random shift
-                    if time.time() - async_time > 0.1:
-                        async_time = time.time()
-                        yield (pre_y, layer.width)
-                    pre_neuron_address = layer_to_address(
-                        pre_x - layer.x,
-                        pre_y - layer.y
-                    )
-                    central_post_x = int(math.floor(
-                        1.0 * pre_x / (layer_config['width']) \
-                        * (post_layer_config['width'])
-                        + (post_layer_config['width'] \
-                           / layer_config['width'] / 2.0)
-                    )) + shift_x()
-                    # determine post y coordinate of neuron in post layer
-                    central_post_y = int(math.floor(
-                        1.0 * pre_y / (layer_config['height']) \
-                        * (post_layer_config['height'])
-                        + (post_layer_config['height'] \
-                           / layer_config['height'] / 2.0)
-                    )) + shift_y()
-                    # for all neurons (in post layer) inside of the
-                    # connect['radius'] with given central point
-                    post_from_range_x = central_post_x - (radius - 1)
-                    post_to_range_x = central_post_x + (radius - 1) + 1
-                    if post_from_range_x < 0:
-                        post_from_range_x = 0
-                    if post_from_range_x >= post_layer_config['width']:
-                        continue
-                    if post_to_range_x < 0:
-                        continue
-                    if post_to_range_x > post_layer_config['width']:
-                        post_to_range_x = post_layer_config['width']
-
-                    post_from_range_y = central_post_y - (radius - 1)
-                    post_to_range_y = central_post_y + (radius - 1) + 1
-                    if post_from_range_y < 0:
-                        post_from_range_y = 0
-                    if post_from_range_y >= post_layer_config['height']:
-                        continue
-                    if post_to_range_y < 0:
-                        continue
-                    if post_to_range_y > post_layer_config['height']:
-                        post_to_range_y = post_layer_config['height']
-                    def post_layer_coords():
-                        # for neurons in post layer
-                        for post_y in xrange(
-                            post_from_range_y,
-                            post_to_range_y
-                        ):
-                            post_info_cache_y = post_info_cache[post_y]
-                            for post_x in xrange(
-                                post_from_range_x,
-                                post_to_range_x
-                            ):
-                                inf = post_info_cache_y[post_x]
-                                yield post_x, post_y, inf
-                    for post_x, post_y, inf in post_layer_coords():
-                        try:
-                            # inf[0] - domain index
-                            post_info_domain_name = domain_index_to_name[inf[0]]
-                        except IndexError:
-                            continue
-                        # actually create connections
-                        if post_info_domain_name == self.name:
-                            # inf[1] - post layer index in domain
-                            post_layer = self.layers[inf[1]]
-                            self.synapse_address += 1
-                            self_connect_neurons(
-                                pre_neuron_address,
-                                post_layer.neurons_metadata.level.to_address(
-                                    post_x - post_layer.x,
-                                    post_y - post_layer.y
-                                ),
-                                self.synapse_address
-                            )
-                        else:
-                            # connect neurons with other domains
-                            self.connect_remote_neurons(
-                                pre_domain_index,
-                                pre_layer_index,
-                                pre_neuron_address,
-                                int(inf[0]), # post domain index
-                                int(inf[1]), # post layer index
-                                post_x,
-                                post_y
-                            )
-                        total_synapses[post_info_domain_name] += 1
+                radius = connect_radius(layer_config, post_layer_config,
+                                        connect)
+                connects.append({
+                    'pre_layer_index': pre_layer_index,
+                    'layer_config': layer_config,
+                    'post_layer_config': post_layer_config,
+                    'post_ownership':
+                        self.cache['ownership'][post_layer_config['name']],
+                    'shift': connect.get('shift', [0, 0]),
+                    'radius': radius,
+                    'pre_x': pre_x,
+                    'pre_y': pre_y,
+                    'pre_neuron_address': pre_neuron_address,
+                    'block_size': block_size(layer.width, radius),
+                })
+        workers = self.config.get('connect_workers')
+        if workers and is_shared_random \
+           and [connect for connect in connects
+                if filter(callable, connect['shift'])]:
+            # keep order of random calls between shift and receiver neurons
+            # in other domains
+            workers = 0
+        if workers:
+            ret = self.connect_layers_parallel(
+                connects, workers, pre_domain_index, is_self_domain,
+                layers_table)
+        else:
+            ret = self.connect_layers_blocks(
+                connects, pre_domain_index, is_self_domain, layers_table,
+                is_shared_random)
+        for res in ret:
+            yield res
+
+    def connect_shift(self, connect, count):
+        """
+        Сдвиг центральной точки в post-слое для count pre-нейронов. Если сдвиг
+        задан функцией, то она вызывается для каждого pre-нейрона: сначала
+        для x, потом для y.
+        """
+        shift = connect['shift']
+        if not callable(shift[0]) and not callable(shift[1]):
+            return shift[0], shift[1]
+        shift_x = shift[0] if callable(shift[0]) else lambda: shift[0]
+        shift_y = shift[1] if callable(shift[1]) else lambda: shift[1]
+        ret = np.array(
+            [(shift_x(), shift_y()) for _ in xrange(count)],
+            dtype=np.int
+        ).reshape((-1, 2))
+        return ret[:, 0], ret[:, 1]
+
+    def connect_post_ranges(self, connect, block_from, block_to):
+        """
+        post_ranges для блока pre-нейронов connect
+        """
+        layer_config = connect['layer_config']
+        post_layer_config = connect['post_layer_config']
+        pre_x = connect['pre_x'][block_from:block_to]
+        shift_x, shift_y = self.connect_shift(connect, len(pre_x))
+        return post_ranges(
+            pre_x,
+            connect['pre_y'][block_from:block_to],
+            shift_x,
+            shift_y,
+            layer_config['width'],
+            layer_config['height'],
+            post_layer_config['width'],
+            post_layer_config['height'],
+            connect['radius']
+        )
+
+    def connect_layers_blocks(self, connects, pre_domain_index,
+                              is_self_domain, layers_table, is_shared_random):
+        """
+        Создаем синапсы блоками pre-нейронов в текущем процессе
+        """
+        total_synapses = self.synapse_count_by_domain
+        domain_index_to_name = [
+            domain['name'] for domain in self.net.config['domains']]
+        async_time = time.time()
+        for connect in connects:
+            size = connect['block_size']
+            if is_shared_random and filter(callable, connect['shift']):
+                # keep order of random calls between shift and receiver
+                # neurons in other domains
+                size = 1
+            for block_from in xrange(0, len(connect['pre_x']), size):
+                if time.time() - async_time > 0.1:
+                    async_time = time.time()
+                    yield (int(connect['pre_y'][block_from]),
+                           connect['layer_config']['layer'].width)
+                block_to = block_from + size
+                pre, post, remote, domain_synapses = connect_pairs(
+                    connect['pre_neuron_address'][block_from:block_to],
+                    *self.connect_post_ranges(connect, block_from, block_to)
+                    + (connect['post_ownership'], is_self_domain,
+                       layers_table)
+                )
+                for domain_index, count in enumerate(domain_synapses):
+                    total_synapses[domain_index_to_name[domain_index]] \
+                            += int(count)
+                # actually create connections
+                if len(pre):
+                    self.connect_neurons_array(
+                        pre, post, self.synapse_address + 1)
+                    self.synapse_address += len(pre)
+                # connect neurons with other domains
+                self.connect_remote_array(
+                    pre_domain_index, connect['pre_layer_index'], remote)
+
+    def connect_layers_parallel(self, connects, workers, pre_domain_index,
+                                is_self_domain, layers_table):
+        """
+        Создаем синапсы блоками pre-нейронов в workers процессах. Процессы
+        пишут синапсы в разделяемую память, которая потом без копирования
+        становится данными self.synapses.pre и self.synapses.post. Сдвиги
+        считаются в текущем процессе в том же порядке, что и в
+        connect_layers_blocks, поэтому сеть не зависит от количества
+        процессов.
+        """
+        total_synapses = self.synapse_count_by_domain
+        domain_index_to_name = [
+            domain['name'] for domain in self.net.config['domains']]
+        # (connect, block_from, block_to, offset in shared arrays)
+        tasks = []
+        pool_connects = []
+        offset = 0
+        for connect_index, connect in enumerate(connects):
+            ranges = self.connect_post_ranges(
+                connect, 0, len(connect['pre_x']))
+            count = ranges[1] * ranges[3]
+            size = connect['block_size']
+            for block_from in xrange(0, len(count), size):
+                block_to = block_from + size
+                # upper bound - all pairs in block, including other domains
+                block_count = int(count[block_from:block_to].sum())
+                if block_count:
+                    tasks.append(
+                        (connect_index, block_from, block_to, offset))
+                    offset += block_count
+            pool_connects.append((
+                connect['pre_neuron_address'],
+                ranges,
+                connect['post_ownership'],
+            ))
+        # synapses from other domains, created before this call
+        existing = self.synapse_address + 1
+        pre = shared_array(self.synapses.pre.data.dtype, existing + offset)
+        post = shared_array(self.synapses.post.data.dtype, existing + offset)
+        logging.debug('Create synapses in %s processes', workers)
+        pool = connect_pool(workers, {
+            'connects': pool_connects,
+            'is_self_domain': is_self_domain,
+            'layers_table': layers_table,
+            'pre': pre[existing:],
+            'post': post[existing:],
+        })
+        try:
+            results = pool.imap(connect_worker, tasks)
+            address = existing
+            async_time = time.time()
+            for task_index, task in enumerate(tasks):
+                while True:
+                    try:
+                        count, remote, domain_synapses = results.next(0.1)
+                        break
+                    except multiprocessing.TimeoutError:
+                        yield (task_index, len(tasks))
+                connect = connects[task[0]]
+                for domain_index, domain_count in enumerate(domain_synapses):
+                    total_synapses[domain_index_to_name[domain_index]] \
+                            += int(domain_count)
+                # move synapses of the block right after the previous block
+                block_from = existing + task[3]
+                pre[address:address + count] \
+                        = pre[block_from:block_from + count]
+                post[address:address + count] \
+                        = post[block_from:block_from + count]
+                address += count
+                # connect neurons with other domains
+                self.connect_remote_array(
+                    pre_domain_index, connect['pre_layer_index'], remote)
+                if time.time() - async_time > 0.1:
+                    async_time = time.time()
+                    yield (task_index, len(tasks))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        # existing synapses and synapses from other domains, created while
+        # workers was running
+        synapses_vector = self.synapses
+        received = self.synapse_address + 1 - existing
+        if address + received > len(pre):
+            pre = np.concatenate([pre[:address], np.zeros(
+                address + received - len(pre), dtype=pre.dtype)])
+            post = np.concatenate([post[:address], np.zeros(
+                address + received - len(post), dtype=post.dtype)])
+        pre[:existing] = synapses_vector.pre.data[:existing]
+        post[:existing] = synapses_vector.post.data[:existing]
+        pre[address:address + received] \
+                = synapses_vector.pre.data[existing:existing + received]
+        post[address:address + received] \
+                = synapses_vector.post.data[existing:existing + received]
+        synapses_vector.pre.adopt(pre)
+        synapses_vector.post.adopt(post)
+        self.synapse_address = address + received - 1
+
+    def connect_remote_array(self, pre_domain_index, pre_layer_index, remote):
+        """
+        Соединяем локальные нейроны с нейронами в других доменах.
+        remote - массивы pre_neuron_address, post_domain_index,
+        post_layer_index, post_x, post_y (см. connect_pairs)
+        """
+        for pre_neuron_address, post_domain_index, post_layer_index, \
+                post_x, post_y in zip(*[value.tolist() for value in remote]):
+            self.connect_remote_neurons(
+                pre_domain_index,
+                pre_layer_index,
+                pre_neuron_address,
+                post_domain_index,
+                post_layer_index,
+                post_x,
+                post_y
+            )
 
     def create_neurons(self):
         """
         Создаем физически нейроны в ранее созданном векторе
         """
         logging.debug('Create neurons')
+        # seed from random, so random.seed() gives the same network
+        random_state = np.random.RandomState(random.getrandbits(32))
         for layer in self.layers:
-            layer.create_neurons()
+            layer.create_neurons(random_state)
 
     def connect_neurons(self, pre_address, post_address, synapse_address):
         """
@@ -474,6 +643,23 @@ class Domain(DomainBase):
         synapses_vector.pre.data[synapse_address] = pre_address
         synapses_vector.post.data[synapse_address] = post_address
 
+    def connect_neurons_array(self, pre_address, post_address,
+                              synapse_address):
+        """
+        Соединяем нейроны из массивов pre_address и post_address синапсами с
+        адресами synapse_address, synapse_address + 1, ...
+        """
+        synapses_vector = self.synapses
+        synapses_metadata = self.synapses_metadata
+        last_address = synapse_address + len(pre_address) - 1
+        while last_address >= synapses_metadata.pre.length:
+            synapses_metadata.pre.resize()
+            synapses_metadata.post.resize()
+        synapses_vector.pre.data[synapse_address:last_address + 1] \
+                = pre_address
+        synapses_vector.post.data[synapse_address:last_address + 1] \
+                = post_address
+
     def connect_remote_neurons(
         self,
         pre_domain_index, pre_layer_index, pre_neuron_address,
@@ -608,23 +794,74 @@ class Domain(DomainBase):
         # step 4
         self.device.tick_transmitter_index(self)
         # step 5
-        self.transmitter_index.is_spiked.from_device(self.device)
-        index = self.transmitter_index
-        domains = self.net.domains
-        remote_domain_data = index.remote_domain.data
-        remote_receiver_index_data = index.remote_receiver_index.data
-        register_spike = [domain.register_spike for domain in domains]
-        for i, is_spiked in enumerate(index.is_spiked.data):
-            if not is_spiked:
-                continue
-            receiver_neuron_index = remote_receiver_index_data[i]
-            register_spike[remote_domain_data[i]](receiver_neuron_index)
+        ticks = self.ticks
         for post_domain in self.net.domains:
+            if not isinstance(post_domain, Domain):
+                post_domain.prepare_spike_pack()
+        if self.config.get('pipeline'):
+            if self.sender is None:
+                self.sender = Sender(name='%s sender' % self.name)
+            if self.has_local_post_domains():
+                # local domains receive spikes in this tick, only remote
+                # domains are sent in the background
+                self.device.sync()
+                spiked = self.device.transmitter_spikes(self)
+                self.fan_out_spikes(spiked, ticks, is_local=True)
+                self.sender.send(
+                    lambda: self.fan_out_spikes(spiked, ticks,
+                                                is_local=False))
+                return
+            # spikes are downloaded and sent in the background while the
+            # device runs tick_synapses and the next tick_neurons
+            download = self.device.transmitter_spikes_async(self)
+            self.sender.send(
+                lambda: self.fan_out_spikes(download(), ticks),
+                release=getattr(download, 'release', None))
+            return
+        # before this point the tick is only enqueued to the device
+        self.device.sync()
+        # only spiked transmitters are downloaded from the device
+        self.fan_out_spikes(self.device.transmitter_spikes(self), ticks)
+
+    def has_local_post_domains(self):
+        """
+        True, если transmitter нейроны домена связаны с доменами в этом же
+        процессе
+        """
+        domains = self.net.domains
+        for domain_index in self.transmitter_index.fan_out():
+            if isinstance(domains[domain_index], Domain):
+                return True
+        return False
+
+    def fan_out_spikes(self, spiked, ticks, is_local=None):
+        """
+        Отправляем спайки transmitter нейронов spiked, случившиеся в тике
+        ticks, в другие домены. is_local=True - только в домены в этом же
+        процессе, False - только в удаленные, None - во все.
+        """
+        domains = self.net.domains
+        for domain_index, receiver_neuron_index \
+                in self.transmitter_index.spikes_by_domain(spiked):
+            post_domain = domains[domain_index]
+            if is_local is None \
+               or is_local == isinstance(post_domain, Domain):
+                post_domain.register_spikes(receiver_neuron_index)
+        if is_local:
+            return
+        for post_domain in domains:
             if post_domain != self:
                 # если post_domain локальный, то ничего не произойдет
                 # если post_domain удаленный и у него накопились спайки,
                 # то он опубликует эти спайки
-                post_domain.register_spike_pack()
+                post_domain.register_spike_pack(tick=ticks)
+
+    def wait_spikes(self):
+        """
+        Ждем, пока фоновый поток отправит все спайки (config['pipeline'])
+        """
+        if self.sender is not None:
+            self.sender.wait()
 
     def receive_spikes(self):
         """
@@ -632,28 +869,27 @@ class Domain(DomainBase):
         его в устройство (device).
         """
         # step 3
-        # send to device info about new spikes
-        self.receiver_index.is_spiked.to_device(self.device)
-        self.device.tick_receiver_index(self)
-        # get is_spiked filled with 0
-        self.receiver_index.is_spiked.from_device(self.device)
+        # send to device only the spikes received since the last tick
+        spikes = self.receiver_index.pop_spikes()
+        if not len(spikes):
+            return
+        # device clears its own state, no need to download is_spiked
+        self.device.tick_receiver_spikes(self, spikes)
 
-    def register_spike_pack(self, bytes=None):
+    def register_spike_pack(self, bytes=None, source_index=None, tick=None):
         """
-        Обрабатываем спайки из удаленных доменов
+        Обрабатываем спайки из удаленных доменов. source_index и tick -
+        домен и его тик, в котором спайки были отправлены (пакет без спайков
+        только сообщает тик).
         """
         if not bytes:
             return
-        packet = SpikesVector()
-        packet.from_bytes(bytes)
-        self.stat_inc('spikes_received', packet.length)
-        # speedup for commented version
-        #for pos in range(packet.length):
-        #    self.register_spike(
-        #        packet.receiver_neuron_index.data[pos],
-        #    )
-        self.receiver_index.is_spiked.data[packet.receiver_neuron_index.data] \
-                = 1
+        spikes = decode_spikes(bytes)
+        self.stat_inc('spikes_received', len(spikes))
+        self.stat_inc('spikes_bytes_received', len(bytes))
+        self.register_input_tick(source_index, tick, len(spikes))
+        if len(spikes):
+            self.receiver_index.register_spikes(spikes)
 
 
     def register_spike(self, receiver_neuron_index):
@@ -661,7 +897,13 @@ class Domain(DomainBase):
         Записывает в домен пришедший спайк
         """
         # step 2
-        self.receiver_index.is_spiked.data[receiver_neuron_index] = 1
+        self.receiver_index.register_spikes(receiver_neuron_index)
+
+    def register_spikes(self, receiver_neuron_index):
+        """
+        Записывает в домен массив пришедших спайков
+        """
+        self.receiver_index.register_spikes(receiver_neuron_index)
 
     def register_input_layer_data(self, layer_index, data):
         """
@@ -773,6 +1015,9 @@ class Domain(DomainBase):
                   f(neuron.tick - pre.tick), либо на фиксированное значение
 
         """
+        if self.is_lagging():
+            self.stat_inc('lag_waits')
+            return False
         # step 0
         self.ticks += 1
         self.stat_set('ticks', self.ticks)
@@ -784,6 +1029,245 @@ class Domain(DomainBase):
         self.send_spikes()
         # step 6
         self.device.tick_synapses(self)
+        return True
+
+    def lag_sources(self):
+        """
+        {индекс удаленного домена: max_lag} для доменов, от которых приходят
+        спайки и для которых задан config['max_lag']
+        """
+        if self._lag_sources is None:
+            self._lag_sources = {}
+            if self.config.get('max_lag') is None:
+                return self._lag_sources
+            for source_index in self.receiver_index.data.keys():
+                source = self.net.domains[source_index]
+                if isinstance(source, Domain):
+                    # local domains tick in lockstep
+                    continue
+                max_lag = self.max_lag(source.name)
+                if max_lag is not None:
+                    self._lag_sources[source_index] = max_lag
+        return self._lag_sources
+
+    def is_lagging(self):
+        """
+        True, если следующий тик обгонит какой либо из входных удаленных
+        доменов больше чем на max_lag тиков
+        """
+        for source_index, max_lag in self.lag_sources().iteritems():
+            if self.ticks - self.input_ticks.get(source_index, 0) >= max_lag:
+                return True
+        return False
+
+    def register_input_tick(self, source_index, tick, spikes=0):
+        """
+        Запоминаем тик удаленного домена source_index, в котором были
+        отправлены пришедшие данные. spikes - сколько в них было спайков.
+        """
+        if source_index is None or tick is None:
+            return
+        source_index = int(source_index)
+        tick = int(tick)
+        if tick > self.input_ticks.get(source_index, 0):
+            self.input_ticks[source_index] = tick
+        # данные тика tick применятся в тике self.ticks + 1, в идеале - в
+        # том же тике
+        late = self.ticks + 1 - tick
+        source_name = self.net.domains[source_index].name
+        self.stat_set(['input_lag', source_name], late)
+        if late > 0 and spikes:
+            self.stat_inc('late_spikes', spikes)
+            self.stat_inc(['late_spikes_from', source_name], spikes)
+
+    def is_self_contained(self):
+        """
+        Домен без transmitter/receiver нейронов, без output и input слоев и
+        не IO устройство - его тики не зависят от других доменов.
+        """
+        if isinstance(self.device, device.IOBase):
+            return False
+        if len(self.transmitter_index.local_address) \
+           or len(self.receiver_index.local_address) \
+           or len(self.output_index.address):
+            return False
+        for layer in self.layers:
+            if layer.config.get('input'):
+                return False
+        return True
+
+    def run_ticks(self, ticks):
+        """
+        ticks тиков домена. Если домен самодостаточный, то тики ставятся
+        в очередь устройства подряд, без обращений к хосту между ними
+        (кроме сбора статистики раз в self.config['stat_size'] тиков).
+        """
+        if not self.is_self_contained():
+            return super(Domain, self).run_ticks(ticks)
+        self.device.run_ticks(self, ticks)
+        self.device.sync()
+        self.stat_set('ticks', self.ticks)
 
     def clean(self):
+        if self.sender is not None:
+            self.sender.stop()
+            self.sender = None
         self.device.clean()
+
+
+def test_connect_layers():
+    """
+    Синапсы, transmitter и receiver индексы те же, что при соединении
+    нейронов по одной паре (pre, post)
+    """
+    from openre import OpenRE
+    from openre.helpers import randshift
+    from functools import partial
+    import math
+
+    def connect_layers_by_pairs(self):
+        # reference: post neurons one by one for each pre neuron
+        total_synapses = self.synapse_count_by_domain
+        layer_config_by_name = {}
+        for layer_config in self.net.config['layers']:
+            layer_config_by_name[layer_config['name']] = layer_config
+        owner = {}
+        domain_index_to_name = []
+        for domain_index, domain in enumerate(self.net.config['domains']):
+            domain_index_to_name.append(domain['name'])
+            total_synapses[domain['name']] = 0
+            if domain['name'] == self.name:
+                pre_domain_index = domain_index
+            for layer_index, layer in enumerate(domain['layers']):
+                layer_config = layer_config_by_name[layer['name']]
+                x, y, width, height = layer.get(
+                    'shape',
+                    [0, 0, layer_config['width'], layer_config['height']])
+                for post_y in xrange(max(y, 0), min(y + height,
+                                                    layer_config['height'])):
+                    for post_x in xrange(max(x, 0),
+                                         min(x + width,
+                                             layer_config['width'])):
+                        owner[(layer['name'], post_x, post_y)] \
+                                = (domain_index, layer_index)
+        for pre_layer_index, layer_config in enumerate(self.layers_config):
+            layer = layer_config['layer']
+            for connect in layer_config.get('connect', []):
+                post_layer_config = layer_config_by_name[connect['name']]
+                radius = connect_radius(layer_config, post_layer_config,
+                                        connect)
+                shift = connect['shift']
+                for pre_y in xrange(layer.y, layer.y + layer.height):
+                    for pre_x in xrange(layer.x, layer.x + layer.width):
+                        pre_neuron_address = layer.neurons_metadata.level \
+                                .to_address(pre_x - layer.x, pre_y - layer.y)
+                        central_post_x = int(math.floor(
+                            1.0 * pre_x / layer_config['width']
+                            * post_layer_config['width']
+                            + (post_layer_config['width']
+                               / layer_config['width'] / 2.0)
+                        )) + (shift[0]() if callable(shift[0]) else shift[0])
+                        central_post_y = int(math.floor(
+                            1.0 * pre_y / layer_config['height']
+                            * post_layer_config['height']
+                            + (post_layer_config['height']
+                               / layer_config['height'] / 2.0)
+                        )) + (shift[1]() if callable(shift[1]) else shift[1])
+                        for post_y in xrange(
+                            max(central_post_y - (radius - 1), 0),
+                            min(central_post_y + radius,
+                                post_layer_config['height'])
+                        ):
+                            for post_x in xrange(
+                                max(central_post_x - (radius - 1), 0),
+                                min(central_post_x + radius,
+                                    post_layer_config['width'])
+                            ):
+                                inf = owner.get(
+                                    (connect['name'], post_x, post_y))
+                                if inf is None:
+                                    continue
+                                post_domain_index, post_layer_index = inf
+                                if post_domain_index == pre_domain_index:
+                                    post_layer = self.layers[post_layer_index]
+                                    self.synapse_address += 1
+                                    self.connect_neurons(
+                                        pre_neuron_address,
+                                        post_layer.neurons_metadata.level \
+                                            .to_address(
+                                                post_x - post_layer.x,
+                                                post_y - post_layer.y),
+                                        self.synapse_address
+                                    )
+                                else:
+                                    self.connect_remote_neurons(
+                                        pre_domain_index, pre_layer_index,
+                                        pre_neuron_address, post_domain_index,
+                                        post_layer_index, post_x, post_y)
+                                total_synapses[
+                                    domain_index_to_name[post_domain_index]] \
+                                        += 1
+
+    def layer(name, width, height, connect=None):
+        ret = {'name': name, 'threshold': 20000, 'relaxation': 1000,
+               'width': width, 'height': height}
+        if connect:
+            ret['connect'] = connect
+        return ret
+
+    config = {
+        'layers': [
+            layer('V1', 20, 16, [
+                {'name': 'V2', 'radius': 2, 'shift': [
+                    partial(randshift, 0, 2), partial(randshift, 1, 3)]},
+                {'name': 'V1', 'radius': 2, 'shift': [-1, 1]},
+            ]),
+            layer('V2', 10, 10, [{'name': 'V1', 'shift': [
+                0, partial(randshift, 0, 1)]}]),
+        ],
+        'domains': [
+            {'name': 'D1', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V1', 'shape': [0, 0, 20, 10]},
+                {'name': 'V2', 'shape': [0, 0, 6, 10]}]},
+            {'name': 'D2', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V1', 'shape': [0, 10, 20, 6]}]},
+            {'name': 'D3', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V2', 'shape': [6, 0, 4, 10]}]},
+        ],
+    }
+
+    def deploy():
+        random.seed(1)
+        ore = OpenRE(config)
+        ore.deploy()
+        return [(
+            list(domain.synapses.pre.data[:len(domain.synapses)]),
+            list(domain.synapses.post.data[:len(domain.synapses)]),
+            domain.synapse_count_by_domain,
+            list(domain.neurons.flags.data),
+            list(domain.neurons.level.data),
+            [list(vector.data) for vector in [
+                domain.transmitter_index.local_address,
+                domain.transmitter_index.key,
+                domain.transmitter_index.value,
+                domain.transmitter_index.remote_domain,
+                domain.transmitter_index.remote_address,
+                domain.transmitter_index.remote_receiver_index,
+                domain.receiver_index.local_address,
+                domain.receiver_index.remote_domain,
+                domain.receiver_index.remote_address,
+            ]],
+        ) for domain in ore.domains]
+
+    result = deploy()
+    connect_layers = Domain.connect_layers
+    Domain.connect_layers = connect_layers_by_pairs
+    try:
+        expected = deploy()
+    finally:
+        Domain.connect_layers = connect_layers
+    for domain_result in expected:
+        # synapses in domain and receiver neurons
+        assert len(domain_result[0])
+        assert len(domain_result[5][6])
+    assert result == expected
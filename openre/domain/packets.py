@@ -1,9 +1,25 @@
 # -*- coding: utf-8 -*-
 
+import struct
+import zlib
+import numpy as np
 from openre.metadata import MultiFieldExtendableMetadata
-from openre.vector import MultiFieldVector
+from openre.vector import MultiFieldVector, StandaloneVector
 from openre.data_types import types
 
+# Пакет спайков: заголовок (сигнатура, способ кодирования, признак сжатия
+# zlib, первый адрес, количество спайков) и закодированные адреса
+SPIKES_SIGNATURE = 'ORES'
+SPIKES_HEADER = struct.Struct('<4sBBxxII')
+SPIKES_RAW = 0
+SPIKES_DELTA = 1
+SPIKES_BITMAP = 2
+SPIKES_ENCODINGS = {
+    SPIKES_RAW: 'raw',
+    SPIKES_DELTA: 'delta',
+    SPIKES_BITMAP: 'bitmap',
+}
+
 class TransmitterVector(MultiFieldVector):
     """
     Вектор для IS_TRANSMITTER нейронов.
@@ -57,3 +73,159 @@ class SpikesMetadata(MultiFieldExtendableMetadata):
     """
     fields = list(SpikesVector.fields)
 
+
+def varint_length(values):
+    """
+    Количество байт для каждого значения из values в формате varint
+    (7 бит на байт, старший бит - признак продолжения)
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    length = np.ones(len(values), dtype=np.int64)
+    for bits in [7, 14, 21, 28, 35, 42, 49, 56, 63]:
+        length += values >= (1 << bits)
+    return length
+
+def encode_varint(values):
+    """
+    Массив целых неотрицательных чисел в массив байт varint
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    length = varint_length(values)
+    start = np.cumsum(length) - length
+    ret = np.zeros(length.sum(), dtype=np.uint8)
+    for pos in xrange(int(length.max()) if len(length) else 0):
+        has_byte = length > pos
+        byte = (values[has_byte] >> np.uint64(7 * pos)) & np.uint64(0x7f)
+        byte |= (length[has_byte] > pos + 1).astype(np.uint64) << np.uint64(7)
+        ret[start[has_byte] + pos] = byte
+    return ret
+
+def decode_varint(data):
+    """
+    Массив байт varint в массив чисел np.uint64
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    is_last = data < 0x80
+    # номер числа и позиция байта внутри числа
+    number = np.cumsum(is_last) - is_last
+    first = np.flatnonzero(np.append(True, is_last[:-1]))
+    shift = 7 * (np.arange(len(data)) - first[number])
+    ret = np.zeros(int(is_last.sum()), dtype=np.uint64)
+    np.add.at(ret, number,
+              (data & 0x7f).astype(np.uint64) << shift.astype(np.uint64))
+    return ret
+
+def encode_spikes(receiver_neuron_index, compress=0):
+    """
+    Кодирует адреса спайков (receiver_neuron_index) самым коротким из
+    способов: raw (массив types.address), delta (разности соседних
+    отсортированных адресов в varint) или bitmap (битовая маска от первого
+    до последнего адреса). Порядок адресов и повторы не сохраняются.
+    compress - уровень сжатия zlib (0 - не сжимать), применяется только если
+    уменьшает пакет.
+    Возвращает (bytes, название способа кодирования)
+    """
+    spikes = np.unique(np.asarray(receiver_neuron_index)) \
+            .astype(types.address)
+    count = len(spikes)
+    start = int(spikes[0]) if count else 0
+    encoding = SPIKES_RAW
+    if count > 1:
+        # адреса уникальны, поэтому разность всегда >= 1
+        deltas = np.diff(spikes) - 1
+        delta_size = int(varint_length(deltas).sum())
+        bitmap_size = (int(spikes[-1]) - start) // 8 + 1
+        size = count * spikes.itemsize
+        if delta_size < size:
+            encoding, size = SPIKES_DELTA, delta_size
+        if bitmap_size < size:
+            encoding, size = SPIKES_BITMAP, bitmap_size
+    if encoding == SPIKES_DELTA:
+        payload = encode_varint(deltas).tostring()
+    elif encoding == SPIKES_BITMAP:
+        bits = np.zeros(int(spikes[-1]) - start + 1, dtype=np.uint8)
+        bits[spikes - start] = 1
+        payload = np.packbits(bits).tostring()
+    else:
+        payload = spikes.tostring()
+    is_compressed = 0
+    if compress and payload:
+        compressed = zlib.compress(payload, compress)
+        if len(compressed) < len(payload):
+            payload = compressed
+            is_compressed = 1
+    return SPIKES_HEADER.pack(SPIKES_SIGNATURE, encoding, is_compressed,
+                              start, count) + payload, \
+            SPIKES_ENCODINGS[encoding]
+
+def decode_spikes(value):
+    """
+    Декодирует пакет, созданный encode_spikes (str, buffer или zmq.Frame).
+    Пакеты в формате Vector.bytes() (SpikesVector) тоже поддерживаются.
+    """
+    if hasattr(value, 'buffer'):
+        # zmq.Frame
+        value = value.buffer
+    if isinstance(value, memoryview):
+        # np.frombuffer в python 2 не принимает memoryview
+        value = np.asarray(value)
+    data = np.frombuffer(value, dtype=np.uint8)
+    if len(data) < SPIKES_HEADER.size \
+       or data[:len(SPIKES_SIGNATURE)].tostring() != SPIKES_SIGNATURE:
+        return StandaloneVector().from_bytes(value).data
+    _, encoding, is_compressed, start, count \
+            = SPIKES_HEADER.unpack_from(data)
+    payload = data[SPIKES_HEADER.size:]
+    if is_compressed:
+        payload = np.frombuffer(zlib.decompress(payload.tostring()),
+                                dtype=np.uint8)
+    if encoding == SPIKES_RAW:
+        return payload[:count * np.dtype(types.address).itemsize] \
+                .view(types.address)
+    if not count:
+        return np.zeros(0, dtype=types.address)
+    if encoding == SPIKES_DELTA:
+        spikes = np.zeros(count, dtype=np.uint64)
+        spikes[1:] = np.cumsum(decode_varint(payload) + np.uint64(1))
+    elif encoding == SPIKES_BITMAP:
+        spikes = np.flatnonzero(np.unpackbits(payload))
+    else:
+        raise ValueError('Unknown spikes encoding %s' % encoding)
+    return (spikes + start).astype(types.address)
+
+
+def test_varint():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**32 - 1],
+                      dtype=np.uint64)
+    data = encode_varint(values)
+    assert list(varint_length(values)) == [1, 1, 1, 2, 2, 2, 3, 5]
+    assert len(data) == 17
+    assert list(data[:5]) == [0, 1, 127, 0x80, 1]
+    assert list(decode_varint(data)) == list(values)
+    assert len(encode_varint([])) == 0
+    assert len(decode_varint([])) == 0
+
+def test_spikes_encoding():
+    def check(spikes, expected_encoding, compress=0):
+        bytes, encoding = encode_spikes(
+            np.array(spikes, dtype=types.address), compress)
+        assert encoding == expected_encoding
+        decoded = decode_spikes(bytes)
+        assert decoded.dtype == types.address
+        assert list(decoded) == sorted(set(spikes))
+        return bytes
+    check([], 'raw')
+    check([7], 'raw')
+    check([2**32 - 2, 0], 'delta')
+    check([pos * (2**28 + 1) for pos in xrange(6)], 'raw')
+    check([5, 1, 1000, 70000, 130, 129], 'delta')
+    bitmap = check(range(100, 1000, 2), 'bitmap')
+    assert len(bitmap) == SPIKES_HEADER.size + (998 - 100) // 8 + 1
+    compressed = check(range(100, 1000, 2), 'bitmap', 9)
+    assert len(compressed) < len(bitmap)
+    # old SpikesVector packets
+    vector = StandaloneVector().set_data(
+        np.array([3, 1, 2], dtype=types.address))
+    assert list(decode_spikes(vector.bytes())) == [3, 1, 2]
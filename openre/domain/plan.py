@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Оценка размера сети до ее создания: количество нейронов, синапсов и памяти
+для каждого домена по геометрии слоев, радиусам связей и shape слоев доменов.
+Синапсы не создаются - для каждого pre-нейрона считается пересечение
+прямоугольника post-нейронов (см. post_ranges) с клетками OwnershipIndex
+post-слоя.
+"""
+import numpy as np
+from copy import deepcopy
+from openre.config import Config
+from openre.data_types import types
+from openre.layer import BaseLayer
+from openre.neurons import NeuronsVector
+from openre.synapses import SynapsesVector
+from openre.index import create_ownership_indexes
+from openre.domain.connect import connect_radius, post_ranges
+
+# примерное количество (pre-нейрон, клетка OwnershipIndex) в одном блоке
+PLAN_BLOCK_CELLS = 1024*1024
+
+
+def cell_overlap(start, count, edges):
+    """
+    Длина пересечения отрезков [start, start + count) (массивы) с каждым
+    отрезком [edges[i], edges[i + 1]). Возвращает массив (len(start),
+    len(edges) - 1).
+    """
+    start = start[:, np.newaxis]
+    end = start + count[:, np.newaxis]
+    return np.maximum(
+        np.minimum(end, edges[1:]) - np.maximum(start, edges[:-1]), 0)
+
+
+def vector_itemsize(vector_class):
+    """
+    Количество байт на один элемент MultiFieldVector (сумма по всем полям)
+    """
+    return sum(np.dtype(field_type).itemsize
+               for _, field_type in vector_class.fields)
+
+
+def plan_net(config, domain_name=None):
+    """
+    Планирует сеть с конфигом config. Для каждого домена возвращает:
+        neurons - количество нейронов слоев домена,
+        receiver_neurons - количество IS_RECEIVER нейронов (копии
+                           pre-нейронов из других доменов),
+        synapses - количество синапсов (синапсы хранятся в домене
+                   post-нейрона),
+        exact - False, если сдвиг хотя бы одной связи задан функцией (тогда
+                receiver_neurons и synapses - оценка сверху),
+        bytes - примерный объем памяти под нейроны, синапсы и индексы
+                синапсов.
+    Если задан domain_name, то синапсы и receiver_neurons считаются только
+    для этого домена (для остальных - 0).
+    Возвращает {'domains': {domain_name: {...}}, 'total': {...}}
+    """
+    if not isinstance(config, Config):
+        config = Config(config)
+    layer_config_by_name = {}
+    for layer_config in config['layers']:
+        layer_config_by_name[layer_config['name']] = layer_config
+    ownership = create_ownership_indexes(config)
+    domain_names = [domain['name'] for domain in config['domains']]
+    if domain_name is None:
+        counted = set(range(len(domain_names)))
+    else:
+        counted = set([domain_names.index(domain_name)])
+    neurons = [0] * len(domain_names)
+    receiver_neurons = [0] * len(domain_names)
+    synapses = [0] * len(domain_names)
+    exact = [True] * len(domain_names)
+    for pre_domain_index, domain in enumerate(config['domains']):
+        for domain_layer in domain.get('layers', []):
+            layer_config = deepcopy(domain_layer)
+            layer_config.update(
+                deepcopy(layer_config_by_name[domain_layer['name']]))
+            layer = BaseLayer(layer_config)
+            neurons[pre_domain_index] += layer.length
+            if not layer.length:
+                continue
+            # post domain index -> pre neurons with synapses in that domain
+            has_synapses = {}
+            for connect in layer_config.get('connect', []):
+                post_layer_config = layer_config_by_name[connect['name']]
+                post_ownership = ownership[post_layer_config['name']]
+                owned_area = post_ownership.owned_area()
+                post_domains = [post_domain_index
+                                for post_domain_index in owned_area
+                                if post_domain_index in counted]
+                if not post_domains:
+                    continue
+                radius = connect_radius(layer_config, post_layer_config,
+                                        connect)
+                shift = connect.get('shift', [0, 0])
+                if callable(shift[0]) or callable(shift[1]):
+                    # any post neuron of the domain may be inside the radius
+                    for post_domain_index in post_domains:
+                        synapses[post_domain_index] += layer.length * min(
+                            (2 * radius - 1) ** 2,
+                            owned_area[post_domain_index])
+                        has_synapses[post_domain_index] = np.ones(
+                            layer.length, dtype=bool)
+                        exact[post_domain_index] = False
+                    continue
+                grid = post_ownership.grid[:, :, 0]
+                cells = grid.size
+                rows = max(1, PLAN_BLOCK_CELLS // max(1, layer.width * cells))
+                for block_y in xrange(layer.y, layer.y + layer.height, rows):
+                    block_to = min(block_y + rows, layer.y + layer.height)
+                    pre_y, pre_x = np.mgrid[
+                        block_y:block_to,
+                        layer.x:layer.x + layer.width
+                    ]
+                    from_x, count_x, from_y, count_y = post_ranges(
+                        pre_x.ravel(),
+                        pre_y.ravel(),
+                        shift[0],
+                        shift[1],
+                        layer_config['width'],
+                        layer_config['height'],
+                        post_layer_config['width'],
+                        post_layer_config['height'],
+                        radius
+                    )
+                    overlap_x = cell_overlap(from_x, count_x,
+                                             post_ownership.xs)
+                    overlap_y = cell_overlap(from_y, count_y,
+                                             post_ownership.ys)
+                    offset = (block_y - layer.y) * layer.width
+                    for post_domain_index in post_domains:
+                        # synapses of each pre neuron in the post domain
+                        count = (
+                            overlap_y.dot(grid == post_domain_index)
+                            * overlap_x
+                        ).sum(axis=1)
+                        synapses[post_domain_index] += int(count.sum())
+                        if post_domain_index not in has_synapses:
+                            has_synapses[post_domain_index] = np.zeros(
+                                layer.length, dtype=bool)
+                        has_synapses[post_domain_index][
+                            offset:offset + len(count)] |= count > 0
+            for post_domain_index, value in has_synapses.items():
+                if post_domain_index != pre_domain_index:
+                    receiver_neurons[post_domain_index] += int(value.sum())
+
+    neuron_bytes = vector_itemsize(NeuronsVector)
+    synapse_bytes = vector_itemsize(SynapsesVector)
+    # pre and post synapses indexes: key for each neuron, value for each
+    # synapse
+    index_bytes = 2 * np.dtype(types.address).itemsize
+    ret = {'domains': {}}
+    total = {
+        'neurons': 0,
+        'receiver_neurons': 0,
+        'synapses': 0,
+        'exact': True,
+        'bytes': 0,
+    }
+    for domain_index, name in enumerate(domain_names):
+        domain_neurons = neurons[domain_index] + receiver_neurons[domain_index]
+        domain_plan = {
+            'neurons': neurons[domain_index],
+            'receiver_neurons': receiver_neurons[domain_index],
+            'synapses': synapses[domain_index],
+            'exact': exact[domain_index],
+            'bytes': int(domain_neurons * (neuron_bytes + index_bytes)
+                         + synapses[domain_index]
+                         * (synapse_bytes + index_bytes)),
+        }
+        ret['domains'][name] = domain_plan
+        for key in ['neurons', 'receiver_neurons', 'synapses', 'bytes']:
+            total[key] += domain_plan[key]
+        total['exact'] = total['exact'] and domain_plan['exact']
+    ret['total'] = total
+    return ret
+
+
+def test_plan_net():
+    from openre import OpenRE
+    from openre.helpers import randshift
+    from functools import partial
+
+    def layer(name, width, height, connect=None):
+        ret = {'name': name, 'threshold': 20000, 'relaxation': 1000,
+               'width': width, 'height': height}
+        if connect:
+            ret['connect'] = connect
+        return ret
+
+    config = {
+        'layers': [
+            layer('V1', 40, 30, [{'name': 'V2', 'radius': 2, 'shift': [0, 0]},
+                                 {'name': 'V1', 'radius': 3,
+                                  'shift': [-1, 2]}]),
+            layer('V2', 20, 20, [{'name': 'V1'}, {'name': 'V3'}]),
+            layer('V3', 15, 10, [{'name': 'V1', 'radius': 4}]),
+        ],
+        'domains': [
+            {'name': 'D1', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V1', 'shape': [0, 0, 25, 20]}, {'name': 'V2'}]},
+            {'name': 'D2', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V1', 'shape': [25, 0, 15, 20]},
+                {'name': 'V3', 'shape': [5, 0, 20, 10]}]},
+            {'name': 'D3', 'device': {'type': 'Dummy'}, 'layers': [
+                {'name': 'V1', 'shape': [0, 20, 40, 10]}]},
+        ],
+    }
+    plan = plan_net(config)
+    ore = OpenRE(config)
+    ore.deploy()
+    for domain in ore.domains:
+        domain_plan = plan['domains'][domain.name]
+        assert domain_plan['exact']
+        assert domain_plan['synapses'] == len(domain.synapses)
+        assert domain_plan['receiver_neurons'] \
+                == len(domain.remote_neurons_metadata.level)
+        assert domain_plan['neurons'] + domain_plan['receiver_neurons'] \
+                == len(domain.neurons)
+        assert domain_plan['bytes'] > 0
+        # only one domain
+        assert plan_net(config, domain.name)['domains'][domain.name] \
+                == domain_plan
+    assert plan['total']['synapses'] \
+            == sum(len(domain.synapses) for domain in ore.domains)
+    assert plan['total']['exact']
+
+    config['layers'][0]['connect'][1]['shift'] = [
+        partial(randshift, -2, 2), 0]
+    plan = plan_net(config)
+    ore = OpenRE(config)
+    ore.deploy()
+    assert not plan['total']['exact']
+    for domain in ore.domains:
+        domain_plan = plan['domains'][domain.name]
+        assert domain_plan['synapses'] >= len(domain.synapses)
+        assert domain_plan['receiver_neurons'] \
+                >= len(domain.remote_neurons_metadata.level)
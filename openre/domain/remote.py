@@ -75,6 +75,17 @@ class RemoteDomainBase(DomainBase):
     def register_spike(self, receiver_neuron_index):
         pass
 
+    def register_spikes(self, receiver_neuron_index):
+        pass
+
+    def prepare_spike_pack(self):
+        """
+        Вызывается в основном потоке каждый тик перед отправкой спайков в
+        этот домен (register_spike_pack может быть вызван из фонового
+        потока, см. config['pipeline'] локального домена)
+        """
+        pass
+
     def tick(self):
         pass
 
@@ -224,3 +235,135 @@ def test_remote_domain():
 
     dummy = RemoteDomainDummy({'name':'D'}, None, 0)
     assert dummy.deploy_layers() is None
+
+def test_max_lag():
+    from openre import OpenRE
+    from openre.domain import create_domain_factory, Domain
+    from openre.domain.packets import encode_spikes
+    class RemoteDomainTest(RemoteDomainBase):
+        def __getattr__(self, name):
+            def api_call(*args, **kwargs):
+                pass
+            return api_call
+
+    config = {
+        'layers': [
+            {
+                'name': 'V1',
+                'threshold': 30000,
+                'width': 2,
+                'height': 2,
+            },
+            {
+                'name': 'V2',
+                'threshold': 30000,
+                'width': 2,
+                'height': 2,
+            },
+        ],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'max_lag'     : {'D2': 2},
+                'device'    : {'type': 'NumPy'},
+                'layers'    : [
+                    {'name': 'V1'},
+                ],
+            },
+            {
+                'name'        : 'D2',
+                'layers'    : [
+                    {'name': 'V2'},
+                ],
+            },
+        ],
+    }
+    ore = OpenRE(config)
+    ore.deploy(create_domain_factory(Domain, RemoteDomainTest, ['D1']))
+    local = ore.domains[0]
+    # D1 receives spikes from D2
+    local.receiver_index.add(0, 1, 3)
+    local.receiver_index.shrink()
+    local.receiver_index.to_device(local.device)
+    assert local.lag_sources() == {1: 2}
+    assert local.max_lag('D3') is None
+    ore.tick()
+    ore.tick()
+    assert local.ticks == 2
+    # D2 did not send any tick yet
+    assert local.is_lagging()
+    ore.tick()
+    assert local.ticks == 2
+    assert local.stat('lag_waits') == 1
+    local.register_spike_pack(encode_spikes([0])[0], '1', '1')
+    assert local.input_ticks == {1: 1}
+    assert local.stat(['input_lag', 'D2']) == 2
+    assert local.stat('late_spikes') == 1
+    assert not local.is_lagging()
+    ore.tick()
+    assert local.ticks == 3
+    assert local.is_lagging()
+    # heartbeat without spikes
+    local.register_spike_pack(encode_spikes([])[0], '1', '3')
+    assert local.stat('late_spikes') == 1
+    assert local.stat(['input_lag', 'D2']) == 1
+    ore.tick()
+    assert local.ticks == 4
+
+def test_max_lag_local_domains():
+    from openre import OpenRE
+    from openre.domain import create_domain_factory, Domain
+    class RemoteDomainTest(RemoteDomainBase):
+        def __getattr__(self, name):
+            def api_call(*args, **kwargs):
+                pass
+            return api_call
+
+    def layer(name):
+        return {'name': name, 'threshold': 30000, 'width': 2, 'height': 2}
+
+    config = {
+        'layers': [layer('V1'), layer('V2'), layer('V3')],
+        'domains': [
+            {
+                'name'        : 'D1',
+                'max_lag'     : {'D3': 2},
+                'device'    : {'type': 'NumPy'},
+                'layers'    : [{'name': 'V1'}],
+            },
+            {
+                'name'        : 'D2',
+                'device'    : {'type': 'NumPy'},
+                'layers'    : [{'name': 'V2'}],
+            },
+            {
+                'name'        : 'D3',
+                'layers'    : [{'name': 'V3'}],
+            },
+        ],
+    }
+    ore = OpenRE(config)
+    ore.deploy(create_domain_factory(Domain, RemoteDomainTest, ['D1', 'D2']))
+    d1, d2 = ore.domains[:2]
+    # D1 receives spikes from remote D3
+    d1.receiver_index.add(0, 2, 3)
+    d1.receiver_index.shrink()
+    d1.receiver_index.to_device(d1.device)
+    assert d1.lag_sources() == {2: 2}
+    assert not d2.lag_sources()
+    for _ in xrange(4):
+        ore.tick()
+    # D1 waits for D3, D2 waits for D1
+    assert d1.ticks == d2.ticks == 2
+    assert d1.stat('lag_waits') == 2
+    assert ore.run_ticks(2) == 0
+    assert d1.ticks == d2.ticks == 2
+    d1.register_input_tick(2, 1)
+    # one tick, then waits for D3 again
+    assert ore.run_ticks(2) == 1
+    assert d1.ticks == d2.ticks == 3
+    # without rate limit
+    del ore.config['rate_limit']
+    d1.register_input_tick(2, 2)
+    assert ore.run_ticks(2) == 1
+    assert d1.ticks == d2.ticks == 4
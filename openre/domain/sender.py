@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновая отправка спайков (config['pipeline'] домена).
+"""
+import sys
+import threading
+import Queue
+
+
+class Sender(object):
+    """
+    Выполняет задачи (функции без аргументов) по одной в фоновом потоке.
+    В очереди не больше одной задачи - send() ждет, пока поток не возьмет
+    предыдущую. Исключение из задачи пробрасывается в следующем send() или
+    wait(). Задачи после исключения и до его проброса пропускаются - для
+    них (и для задачи, не поставленной в очередь из-за исключения)
+    вызывается release, если он задан.
+    """
+    def __init__(self, name=None):
+        self.queue = Queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                task, release = task
+                if self.error is None:
+                    task()
+                elif release is not None:
+                    release()
+            except Exception:
+                self.error = sys.exc_info()
+            finally:
+                self.queue.task_done()
+
+    def _raise(self):
+        if self.error is None:
+            return
+        error = self.error
+        self.error = None
+        raise error[0], error[1], error[2]
+
+    def send(self, task, release=None):
+        """
+        Ставит задачу в очередь. release - функция без аргументов, которая
+        вызывается вместо task, если задача не будет выполнена.
+        """
+        try:
+            self._raise()
+        except Exception:
+            if release is not None:
+                release()
+            raise
+        self.queue.put((task, release))
+
+    def wait(self):
+        """
+        Ждем выполнения всех задач
+        """
+        self.queue.join()
+        self._raise()
+
+    def stop(self):
+        """
+        Выполняем оставшиеся задачи и завершаем поток
+        """
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+
+def test_sender():
+    from pytest import raises
+    import time
+    ret = []
+    sender = Sender()
+    def task(value):
+        def run():
+            time.sleep(0.01)
+            ret.append(value)
+        return run
+    for value in range(5):
+        sender.send(task(value))
+    sender.wait()
+    assert ret == range(5)
+
+    def error():
+        raise ValueError('test')
+    sender.send(error)
+    with raises(ValueError):
+        # error is raised in send() if the thread is already done with it
+        sender.send(task(5))
+        sender.wait()
+    # task after the error is skipped
+    assert ret == range(5)
+    # skipped and not queued tasks are released
+    released = []
+    is_running = threading.Event()
+    def blocked_error():
+        is_running.wait()
+        raise ValueError('test')
+    sender.send(blocked_error)
+    # queued before the error, skipped after it
+    sender.send(task(7), release=lambda: released.append(7))
+    is_running.set()
+    with raises(ValueError):
+        sender.wait()
+    sender.send(error)
+    sender.queue.join()
+    with raises(ValueError):
+        # not queued
+        sender.send(task(8), release=lambda: released.append(8))
+    assert ret == range(5)
+    assert released == [7, 8]
+    sender.send(task(6))
+    sender.stop()
+    assert ret == range(5) + [6]
+    assert not sender.thread.is_alive()
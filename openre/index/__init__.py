@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from openre.index.synapses import SynapsesIndex
+from openre.index.synapses import SynapsesIndex, SynapsesCSRIndex
 from openre.index.transmitter import TransmitterIndex
 from openre.index.receiver import ReceiverIndex
 from openre.index.output import OutputIndex
+from openre.index.ownership import OwnershipIndex, \
+        create_ownership_indexes
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Вспомогательные функции для индексов в формате CSR (compressed sparse row):
+значения сгруппированы по ключу, offset[key]..offset[key + 1] - диапазон
+значений для ключа key.
+"""
+import numpy as np
+from openre.data_types import types
+
+
+def csr_offset(length, keys):
+    """
+    Возвращает offset длиной length + 1 для массива ключей keys
+    """
+    counts = np.bincount(np.asarray(keys, dtype=np.int64), minlength=length)
+    if len(counts) > length:
+        raise IndexError
+    offset = np.zeros((length + 1), dtype=types.address)
+    np.cumsum(counts, out=offset[1:])
+    return offset
+
+def csr_order(keys):
+    """
+    Позиции значений, отсортированные по ключу. Сортировка устойчивая -
+    внутри одного ключа сохраняется исходный порядок.
+    """
+    return np.argsort(np.asarray(keys), kind='mergesort') \
+            .astype(types.address)
+
+def csr_expand(offset, keys):
+    """
+    Все позиции в диапазонах offset[key]..offset[key + 1] для каждого key из
+    keys (подряд, в порядке keys)
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    start = offset[keys].astype(np.int64)
+    count = offset[keys + 1].astype(np.int64) - start
+    total = count.sum()
+    if not total:
+        return np.zeros((0), dtype=np.int64)
+    # start of each range minus its position in the result
+    shift = start - (np.cumsum(count) - count)
+    return np.repeat(shift, count) + np.arange(total, dtype=np.int64)
+
+
+def test_csr():
+    keys = [0, 0, 2, 2, 5, 5, 3, 0, 4, 4, 4, 4, 1]
+    offset = csr_offset(10, keys)
+    assert list(offset) == [0, 3, 4, 6, 7, 11, 13, 13, 13, 13, 13]
+    order = csr_order(keys)
+    assert list(order) == [0, 1, 7, 12, 2, 3, 6, 8, 9, 10, 11, 4, 5]
+    assert list(csr_expand(offset, [4, 0, 9, 1])) \
+            == [7, 8, 9, 10, 0, 1, 2, 3]
+    assert list(order[csr_expand(offset, [0])]) == [0, 1, 7]
+    assert list(csr_expand(offset, [])) == []
+    assert list(csr_expand(offset, [6, 7])) == []
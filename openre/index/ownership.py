@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс принадлежности нейронов слоя сети доменам
+"""
+import numpy as np
+
+# индекс домена для нейронов, которые не моделируются ни одним доменом
+NOT_OWNED = np.iinfo(np.int).max
+
+class OwnershipIndex(object):
+    """
+    Для нейрона (x, y) слоя сети шириной width и высотой height находит
+    индекс домена и индекс слоя в домене. Хранит только прямоугольники
+    (shape) слоев доменов: rects[i] = (x, y, width, height, domain_index,
+    layer_index). Если прямоугольники пересекаются, то нейрон принадлежит
+    прямоугольнику, добавленному последним.
+    Для поиска границы прямоугольников делят слой на сетку (xs, ys), в каждой
+    клетке которой владелец один - grid[iy, ix] = (domain_index, layer_index).
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.rects = []
+        self.xs = None
+        self.ys = None
+        self.grid = None
+
+    def add(self, x, y, width, height, domain_index, layer_index):
+        """
+        Добавляет прямоугольник слоя домена (обрезается по границам слоя)
+        """
+        from_x = max(x, 0)
+        from_y = max(y, 0)
+        to_x = min(x + width, self.width)
+        to_y = min(y + height, self.height)
+        if from_x >= to_x or from_y >= to_y:
+            return
+        self.rects.append((from_x, from_y, to_x, to_y,
+                           domain_index, layer_index))
+        self.grid = None
+
+    def build(self):
+        """
+        Строит сетку по границам прямоугольников. Вызывается автоматически из
+        find.
+        """
+        self.xs = np.unique([0, self.width] + [
+            value for rect in self.rects for value in rect[0:3:2]])
+        self.ys = np.unique([0, self.height] + [
+            value for rect in self.rects for value in rect[1:4:2]])
+        self.grid = np.zeros(
+            (len(self.ys) - 1, len(self.xs) - 1, 2), dtype=np.int)
+        self.grid.fill(NOT_OWNED)
+        for from_x, from_y, to_x, to_y, domain_index, layer_index \
+                in self.rects:
+            self.grid[
+                np.searchsorted(self.ys, from_y):
+                    np.searchsorted(self.ys, to_y),
+                np.searchsorted(self.xs, from_x):
+                    np.searchsorted(self.xs, to_x)
+            ] = (domain_index, layer_index)
+
+    def find(self, x, y):
+        """
+        Для массивов координат x, y внутри слоя возвращает массив
+        (..., 2): индекс домена (NOT_OWNED, если нейрон не принадлежит ни
+        одному домену) и индекс слоя в домене.
+        """
+        if self.grid is None:
+            self.build()
+        return self.grid[
+            np.searchsorted(self.ys, y, side='right') - 1,
+            np.searchsorted(self.xs, x, side='right') - 1
+        ]
+
+    def owned_area(self):
+        """
+        Количество нейронов слоя у каждого домена: {domain_index: area}
+        """
+        if self.grid is None:
+            self.build()
+        area = np.outer(np.diff(self.ys), np.diff(self.xs))
+        ret = {}
+        for domain_index in np.unique(self.grid[:, :, 0]):
+            if domain_index == NOT_OWNED:
+                continue
+            ret[int(domain_index)] = int(
+                area[self.grid[:, :, 0] == domain_index].sum())
+        return ret
+
+
+def create_ownership_indexes(config):
+    """
+    OwnershipIndex для каждого слоя сети с конфигом config:
+    {layer_name: OwnershipIndex}
+    """
+    ret = {}
+    layer_config_by_name = {}
+    for layer_config in config['layers']:
+        layer_config_by_name[layer_config['name']] = layer_config
+        ret[layer_config['name']] = OwnershipIndex(
+            layer_config['width'], layer_config['height'])
+    for domain_index, domain in enumerate(config['domains']):
+        for layer_index, layer in enumerate(domain.get('layers', [])):
+            layer_config = layer_config_by_name[layer['name']]
+            shape = list(layer.get(
+                'shape',
+                [0, 0, layer_config['width'], layer_config['height']]
+            ))
+            if shape[0] < 0:
+                shape[0] = 0
+            if shape[1] < 0:
+                shape[1] = 0
+            if shape[0] + shape[2] > layer_config['width']:
+                shape[2] = layer_config['width'] - shape[0]
+            if shape[1] + shape[3] > layer_config['height']:
+                shape[3] = layer_config['height'] - shape[1]
+            ret[layer_config['name']].add(
+                shape[0], shape[1], shape[2], shape[3],
+                domain_index, layer_index)
+    return ret
+
+
+def test_ownership_index():
+    index = OwnershipIndex(20, 10)
+    index.add(0, 0, 10, 10, 0, 0)
+    index.add(10, 0, 10, 5, 0, 1)
+    # clipped by the layer
+    index.add(15, 5, 10, 10, 1, 0)
+    # empty
+    index.add(20, 0, 5, 5, 2, 0)
+    assert len(index.rects) == 3
+    # overlapping rect wins
+    index.add(8, 8, 4, 1, 1, 1)
+    dense = np.zeros((10, 20, 2), dtype=np.int)
+    dense.fill(NOT_OWNED)
+    for from_x, from_y, to_x, to_y, domain_index, layer_index \
+            in index.rects:
+        dense[from_y:to_y, from_x:to_x] = (domain_index, layer_index)
+    y, x = np.mgrid[0:10, 0:20]
+    assert np.array_equal(index.find(x, y), dense)
+    assert index.owned_area() == {
+        0: (dense[:, :, 0] == 0).sum(), 1: (dense[:, :, 0] == 1).sum()}
+    assert list(index.find(np.array([0, 19, 11, 9]),
+                           np.array([0, 9, 7, 8])).ravel()) \
+            == [0, 0, 1, 0, NOT_OWNED, NOT_OWNED, 1, 1]
+    # no rects
+    index = OwnershipIndex(3, 2)
+    assert (index.find(np.array([0, 2]), np.array([1, 1]))[:, 0] \
+            == NOT_OWNED).all()
@@ -2,6 +2,8 @@
 """
 Индекс всех receiver нейронов в домене
 """
+import threading
+import numpy as np
 from openre.vector import Vector
 from openre.metadata import ExtendableMetadata
 from openre.data_types import types
@@ -17,6 +19,7 @@ class ReceiverIndex(object):
         из IS_TRANSMITTER нейрона в другом домене)
     remote_domain[i] - домен IS_TRANSMITTER нейрона
     remote_address[i] - адрес IS_TRANSMITTER нейрона в удаленнном домене
+    spikes - список пришедших с последнего тика номеров i (см. pop_spikes)
     """
     def __init__(self, data=None):
         self.local_address = Vector()
@@ -35,6 +38,9 @@ class ReceiverIndex(object):
         self.data = {}
         self.address_to_index = {}
         self.pos = -1
+        self.spikes = []
+        # spikes can be registered from the background sender thread
+        self.spikes_lock = threading.Lock()
         if data:
             self.rebuild(data)
 
@@ -66,6 +72,7 @@ class ReceiverIndex(object):
     def clear(self):
         self.data = {}
         self.pos = -1
+        self.spikes = []
         self.address_to_index = {}
         for meta in [self.meta_local_address, self.meta_is_spiked,
                      self.meta_remote_domain,
@@ -89,6 +96,27 @@ class ReceiverIndex(object):
                        self.remote_domain, self.remote_address]:
             vector.shrink()
 
+    def register_spikes(self, receiver_neuron_index):
+        """
+        Запоминает пришедшие спайки (номер или массив номеров i)
+        """
+        with self.spikes_lock:
+            self.is_spiked.data[receiver_neuron_index] = 1
+            self.spikes.append(receiver_neuron_index)
+
+    def pop_spikes(self):
+        """
+        Возвращает отсортированный массив уникальных номеров i, пришедших с
+        прошлого вызова, и очищает список и is_spiked.
+        """
+        with self.spikes_lock:
+            if not self.spikes:
+                return np.zeros(0, dtype=types.address)
+            spikes = np.unique(np.hstack(self.spikes)).astype(types.address)
+            self.spikes = []
+            self.is_spiked.data[spikes] = 0
+        return spikes
+
     def get_local_address(self, remote_domain_index, remote_address):
         """
         Получаем локальный адрес IS_RECEIVER нейрона по адресу IS_TRANSMITTER
@@ -167,3 +195,9 @@ def test_index():
     index2.rebuild(data)
     assert index2.pos == 3
     assert len(index2.local_address.data) == 4
+    index.register_spikes(3)
+    index.register_spikes(np.array([1, 3], dtype=types.address))
+    assert list(index.is_spiked.data) == [0, 1, 0, 1, 0]
+    assert list(index.pop_spikes()) == [1, 3]
+    assert list(index.is_spiked.data) == [0, 0, 0, 0, 0]
+    assert list(index.pop_spikes()) == []
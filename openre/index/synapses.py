@@ -2,9 +2,11 @@
 """
 Индексы для быстрого поиска, например, всех синапсов нейрона.
 """
+import numpy as np
 from openre.vector import Vector
 from openre.metadata import Metadata
 from openre.data_types import types, null
+from openre.index.csr import csr_offset, csr_order
 
 class SynapsesIndex(object):
     """
@@ -17,6 +19,8 @@ class SynapsesIndex(object):
     Если next_j == data_types.null, то value[j] - последний элемент в цепочке.
     """
     def __init__(self, length, data):
+        if isinstance(data, Vector):
+            data = data.data
         self.key = Vector()
         self.value = Vector()
         meta_key = Metadata((length, 1), types.address)
@@ -25,10 +29,20 @@ class SynapsesIndex(object):
         self.key.fill(null)
         self.value.add(meta_value)
         self.value.fill(null)
-        for value_address, key_address in enumerate(data):
-            prev_value_address = self.key.data[key_address]
-            self.key.data[key_address] = value_address
-            self.value.data[value_address] = prev_value_address
+        if not len(data):
+            return
+        # Строим цепочки сразу для всех ключей: после устойчивой сортировки
+        # синапсы одного нейрона идут подряд в исходном порядке, каждый
+        # ссылается на предыдущий, а key указывает на последний.
+        data = np.asarray(data)
+        if data.max() >= length:
+            raise IndexError
+        order = csr_order(data)
+        sorted_data = data[order]
+        same = sorted_data[1:] == sorted_data[:-1]
+        self.value.data[order[1:][same]] = order[:-1][same]
+        last = np.append(~same, True)
+        self.key.data[sorted_data[last]] = order[last]
 
     def __getitem__(self, key):
         value_address = self.key[key]
@@ -62,6 +76,56 @@ class SynapsesIndex(object):
         self.key.from_device(device)
         self.value.from_device(device)
 
+class SynapsesCSRIndex(object):
+    """
+    Индекс синапсов в формате CSR (compressed sparse row). Синапсы нейрона i
+    лежат подряд: self.value[self.offset[i]:self.offset[i + 1]], поэтому
+    обход - это непрерывный диапазон, а не цепочка зависимых чтений.
+    self.offset - вектор смещений длиной length + 1
+    self.value - адреса синапсов, отсортированные по нейрону (устойчиво)
+    """
+    def __init__(self, length, data):
+        if isinstance(data, Vector):
+            data = data.data
+        self.offset = Vector()
+        self.value = Vector()
+        meta_offset = Metadata((length + 1, 1), types.address)
+        meta_value = Metadata((len(data), 1), types.address)
+        self.offset.add(meta_offset)
+        self.value.add(meta_value)
+        if len(data):
+            self.offset.data[:] = csr_offset(length, data)
+            self.value.data[:] = csr_order(data)
+
+    def __len__(self):
+        return len(self.offset) - 1
+
+    def __getitem__(self, key):
+        if key < 0 or key >= len(self):
+            raise IndexError
+        return list(self.value.data[self.offset[key]:self.offset[key + 1]])
+
+    def create_device_data_pointer(self, device):
+        """
+        Создание указателей на данные на устройстве
+        """
+        self.offset.create_device_data_pointer(device)
+        self.value.create_device_data_pointer(device)
+
+    def to_device(self, device):
+        """
+        Загрузка на устройство
+        """
+        self.offset.to_device(device)
+        self.value.to_device(device)
+
+    def from_device(self, device):
+        """
+        Выгрузка с устройства
+        """
+        self.offset.from_device(device)
+        self.value.from_device(device)
+
 
 def test_index():
     from pytest import raises
@@ -81,4 +145,33 @@ def test_index():
     assert index[9] == []
     with raises(IndexError):
         index[10]
+    with raises(IndexError):
+        SynapsesIndex(5, data)
+    assert len(SynapsesIndex(5, []).value) == 0
+    # same chains as sequential construction
+    data = np.random.randint(0, 100, 1000).astype(types.address)
+    index = SynapsesIndex(100, data)
+    key = [null] * 100
+    value = [null] * len(data)
+    for value_address, key_address in enumerate(data):
+        value[value_address] = key[key_address]
+        key[key_address] = value_address
+    assert list(index.key.data) == key
+    assert list(index.value.data) == value
+
 
+def test_csr_index():
+    from pytest import raises
+    data = [0, 0, 2, 2, 5, 5, 3, 0, 4, 4, 4, 4, 1]
+    index = SynapsesCSRIndex(10, data)
+    chain_index = SynapsesIndex(10, data)
+    assert len(index) == 10
+    assert len(index.offset) == 11
+    assert len(index.value) == len(data)
+    for key in xrange(10):
+        assert index[key] == sorted(chain_index[key])
+    assert index[0] == [0, 1, 7]
+    assert index[9] == []
+    with raises(IndexError):
+        index[10]
+    assert len(SynapsesCSRIndex(5, []).value) == 0
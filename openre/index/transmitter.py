@@ -2,9 +2,11 @@
 """
 Индекс всех transmitter нейронов в домене и их адресов в других доменах
 """
+import numpy as np
 from openre.vector import Vector
 from openre.metadata import ExtendableMetadata
 from openre.data_types import types, null
+from openre.index.csr import csr_offset, csr_order, csr_expand
 
 class TransmitterIndex(object):
     """
@@ -21,6 +23,8 @@ class TransmitterIndex(object):
     remote_address[j] - адрес IS_RECEIVER нейрона в удаленнном домене
     remote_receiver_index[j] - адрес IS_RECEIVER нейрона в
         post_domain.receive_index
+    self.fan_out() - те же связи в формате CSR, сгруппированные по доменам
+        назначения (строится по требованию)
     """
     def __init__(self, data=None):
         self.local_address = Vector()
@@ -52,6 +56,7 @@ class TransmitterIndex(object):
         self.address_to_key_index = {}
         self.key_pos = -1
         self.value_pos = -1
+        self._fan_out = None
         if data:
             self.rebuild(data)
 
@@ -84,10 +89,12 @@ class TransmitterIndex(object):
 
         self.data[local_address][remote_domain_index] = (remote_address,
                                                         remote_receiver_index)
+        self._fan_out = None
         return True
 
     def clear(self):
         self.data = {}
+        self._fan_out = None
         self.key_pos = -1
         self.value_pos = -1
         self.address_to_key_index = {}
@@ -112,6 +119,55 @@ class TransmitterIndex(object):
                          domain_index, remote_address, remote_receiver_index)
         self.shrink()
 
+    def fan_out(self):
+        """
+        Возвращает {remote_domain: (offset, receiver_index)}, где
+        receiver_index[offset[i]:offset[i + 1]] - адреса в
+        post_domain.receive_index для i-го transmitter нейрона.
+        """
+        if self._fan_out is not None:
+            return self._fan_out
+        self._fan_out = {}
+        length = self.key_pos + 1
+        value_length = self.value_pos + 1
+        # номер transmitter нейрона для каждого value[j] - идем по всем
+        # цепочкам одновременно, шагов столько, сколько у нейрона доменов
+        key_index = np.zeros(value_length, dtype=types.address)
+        current = np.arange(length, dtype=types.address)
+        value_address = self.key.data[:length]
+        while True:
+            is_next = value_address != null
+            if not is_next.any():
+                break
+            current = current[is_next]
+            value_address = value_address[is_next]
+            key_index[value_address] = current
+            value_address = self.value.data[value_address]
+        remote_domain = self.remote_domain.data[:value_length]
+        for domain_index in np.unique(remote_domain):
+            position = np.flatnonzero(remote_domain == domain_index)
+            keys = key_index[position]
+            self._fan_out[int(domain_index)] = (
+                csr_offset(length, keys),
+                self.remote_receiver_index.data[position[csr_order(keys)]]
+            )
+        return self._fan_out
+
+    def spikes_by_domain(self, spiked):
+        """
+        Для номеров спайкнувших transmitter нейронов spiked возвращает
+        список пар (remote_domain, массив адресов в receive_index)
+        """
+        ret = []
+        if not len(spiked):
+            return ret
+        for domain_index, (offset, receiver_index) \
+                in sorted(self.fan_out().items()):
+            position = csr_expand(offset, spiked)
+            if len(position):
+                ret.append((domain_index, receiver_index[position]))
+        return ret
+
     def shrink(self):
         for vector in [self.local_address, self.is_spiked,
                        self.key, self.value, self.remote_domain,
@@ -201,3 +257,26 @@ def test_index():
     assert len(index2.value.data) == 4
     assert len(index2.meta_key) == 2
     assert len(index2.meta_value) == 4
+
+def test_fan_out():
+    from openre.helpers import OrderedDict
+    data = OrderedDict([
+        (218, OrderedDict([(1, (10, 41)), (12, (20, 42))])),
+        (300, OrderedDict([(1, (12, 43))])),
+        (77, OrderedDict([(5, (12, 44)), (1, (13, 45))])),
+    ])
+    index = TransmitterIndex(data)
+    assert sorted(index.fan_out().keys()) == [1, 5, 12]
+    offset, receiver_index = index.fan_out()[1]
+    assert list(offset) == [0, 1, 2, 3]
+    assert list(receiver_index) == [41, 43, 45]
+    spikes = index.spikes_by_domain(np.array([0, 2]))
+    assert [domain_index for domain_index, _ in spikes] == [1, 5, 12]
+    assert [list(receiver) for _, receiver in spikes] \
+            == [[41, 45], [44], [42]]
+    assert [domain_index for domain_index, _ in
+            index.spikes_by_domain(np.array([1]))] == [1]
+    assert index.spikes_by_domain(np.array([], dtype=types.address)) == []
+    index.add(300, 5, 17, 46)
+    index.shrink()
+    assert list(index.fan_out()[5][1]) == [46, 44]
@@ -3,7 +3,7 @@
 Содержит в себе 2d массив однотипных нейронов.
 """
 import logging
-from openre.neurons import NeuronsMetadata, create_neuron
+from openre.neurons import NeuronsMetadata, create_neurons
 from copy import deepcopy
 from openre.metadata import MultiFieldMetadata
 from openre.vector import MultiFieldVector
@@ -79,7 +79,7 @@ class BaseLayer(object):
     def __len__(self):
         return self.length
 
-    def create_neurons(self):
+    def create_neurons(self, random_state=None):
         """
         Создание слоя нейронов в ранее выделенном для этого векторе
         """
@@ -104,13 +104,14 @@ class Layer(BaseLayer):
         # metadata for current layer neurons
         self.neurons_metadata = NeuronsMetadata((self.width, self.height))
 
-    def create_neurons(self):
+    def create_neurons(self, random_state=None):
         """
-        Создание слоя нейронов в ранее выделенном для этого векторе
+        Создание слоя нейронов в ранее выделенном для этого векторе.
+        random_state - np.random.RandomState для начального уровня нейронов
+        (см. openre.neurons.create_neurons).
         """
-        for i in xrange(self.length):
-            create_neuron(i, self.neurons_metadata, self,
-                          self.layer_metadata.address)
+        create_neurons(self.neurons_metadata, self,
+                       self.layer_metadata.address, random_state)
 
     def register_input_data(self, data, domain_ticks):
         """
@@ -126,7 +127,7 @@ class RemoteLayer(BaseLayer):
     """
     Удаленный нейрон. Хранит только конфиг.
     """
-    def create_neurons(self):
+    def create_neurons(self, random_state=None):
         pass
 
 class LayersVector(MultiFieldVector):
@@ -189,3 +190,26 @@ def test_layer():
     assert layer.height == 20
     assert layer.length == 400
 
+
+    # create neurons
+    from openre.neurons import NeuronsVector, IS_INHIBITORY
+    import numpy as np
+    config['is_inhibitory'] = True
+    neurons = NeuronsVector()
+    layers_vector = LayersVector()
+    layers = []
+    for _ in range(2):
+        layers.append(Layer(config))
+        neurons.add(layers[-1].neurons_metadata)
+        layers_vector.add(layers[-1].layer_metadata)
+    for layer in layers:
+        layer.create_neurons(np.random.RandomState(1))
+    data = neurons.level.data
+    assert len(data) == 800
+    assert list(data[:400]) == list(data[400:])
+    assert data.min() >= 0 and data.max() <= config['threshold']
+    assert len(set(data)) > 100
+    assert (neurons.flags.data == IS_INHIBITORY).all()
+    assert list(neurons.layer.data[::400]) == [0, 1]
+    assert (neurons.vitality.data == config['max_vitality']).all()
+    assert (neurons.threshold.data == config['threshold']).all()
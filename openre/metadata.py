@@ -34,6 +34,13 @@ class Metadata(object):
         self.address = address
         self.vector = vector
 
+    @property
+    def data(self):
+        """
+        Элементы метаданных в векторе (срез vector.data без копирования)
+        """
+        return self.vector.data[self.address:self.address + self.length]
+
     def to_address(self, point_x, point_y):
         """
         Преобразует координату в метаданных в адрес в векторе
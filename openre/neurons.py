@@ -7,6 +7,7 @@ from openre.metadata import MultiFieldMetadata, MultiFieldExtendableMetadata
 from openre.vector import MultiFieldVector
 from openre.data_types import types
 import random
+import numpy as np
 
 IS_INHIBITORY = 1<<0
 IS_SPIKED = 1<<1
@@ -25,6 +26,26 @@ def create_neuron(address, neurons_metadata, layer, layer_index):
     neurons_metadata.vitality[address] = layer.max_vitality
     neurons_metadata.threshold[address] = layer.threshold
 
+def create_neurons(neurons_metadata, layer, layer_index, random_state=None):
+    """
+    То же, что create_neuron, но сразу для всех нейронов neurons_metadata
+    (срезами векторов). random_state - np.random.RandomState для начального
+    уровня нейронов, по умолчанию создается с seed из random, поэтому
+    random.seed() по-прежнему задает одну и ту же сеть.
+    """
+    if random_state is None:
+        random_state = np.random.RandomState(random.getrandbits(32))
+    length = neurons_metadata.level.length
+    neurons_metadata.level.data[:] = random_state.randint(
+        0, layer.threshold + 1, length)
+    flags = neurons_metadata.flags.data
+    flags[:] = 0
+    if layer.is_inhibitory:
+        flags |= IS_INHIBITORY
+    neurons_metadata.layer.data[:] = layer_index
+    neurons_metadata.vitality.data[:] = layer.max_vitality
+    neurons_metadata.threshold.data[:] = layer.threshold
+
 
 class NeuronsVector(MultiFieldVector):
     """
@@ -6,6 +6,14 @@ import numpy as np
 from openre.errors import OreError
 from openre.metadata import ExtendableMetadata
 import cPickle
+import struct
+
+# Бинарный формат вектора: заголовок (сигнатура, версия, numpy dtype.str,
+# количество элементов) и сразу за ним данные. Заголовок кратен 8 байтам,
+# поэтому данные можно читать через np.frombuffer без копирования.
+BYTES_SIGNATURE = 'OREV'
+BYTES_VERSION = 1
+BYTES_HEADER = struct.Struct('<4sBxxx8sQ')
 
 
 class Vector(object):
@@ -63,7 +71,7 @@ class Vector(object):
         if self.length == length:
             return
         self.length = length
-        self.data.resize((self.length), refcheck=False)
+        self.resize_data()
 
     def resize(self, portion=None):
         if portion is None:
@@ -72,9 +80,36 @@ class Vector(object):
             if portion > max_portion:
                 portion = max_portion
         self.length += portion
-        self.data.resize((self.length), refcheck=False)
+        self.resize_data()
         return portion
 
+    def resize_data(self):
+        """
+        Изменяет размер self.data до self.length. Если self.data не владеет
+        своей памятью (например, после adopt), то при уменьшении берется срез,
+        а при увеличении данные копируются в новый массив.
+        """
+        if self.data.flags.owndata:
+            self.data.resize((self.length), refcheck=False)
+        elif self.length <= len(self.data):
+            self.data = self.data[:self.length]
+        else:
+            data = np.zeros((self.length), dtype=self.data.dtype)
+            data[:len(self.data)] = self.data
+            self.data = data
+
+    def adopt(self, data):
+        """
+        Использует массив data (например, в разделяемой памяти) как
+        self.data без копирования. Вектор должен содержать одни метаданные,
+        их длина становится равной длине data.
+        """
+        assert len(self.metadata) == 1
+        assert data.dtype == self.data.dtype
+        self.data = data
+        self.length = len(data)
+        self.metadata[0].length = len(data)
+
     def create_device_data_pointer(self, device):
         """
         Создает self.device_data_pointer для устройства device
@@ -130,13 +165,37 @@ class Vector(object):
         """
         Vector to string
         """
-        return cPickle.dumps(self.data)
+        data = np.ravel(self.data)
+        if data.dtype.hasobject:
+            return cPickle.dumps(data)
+        return BYTES_HEADER.pack(BYTES_SIGNATURE, BYTES_VERSION,
+                                 data.dtype.str, len(data)) \
+                + data.tostring()
 
     def from_bytes(self, value):
         """
-        String to vector
-        """
-        self.data = np.ravel(cPickle.loads(value))
+        String (or zmq.Frame, buffer) to vector. Данные в бинарном формате не
+        копируются - self.data ссылается на value и доступен только для
+        чтения. Строки в формате cPickle тоже поддерживаются.
+        """
+        if hasattr(value, 'buffer'):
+            # zmq.Frame
+            value = value.buffer
+        if len(value) >= BYTES_HEADER.size \
+           and value[:len(BYTES_SIGNATURE)] == BYTES_SIGNATURE:
+            _, version, dtype, length = BYTES_HEADER.unpack_from(value)
+            if version != BYTES_VERSION:
+                raise OreError('Unknown vector bytes version %s' % version)
+            if isinstance(value, memoryview):
+                # np.frombuffer в python 2 не принимает memoryview
+                value = np.asarray(value)
+            self.data = np.frombuffer(value, dtype=np.dtype(dtype.rstrip('\0')),
+                                      count=length, offset=BYTES_HEADER.size)
+        else:
+            if isinstance(value, memoryview):
+                # str(memoryview) в python 2 не возвращает данные
+                value = value.tobytes()
+            self.data = np.ravel(cPickle.loads(str(value)))
         self.length = len(self.data)
         self.type = self.data.dtype.type
         return self
@@ -425,6 +484,19 @@ def test_vector():
                                    ]
     assert v2.length == 3*4
 
+    # adopt array, that doesn't own its memory
+    data = np.arange(20, dtype=vector.data.dtype)[5:10]
+    vector.adopt(data)
+    assert vector.data is data
+    assert vector.length == 5
+    assert meta0.length == 5
+    vector.resize(portion=-2)
+    assert [_ for _ in vector.data] == [5, 6, 7]
+    assert vector.data.base is data.base
+    vector.resize(portion=2)
+    assert [_ for _ in vector.data] == [5, 6, 7, 0, 0]
+    assert vector.data.flags.owndata
+
 def test_stanalone_vector():
     data = np.zeros((1000), dtype=np.uint8)
     v1 = StandaloneVector()
@@ -436,6 +508,31 @@ def test_stanalone_vector():
     assert v1.data.dtype.type == np.uint8
     assert v1.type == v2.type
     assert list(v1.data) == list(v2.data)
+    # binary format: header + raw data, no copy on load
+    data = np.arange(10, dtype=np.uint32)
+    bytes_data = StandaloneVector().set_data(data).bytes()
+    assert len(bytes_data) == BYTES_HEADER.size + data.nbytes
+    for value in [bytes_data, buffer(bytes_data), memoryview(bytes_data)]:
+        v2 = StandaloneVector().from_bytes(value)
+        assert v2.type == np.uint32
+        assert len(v2) == 10
+        assert list(v2.data) == list(data)
+    assert len(StandaloneVector().from_bytes(
+        StandaloneVector().set_data(data[:0]).bytes())) == 0
+    # old pickle format
+    v2 = StandaloneVector().from_bytes(cPickle.dumps(data))
+    assert list(v2.data) == list(data)
+    # zmq.Frame (sockets with copy=False), pickle is used for object dtype
+    import zmq
+    object_data = np.array([1, 'a'], dtype=object)
+    for value, expected in [
+        (bytes_data, data),
+        (cPickle.dumps(data), data),
+        (StandaloneVector().set_data(object_data).bytes(), object_data),
+    ]:
+        for wrap in [buffer, memoryview, zmq.Frame]:
+            v2 = StandaloneVector().from_bytes(wrap(value))
+            assert list(v2.data) == list(expected)
     """ Speed test
     import time
     import pickle